@@ -0,0 +1,487 @@
+""" Micro benchmarks for the Bitcoin hashing and parsing helpers of the client.
+Run from within ./client/ e.g.,
+    python benchmark.py                 # run all benchmarks
+    python benchmark.py dSHA256_batch   # run selected benchmarks
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import tracemalloc
+
+import client
+from samples import load_raw_block_sample, calldata_sample_blks, calldata_sample_chain, segwit_sample_blk
+
+HDR_SAMPLES = "../testdata/btc_hex_hdr_samples/500from300k.txt"
+
+def best_of(f,repeat=5):
+    """ return best wall clock time in seconds of repeated calls to f """
+    best = None
+    for i in range(0,repeat):
+        start = time.perf_counter()
+        f()
+        t = time.perf_counter() - start
+        if best is None or t < best:
+            best = t
+    return best
+
+def alloc_per_item(f,n):
+    """ return bytes allocated per item by f, which must return a list of n items """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    items = f()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before,"filename"))
+    assert len(items) == n
+    return size/n
+
+def load_hdr_samples(path=HDR_SAMPLES):
+    """ load hex header samples as list of 80 byte headers """
+    with open(path) as hdr_file:
+        return [ bytes.fromhex(line.strip()) for line in hdr_file ]
+
+def mrkl_root_recursive(hashes):
+    """ previous recursive Merkle root, allocating a list per level, for comparison """
+    if len(hashes) == 1:
+        return client.dbytes_to_hexstr(hashes[0])
+    if len(hashes) % 2 != 0:
+        hashes.append(hashes[-1])
+    nextlevel = list()
+    i = 0
+    while i < len(hashes):
+        nextlevel.append(client.dSHA256(hashes[i] + hashes[i+1],raw=True))
+        i += 2
+    return mrkl_root_recursive(nextlevel)
+
+def vrfy_root_path_mutating(hashMerkleRoot,shash,mpath,flags):
+    """ previous Merkle path verifier, consuming mpath and flags, for comparison """
+    mpath.insert(0,client.hexstr_to_dbytes(shash))
+    flags.reverse()
+    while len(mpath)>1:
+        flag = flags.pop()
+        if flag == 0:
+            calculated_hash = client.dSHA256(mpath[1] + mpath[0],raw=True)
+        else:
+            calculated_hash = client.dSHA256(mpath[0] + mpath[1],raw=True)
+        del mpath[0:2]
+        mpath.insert(0,calculated_hash)
+    return client.dbytes_to_hexstr(mpath[0]) == hashMerkleRoot
+
+# --- benchmarks ---
+def bench_dSHA256_batch(n=200_000):
+    """ per call dSHA256 vs. dSHA256_batch over n headers """
+    samples = load_hdr_samples()
+    hdrs = (samples * (n//len(samples) + 1))[:n]
+    buf = b"".join(hdrs)
+
+    t_hex = best_of(lambda: [ client.dSHA256(h) for h in hdrs ],repeat=3)
+    t_raw = best_of(lambda: [ client.dSHA256(h,raw=True) for h in hdrs ],repeat=3)
+    t_batch = best_of(lambda: client.dSHA256_batch(buf,processes=1),repeat=3)
+    t_pool = best_of(lambda: client.dSHA256_batch(buf,processes=None,cutoff=0),repeat=3)
+
+    print("dSHA256 over {:,d} headers:".format(n))
+    print("\tdSHA256 (hex)     = {:12,.0f}  hdr/s".format(n/t_hex))
+    print("\tdSHA256 (raw)     = {:12,.0f}  hdr/s".format(n/t_raw))
+    print("\tbatch (1 process) = {:12,.0f}  hdr/s".format(n/t_batch))
+    print("\tbatch (pool)      = {:12,.0f}  hdr/s".format(n/t_pool))
+
+def bench_vrfy_hdr_chain(rounds=400):
+    """ streaming header chain validation of the 500 header samples, repeated rounds times """
+    hdrs = load_hdr_samples()
+    n = len(hdrs)*rounds
+
+    def run():
+        for i in range(0,rounds):
+            assert client.vrfy_hdr_chain(hdrs,start_height=300000)["valid"]
+    t_chain = best_of(run,repeat=3)
+    t_blk = best_of(lambda: [ client.BtcBlk(hdr=h) for h in hdrs ],repeat=3)
+
+    print("Header chain validation over {:,d} headers:".format(n))
+    print("\tBtcBlk(hdr=...)   = {:12,.0f}  hdr/s".format(len(hdrs)/t_blk))
+    print("\tvrfy_hdr_chain    = {:12,.0f}  hdr/s".format(n/t_chain))
+
+def bench_BtcHdr(rounds=20):
+    """ construction time and memory of BtcBlk(hdr=...) vs. lazy BtcHdr """
+    samples = load_hdr_samples()
+    hdrs = samples * rounds
+    n = len(hdrs)
+
+    t_blk = best_of(lambda: [ client.BtcBlk(hdr=h) for h in hdrs ],repeat=3)
+    t_lazy = best_of(lambda: [ client.BtcHdr(h) for h in hdrs ],repeat=3)
+    t_lazy_hash = best_of(lambda: [ client.BtcHdr(h).hash for h in hdrs ],repeat=3)
+    m_blk = alloc_per_item(lambda: [ client.BtcBlk(hdr=h) for h in hdrs ],n)
+    m_lazy = alloc_per_item(lambda: [ client.BtcHdr(h) for h in hdrs ],n)
+
+    print("Header objects over {:,d} headers:".format(n))
+    print("\tBtcBlk(hdr=...)   = {:12,.2f}  us/hdr  {:8,.0f}  bytes/hdr".format(t_blk/n*10**6,m_blk))
+    print("\tBtcHdr(...)       = {:12,.2f}  us/hdr  {:8,.0f}  bytes/hdr".format(t_lazy/n*10**6,m_lazy))
+    print("\tBtcHdr(...).hash  = {:12,.2f}  us/hdr".format(t_lazy_hash/n*10**6))
+
+def bench_hex_to_bytes():
+    """ int based hex conversion as previously used vs. bytes.fromhex on a large raw block """
+    blk_raw_hex = load_raw_block_sample()
+    n = len(blk_raw_hex)//2
+
+    t_int = best_of(lambda: int(blk_raw_hex,16).to_bytes(n,"big"),repeat=3)
+    t_bytes = best_of(lambda: client.hexstr_to_dbytes(blk_raw_hex,swap=False),repeat=3)
+    blks = calldata_sample_blks(blk_raw_hex)
+    t_calldata = best_of(lambda: client.get_input_block_calldata(blks,0),repeat=3)
+
+    print("Hex conversion of a {:,d} byte block:".format(n))
+    print("\tint(h,16) block   = {:12,.2f}  ms".format(t_int*1000))
+    print("\tbytes.fromhex     = {:12,.2f}  ms".format(t_bytes*1000))
+    print("\tcalldata          = {:12,.2f}  ms".format(t_calldata*1000))
+
+def bench_parse_blk():
+    """ parse time of a large raw block, full BtcBlk objects vs. offsets only """
+    blk_raw = bytes.fromhex(load_raw_block_sample())
+
+    t_blk = best_of(lambda: client.BtcBlk(blk=blk_raw),repeat=3)
+    t_offsets = best_of(lambda: client.parse_btc_blk_offsets(blk_raw),repeat=3)
+
+    print("Parsing a {:,d} byte block with {:,d} txs:".format(len(blk_raw),client.parse_btc_blk_offsets(blk_raw)["tx_count"]))
+    print("\tBtcBlk(blk=...)   = {:12,.2f}  ms".format(t_blk*1000))
+    print("\toffsets           = {:12,.2f}  ms".format(t_offsets*1000))
+
+def bench_BtcBlkView():
+    """ parse time and memory of a large raw block, BtcBlk vs. lazy BtcBlkView """
+    blk_raw = bytes.fromhex(load_raw_block_sample())
+
+    t_blk = best_of(lambda: client.BtcBlk(blk=blk_raw),repeat=3)
+    t_view = best_of(lambda: client.BtcBlkView(blk_raw),repeat=3)
+    t_txids = best_of(lambda: client.BtcBlkView(blk_raw).get_txids(raw=True),repeat=3)
+    m_blk = alloc_per_item(lambda: [ client.BtcBlk(blk=blk_raw) ],1)
+    m_view = alloc_per_item(lambda: [ client.BtcBlkView(blk_raw) ],1)
+
+    print("Block objects of a {:,d} byte block:".format(len(blk_raw)))
+    print("\tBtcBlk(blk=...)   = {:12,.2f}  ms  {:12,.0f}  bytes".format(t_blk*1000,m_blk))
+    print("\tBtcBlkView(...)   = {:12,.2f}  ms  {:12,.0f}  bytes".format(t_view*1000,m_view))
+    print("\tview + txids      = {:12,.2f}  ms".format(t_txids*1000))
+
+def bench_segwit_txids():
+    """ txids of a segwit block, full BtcBlk parsing vs. scanning the stripped serialization """
+    blk_raw = segwit_sample_blk()[0]
+
+    t_blk = best_of(lambda: [ tx.txhash for tx in client.BtcBlk(blk=blk_raw).txs ],repeat=3)
+    t_view = best_of(lambda: client.BtcBlkView(blk_raw).get_txids(raw=True),repeat=3)
+    t_scan = best_of(lambda: client.scan_btc_txids(blk_raw),repeat=3)
+    t_scan_w = best_of(lambda: client.scan_btc_txids(blk_raw,wtxids=True),repeat=3)
+
+    print("Txids of a {:,d} byte segwit block:".format(len(blk_raw)))
+    print("\tBtcBlk(blk=...)   = {:12,.2f}  ms".format(t_blk*1000))
+    print("\tBtcBlkView        = {:12,.2f}  ms".format(t_view*1000))
+    print("\tscan_btc_txids    = {:12,.2f}  ms".format(t_scan*1000))
+    print("\t  with wtxids     = {:12,.2f}  ms".format(t_scan_w*1000))
+
+def bench_calldata_range(n=64):
+    """ calldata preparation of n blocks, serial loop vs. get_input_blocks_calldata """
+    blks = calldata_sample_chain(n)
+
+    t_loop = best_of(lambda: [ client.get_input_block_calldata(blks,i) for i in range(0,n) ],repeat=3)
+    t_serial = best_of(lambda: client.get_input_blocks_calldata(blks,processes=1),repeat=3)
+    t_pool = best_of(lambda: client.get_input_blocks_calldata(blks),repeat=3)
+
+    print("Calldata of {:,d} blocks on {:d} cores:".format(n,os.cpu_count() or 1))
+    print("\tloop              = {:12,.2f}  blk/s".format(n/t_loop))
+    print("\trange (1 process) = {:12,.2f}  blk/s".format(n/t_serial))
+    print("\trange (pool)      = {:12,.2f}  blk/s".format(n/t_pool))
+
+def bench_blk_file(n=64):
+    """ scanning a blk*.dat style file of n linked blocks, building the height index and reading by height """
+    blks = calldata_sample_chain(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,"blk00000.dat")
+        with open(path,"wb") as blk_file:
+            for blk in blks:
+                raw = bytes.fromhex(blk["rawblock"])
+                blk_file.write(client.BLK_MAGIC_MAIN + len(raw).to_bytes(4,"little") + raw)
+        size = os.path.getsize(path)
+
+        t_views = best_of(lambda: [ len(view) for view in client.iter_blk_files([path]) ],repeat=3)
+        t_txids = best_of(lambda: [ view.get_txids(raw=True) for view in client.iter_blk_files([path]) ],repeat=3)
+        t_index = best_of(lambda: client.BtcBlkIndex.create(os.path.join(tmp,"blk.idx"),[path]).close(),repeat=3)
+        with client.BtcBlkIndex(os.path.join(tmp,"blk.idx")) as idx:
+            t_get = best_of(lambda: [ idx.get(h).hash for h in range(idx.start_height,idx.end_height) ],repeat=3)
+
+    print("Block file of {:,d} blocks, {:,d} bytes:".format(n,size))
+    print("\titer views        = {:12,.2f}  MB/s".format(size/t_views/10**6))
+    print("\titer views+txids  = {:12,.2f}  MB/s".format(size/t_txids/10**6))
+    print("\tindex create      = {:12,.2f}  ms".format(t_index*1000))
+    print("\tindex get(height) = {:12,.2f}  us/blk".format(t_get/n*10**6))
+
+def bench_tx_serialization(n=2000):
+    """ parsing and re-serializing a coinbase with n outputs """
+    cbtx = client.BtcBlkView(bytes.fromhex(load_raw_block_sample())).get_tx(0)
+    txout = cbtx.tx_out[0]
+    outs = [ client.BtcTxOut(value=i,script_len=txout.script_len,script_pk=txout.script_pk) for i in range(0,n) ]
+    txb = client.BtcTx(nVersion=cbtx.nVersion,
+                       tx_in_cnt=1,
+                       tx_in=cbtx.tx_in,
+                       tx_out_cnt=n,
+                       tx_out=outs,
+                       nLockTime=cbtx.nLockTime).txb
+    tx = client.BtcTx(rawbytes=txb)
+
+    t_parse = best_of(lambda: client.BtcTx(rawbytes=txb),repeat=3)
+    t_bytes = best_of(lambda: tx.get_tx("bytes"),repeat=3)
+    t_cb = best_of(lambda: tx.parse_coinbase(),repeat=3)
+    tx.tx_out[0].script_pk = tx.tx_out[0].script_pk[:-1] + b"\x00" # replaced field
+    t_bytes_changed = best_of(lambda: tx.get_tx("bytes"),repeat=3)
+    t_cb_changed = best_of(lambda: tx.parse_coinbase(),repeat=3)
+
+    print("Coinbase with {:,d} outputs, {:,d} bytes:".format(n,len(txb)))
+    print("\tBtcTx(rawbytes=)  = {:12,.2f}  ms".format(t_parse*1000))
+    print("\tget_tx bytes      = {:12,.2f}  ms".format(t_bytes*1000))
+    print("\tparse_coinbase    = {:12,.2f}  ms".format(t_cb*1000))
+    print("\tchanged get_tx    = {:12,.2f}  ms".format(t_bytes_changed*1000))
+    print("\tchanged coinbase  = {:12,.2f}  ms".format(t_cb_changed*1000))
+
+def peak_alloc(f):
+    """ return peak bytes allocated while running f """
+    tracemalloc.start()
+    f()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def bench_mrkl_root(sizes=(1_000,10_000,100_000)):
+    """ previous recursive Merkle root vs. iterative mrkl_root_raw over a list or a packed buffer of hashes """
+    print("Merkle root:")
+    for n in sizes:
+        hashes = [ client.dSHA256(i.to_bytes(4,"little"),raw=True) for i in range(0,n) ]
+        packed = b"".join(hashes)
+        for name,f in (("recursive",lambda: mrkl_root_recursive(hashes.copy())),
+                       ("iterative",lambda: client.mrkl_root_raw(hashes,processes=1)),
+                       ("packed",lambda: client.mrkl_root_raw(packed,processes=1))):
+            print("\t{:>7,d} {:9s} = {:12,.2f}  ms  {:12,.0f}  peak bytes".format(n,name,best_of(f,repeat=3)*1000,peak_alloc(f)))
+
+def bench_MerkleTree(n=4_000,proofs=100):
+    """ Merkle proofs of several txs of one block, mrkl_root_path per proof vs. one MerkleTree """
+    hashes = [ client.dSHA256(i.to_bytes(4,"little"),raw=True) for i in range(0,n) ]
+    shashes = [ client.dbytes_to_hexstr(hashes[i]) for i in range(0,n,n//proofs) ]
+
+    def per_proof():
+        for shash in shashes:
+            client.mrkl_root_path(hashes,shash=shash,mpath=list(),flags=list())
+    t_path = best_of(per_proof,repeat=3)
+    t_build = best_of(lambda: client.MerkleTree(hashes),repeat=3)
+    tree = client.MerkleTree(hashes)
+    t_proofs = best_of(lambda: [ tree.proof(shash) for shash in shashes ],repeat=3)
+
+    print("{:,d} Merkle proofs in a tree of {:,d} txs:".format(len(shashes),n))
+    print("\tmrkl_root_path    = {:12,.2f}  ms/proof".format(t_path/len(shashes)*1000))
+    print("\tMerkleTree build  = {:12,.2f}  ms".format(t_build*1000))
+    print("\tMerkleTree.proof  = {:12,.2f}  us/proof".format(t_proofs/len(shashes)*10**6))
+
+def bench_mrkl_block(n=4_000,matches=100):
+    """ partial Merkle tree (BIP37) for several txs of one block vs. one Merkle path per tx """
+    hashes = [ client.dSHA256(i.to_bytes(4,"little"),raw=True) for i in range(0,n) ]
+    tree = client.MerkleTree(hashes)
+    matched = set(hashes[0:n:n//matches])
+    paths = [ tree.proof(h) for h in matched ]
+    phashes,pflags = client.gen_partial_mrkl_tree(tree,matched)
+
+    t_gen = best_of(lambda: client.gen_partial_mrkl_tree(tree,matched),repeat=3)
+    t_vrfy = best_of(lambda: client.vrfy_partial_mrkl_tree(n,phashes,pflags),repeat=3)
+    t_paths = best_of(lambda: [ client.vrfy_root_path(tree.hashMerkleRoot,client.dbytes_to_hexstr(h),*tree.proof(h)) for h in matched ],repeat=3)
+
+    print("Proofs of {:,d} of {:,d} txs:".format(len(matched),n))
+    print("\tMerkle paths      = {:12,d}  hashes  {:8,.2f}  ms verify".format(sum([ len(p[0]) for p in paths ]),t_paths*1000))
+    print("\tpartial tree      = {:12,d}  hashes  {:8,.2f}  ms verify  {:8,.2f}  ms gen".format(len(phashes),t_vrfy*1000,t_gen*1000))
+
+def bench_vrfy_root_paths(n=4_000,repeat=20):
+    """ copy + mutating path verification vs. read only and batch verification of all txs of a block """
+    hashes = [ client.dSHA256(i.to_bytes(4,"little"),raw=True) for i in range(0,n) ]
+    tree = client.MerkleTree(hashes)
+    root = tree.hashMerkleRoot
+    proofs = [ (client.dbytes_to_hexstr(h),*tree.path(i)) for i,h in enumerate(hashes) ]
+
+    t_old = best_of(lambda: [ vrfy_root_path_mutating(root,h,p.copy(),f.copy()) for h,p,f in proofs ],repeat=3)
+    t_new = best_of(lambda: [ client.vrfy_root_path(root,h,p,f) for h,p,f in proofs ],repeat=3)
+    t_batch = best_of(lambda: client.vrfy_root_paths(root,proofs),repeat=3)
+    # single coinbase path as in get_block_calldata, where the old version needs copies
+    h,p,f = proofs[0]
+    t_cb_old = best_of(lambda: [ vrfy_root_path_mutating(root,h,p.copy(),f.copy()) for _ in range(repeat) ],repeat=3)/repeat
+    t_cb_new = best_of(lambda: [ client.vrfy_root_path(root,h,p,f) for _ in range(repeat) ],repeat=3)/repeat
+
+    print("Verify {:,d} Merkle paths of depth {:d}:".format(n,len(p)))
+    print("\tcopy + mutate     = {:12,.2f}  ms".format(t_old*1000))
+    print("\tread only         = {:12,.2f}  ms".format(t_new*1000))
+    print("\tbatch             = {:12,.2f}  ms".format(t_batch*1000))
+    print("Verify one coinbase path:")
+    print("\tcopy + mutate     = {:12,.2f}  us".format(t_cb_old*1e6))
+    print("\tread only         = {:12,.2f}  us".format(t_cb_new*1e6))
+
+def bench_mrkl_root_pool(sizes=(100_000,1_000_000)):
+    """ sequential vs. subtree parallel Merkle root over many leaves """
+    processes = max(2,os.cpu_count() or 1)
+    print("Merkle root with {:d} processes on {:d} CPUs:".format(processes,os.cpu_count() or 1))
+    for n in sizes:
+        packed = b"".join([ client.dSHA256(i.to_bytes(4,"little"),raw=True) for i in range(0,n) ])
+        t_seq = best_of(lambda: client.mrkl_root_raw(packed,processes=1),repeat=3)
+        t_pool = best_of(lambda: client.mrkl_root_raw(packed,processes=processes,cutoff=0),repeat=3)
+        print("\t{:>9,d} sequential = {:12,.2f}  ms".format(n,t_seq*1000))
+        print("\t{:>9,d} subtrees   = {:12,.2f}  ms".format(n,t_pool*1000))
+
+def bench_coinbase_root(variants=100):
+    """ Merkle root per coinbase variant, whole tree from all txids vs. from the coinbase branch """
+    blks = calldata_sample_blks()
+    b = client.get_input_block_calldata(blks,0)
+    txids = client.BtcBlkView(bytes.fromhex(blks[0]["rawblock"])).get_txids(raw=True)
+    cb_txs = [ b["cb_pfx"] + b["cb"][:-4] + i.to_bytes(4,"little") + b["cb_sfx"] for i in range(0,variants) ]
+
+    t_tree = best_of(lambda: [ client.mrkl_root_raw([client.dSHA256(cb_tx,raw=True)] + txids[1:],processes=1) for cb_tx in cb_txs ],repeat=3)
+    t_branch = best_of(lambda: [ client.mrkl_root_from_coinbase(cb_tx,b["mp_hashes_bytes_big"]) for cb_tx in cb_txs ],repeat=3)
+
+    print("Merkle root per coinbase variant, {:,d} txs:".format(len(txids)))
+    print("\tall txids         = {:12,.2f}  us".format(t_tree/variants*1e6))
+    print("\tcoinbase branch   = {:12,.2f}  us".format(t_branch/variants*1e6))
+
+def bench_calldata_cache(n=23):
+    """ calldata of n blocks, prepared vs. written to and read from a CalldataCache """
+    blks = calldata_sample_chain(n)
+    t_prepare = best_of(lambda: client.get_input_blocks_calldata(blks,processes=1),repeat=3)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        client.get_input_blocks_calldata(blks,processes=1,cache=client.CalldataCache(tmp))
+        t_cold = time.perf_counter() - start
+        t_warm = best_of(lambda: client.get_input_blocks_calldata(blks,processes=1,cache=client.CalldataCache(tmp)),repeat=3)
+
+    print("Calldata of {:,d} blocks:".format(n))
+    print("\tprepared          = {:12,.2f}  ms".format(t_prepare*1000))
+    print("\tcold cache        = {:12,.2f}  ms".format(t_cold*1000))
+    print("\twarm cache        = {:12,.2f}  ms".format(t_warm*1000))
+
+def bench_vrfy_levels():
+    """ calldata preparation of a large block per verification level, with the time per check """
+    blks = calldata_sample_blks()
+    print("Calldata of block {:,d} per verification level:".format(blks[0]["height"]))
+    for level in client.VRFY_LEVELS:
+        counters = client.VrfyCounters()
+        t = best_of(lambda: client.get_input_block_calldata(blks,0,level=level,counters=counters),repeat=10)
+        print("\t{:17s} = {:12,.2f}  ms".format(level,t*1000))
+        for name in counters.runs:
+            print("\t  {:15s} = {:12,.2f}  us".format(name,counters.seconds[name]/counters.runs[name]*1e6))
+
+def rss_after(setup,stmt):
+    """ seconds and resident set size increase in bytes of stmt, in a fresh interpreter after setup.
+    The RSS is read from /proc, so this only works on Linux. """
+    code = "\n".join(["import time,client",
+                      "def rss():",
+                      "    with open('/proc/self/status') as f:",
+                      "        return [ int(l.split()[1])*1024 for l in f if l.startswith('VmRSS') ][0]",
+                      setup,
+                      "r = rss()",
+                      "t = time.perf_counter()",
+                      stmt,
+                      "print(time.perf_counter() - t,rss() - r)"])
+    out = subprocess.run([sys.executable,"-c",code],capture_output=True,check=True,text=True).stdout.split()
+    return float(out[-2]),int(out[-1])
+
+def bench_blk_archive(n=1_000,tx_n=100):
+    """ JSON dump vs. binary block archive of n synthesized blocks of tx_n txs each """
+    view = client.BtcBlkView(bytes.fromhex(load_raw_block_sample()))
+    raw = bytes(view.blk[:80]) + client.int_to_vint(tx_n) + b"".join([ bytes(view.get_tx_raw(i)) for i in range(0,tx_n) ])
+    blks = [ dict(b,height=b["height"] + i) for i,b in enumerate(calldata_sample_chain(n,raw.hex())) ]
+    del view
+    height = blks[n//2]["height"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client.store_input_blocks(tmp + "/",blks)
+        json_path = os.path.join(tmp,"{}--{}".format(blks[0]["height"],blks[-1]["height"]))
+        archive_path = os.path.join(tmp,"archive")
+        start = time.perf_counter()
+        client.BtcBlkArchive.import_json_blocks(json_path,archive_path).close()
+        t_import = time.perf_counter() - start
+        json_size = os.path.getsize(json_path)
+        archive_size = sum([ os.path.getsize(archive_path + ext) for ext in (".blk",".txid",".idx") ])
+
+        t_json,rss_json = rss_after("",
+            "blks = client.load_input_blocks({!r}); txids = client.BtcBlkView(bytes.fromhex([ b for b in blks if b['height'] == {} ][0]['rawblock'])).get_txids()".format(json_path,height))
+        t_archive,rss_archive = rss_after("",
+            "a = client.BtcBlkArchive({!r}); txids = a.get({}).get_txids()".format(archive_path,height))
+        t_scan,rss_scan = rss_after("a = client.BtcBlkArchive({!r})".format(archive_path),
+            "txids = [ v.get_txid(0) for v in a ]")
+
+    print("{:,d} blocks of {:,d} txs, one block and its txids:".format(n,tx_n))
+    print("\tJSON              = {:12,.2f}  ms  {:12,.0f}  bytes RSS  {:12,d}  bytes on disk".format(t_json*1000,rss_json,json_size))
+    print("\tarchive           = {:12,.2f}  ms  {:12,.0f}  bytes RSS  {:12,d}  bytes on disk".format(t_archive*1000,rss_archive,archive_size))
+    print("\tarchive, all      = {:12,.2f}  ms  {:12,.0f}  bytes RSS".format(t_scan*1000,rss_scan))
+    print("\timport            = {:12,.2f}  ms".format(t_import*1000))
+
+def bench_blk_repo(files=50,per_file=20,tx_n=100):
+    """ range spanning two dumps out of a directory, loading every dump vs. an indexed BtcBlkRepo """
+    view = client.BtcBlkView(bytes.fromhex(load_raw_block_sample()))
+    raw = bytes(view.blk[:80]) + client.int_to_vint(tx_n) + b"".join([ bytes(view.get_tx_raw(i)) for i in range(0,tx_n) ])
+    del view
+    blks = [ dict(b,height=b["height"] + i) for i,b in enumerate(calldata_sample_chain(files*per_file,raw.hex())) ]
+    start = blks[per_file//2]["height"]
+    end = start + per_file
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(0,files):
+            client.store_input_blocks(tmp + "/",blks[i*per_file:(i+1)*per_file])
+
+        def scan():
+            found = [ b for name in sorted(os.listdir(tmp)) if not name.startswith(".")
+                        for b in client.load_input_blocks(os.path.join(tmp,name)) if start <= b["height"] < end ]
+            return sorted(found,key=lambda b: b["height"])
+        t_scan = best_of(scan,repeat=3)
+        index = os.path.join(tmp,".repo.idx")
+        start_time = time.perf_counter()
+        client.BtcBlkRepo(tmp,index_path=index)
+        t_build = time.perf_counter() - start_time
+        t_repo = best_of(lambda: client.BtcBlkRepo(tmp,index_path=index).range(start,end),repeat=3)
+        assert client.BtcBlkRepo(tmp,index_path=index).range(start,end) == scan()
+
+    print("Range of {:,d} blocks over two of {:,d} dumps of {:,d} blocks:".format(per_file,files,per_file))
+    print("\tload all dumps    = {:12,.2f}  ms".format(t_scan*1000))
+    print("\tindexed repo      = {:12,.2f}  ms  {:8,.2f}  ms first index".format(t_repo*1000,t_build*1000))
+
+def bench_fetch(n=40,delay=0.05):
+    """ blocks fetched from the local stand-in server with delay seconds latency per request """
+    import blk_server
+    view = client.BtcBlkView(bytes.fromhex(load_raw_block_sample()))
+    raw = bytes(view.blk[:80]) + client.int_to_vint(100) + b"".join([ bytes(view.get_tx_raw(i)) for i in range(0,100) ])
+    del view
+    blks = [ dict(b,height=b["height"] + i) for i,b in enumerate(calldata_sample_chain(n,raw.hex())) ]
+
+    print("Fetch {:,d} blocks, {:,.0f} ms latency per request:".format(n,delay*1000))
+    with tempfile.TemporaryDirectory() as tmp:
+        client.store_input_blocks(tmp + "/",blks)
+        with blk_server.BlkServer(client.BtcBlkRepo(tmp,index_path=os.path.join(tmp,".repo.idx")),delay=delay) as server:
+            for workers in (1,8,16):
+                start = time.perf_counter()
+                client.fetch_input_blocks(blks[0]["height"],n,[],source=server.source(),workers=workers)
+                t = time.perf_counter() - start
+                print("\t{:2d} workers        = {:12,.2f}  blocks/s".format(workers,n/t))
+
+BENCHMARKS = {"dSHA256_batch": bench_dSHA256_batch,
+              "vrfy_hdr_chain": bench_vrfy_hdr_chain,
+              "BtcHdr": bench_BtcHdr,
+              "hex_to_bytes": bench_hex_to_bytes,
+              "parse_blk": bench_parse_blk,
+              "BtcBlkView": bench_BtcBlkView,
+              "segwit_txids": bench_segwit_txids,
+              "calldata_range": bench_calldata_range,
+              "blk_file": bench_blk_file,
+              "tx_serialization": bench_tx_serialization,
+              "mrkl_root": bench_mrkl_root,
+              "MerkleTree": bench_MerkleTree,
+              "mrkl_block": bench_mrkl_block,
+              "vrfy_root_paths": bench_vrfy_root_paths,
+              "mrkl_root_pool": bench_mrkl_root_pool,
+              "coinbase_root": bench_coinbase_root,
+              "calldata_cache": bench_calldata_cache,
+              "vrfy_levels": bench_vrfy_levels,
+              "blk_archive": bench_blk_archive,
+              "blk_repo": bench_blk_repo,
+              "fetch": bench_fetch}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
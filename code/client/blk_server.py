@@ -0,0 +1,98 @@
+""" Local stand-in for the block explorer APIs used by fetch_input_blocks, serving blocks
+of a BtcBlkRepo so that fetching can be tested offline e.g.,
+    python blk_server.py ../testdata/btc_blocks_json_samples 8000
+"""
+import sys
+import json
+import time
+import threading
+import http.server
+
+import client
+
+class BlkRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves /block-height/<height>?format=json as blockchain.info and
+    /api/rawblock/<hash> as insight, from the repo of the server """
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split("?")[0]
+        with server.lock:
+            server.requests[path] = server.requests.get(path,0) + 1
+            fail = server.requests[path] <= server.fail
+        if server.delay:
+            time.sleep(server.delay)
+        if fail:
+            self.send_json(503,{"error": "unavailable"})
+            return
+        try:
+            if path.startswith("/block-height/"):
+                block = server.repo.get(int(path[len("/block-height/"):]))
+                block = { k: v for k,v in block.items() if k != "rawblock" }
+                self.send_json(200,{"blocks": [block]})
+            elif path.startswith("/api/rawblock/"):
+                block = server.repo.by_hash(path[len("/api/rawblock/"):])
+                self.send_json(200,{"rawblock": block["rawblock"]})
+            else:
+                self.send_json(404,{"error": "unknown path"})
+        except (IndexError,KeyError,ValueError):
+            self.send_json(404,{"error": "block not found"})
+
+    def send_json(self,status,data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,*args):
+        pass
+
+class BlkServer(http.server.ThreadingHTTPServer):
+    """ Block server on a BtcBlkRepo (or anything with get(height) and by_hash(hash)).
+    The first fail requests of every path are answered with 503, to test retries, and every
+    answer is delayed by delay seconds, to simulate latency. requests counts the requests per path. """
+    daemon_threads = True
+
+    def __init__(self,repo,host="127.0.0.1",port=0,fail=0,delay=0):
+        super().__init__((host,port),BlkRequestHandler)
+        self.repo = repo
+        self.fail = fail
+        self.delay = delay
+        self.requests = dict()
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self.server_address[:2])
+
+    def source(self,**kwargs):
+        """ BtcBlkSource fetching from this server """
+        return client.BtcBlkSource(block_url=self.url + "/block-height/{height}?format=json",
+                                   rawblock_url=self.url + "/api/rawblock/{hash}",
+                                   **kwargs)
+
+    def start(self):
+        """ serve in a background thread """
+        self._thread = threading.Thread(target=self.serve_forever,daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,*args):
+        self.stop()
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "../testdata/btc_blocks_json_samples"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    server = BlkServer(client.BtcBlkRepo(directory),port=port)
+    print("Serving blocks of {} at {}".format(directory,server.url))
+    server.serve_forever()
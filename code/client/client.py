@@ -1,8 +1,18 @@
 import struct
 import hashlib
 import math
+import os
+import mmap
+import itertools
+import array
+import functools
+import concurrent.futures
 import requests
 import json
+import pickle
+import time
+import threading
+import collections
 
 import web3
 import util
@@ -21,11 +31,20 @@ assert ( NVERSION_LEN +
          NTIME_LEN +
          NBITS_LEN +
          NNONCE_LEN ) == HDR_LEN
+NTIME_OFFSET = NVERSION_LEN + HASHPREVBLOCK_LEN + HASHMERKLEROOT_LEN
+NBITS_OFFSET = NTIME_OFFSET + NTIME_LEN
+NNONCE_OFFSET = NBITS_OFFSET + NBITS_LEN
 
 """ Coinbase transaction constants """
 CB_TXHASH = b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
 CB_TXIDX = 0xffffffff
 
+""" Block file constants """
+# network magic framing every block in Bitcoin Core's blk*.dat files, followed by the uint32_t block length
+BLK_MAGIC_MAIN = b"\xf9\xbe\xb4\xd9"
+BLK_MAGIC_TESTNET = b"\x0b\x11\x09\x07"
+BLK_MAGIC_REGTEST = b"\xfa\xbf\xb5\xda"
+
 """ Difficulty constants """
 # H(block_header) <= TARGET
 # difficulty = MAX_TARGET / CURRENT_TARGET
@@ -36,11 +55,37 @@ MAX_REGTEST_TARGET = 0x7fffff000000000000000000000000000000000000000000000000000
 MAX_TEST_TARGET = 1<<255 # even bigger value for testing, almost every hash will be below this value
 
 DIFFICULTY_PERIOD = 2016
+TARGET_CACHE_SIZE = 1024 # distinct nBits values kept in the shared target cache
+
+""" Batch hashing constants """
+BATCH_POOL_CUTOFF = 1<<16 # number of items below which batches are hashed in-process
+BATCH_POOL_CHUNKS = 4 # chunks handed to each worker process, for load balancing
+CALLDATA_POOL_CUTOFF = 8 # number of blocks below which calldata is prepared in-process
+MRKL_POOL_CUTOFF = 1<<16 # number of leaves below which Merkle roots are computed in-process
+REPO_CACHE_FILES = 4 # number of parsed JSON dumps kept in memory by a BtcBlkRepo
+# default directory of the BtcBlkRepo indexes, outside of the indexed directories
+REPO_INDEX_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME",os.path.expanduser("~/.cache")),"blkrepo")
+
+""" Block fetching constants """
+FETCH_WORKERS = 8 # blocks fetched concurrently
+FETCH_RETRIES = 3 # retries of a failed request, with exponential backoff
+FETCH_BACKOFF = 0.5 # seconds before the first retry
+FETCH_TIMEOUT = 30 # seconds to connect and between bytes received
+
+""" Transaction pipelining constants """
+PIPELINE_WORKERS = 8 # receipts collected concurrently
+PIPELINE_TIMEOUT = 120 # seconds to wait for a receipt
+
+""" Calldata verification levels """
+# trusted: no checks, e.g., for local archives which were verified when imported
+# standard: every input (block hash, height, coinbase and Merkle root) is checked once
+# paranoid: standard plus proof-of-work and the coinbase path and tblock of the calldata itself
+VRFY_LEVELS = ("trusted","standard","paranoid")
 
 # === utility methods ===
 def dSHA256(v,raw=False,num=False):
     """ Double SHA256 as for Bitcoin block hashses """
-    assert type(v) is bytes, "argument must be bytes"
+    assert type(v) in (bytes,bytearray,memoryview), "argument must be bytes"
     h1 = hashlib.sha256()
     h1.update(v)
     d1 = h1.digest()
@@ -60,6 +105,43 @@ def dSHA256(v,raw=False,num=False):
         #return int(h2.digest().hex(),16).to_bytes(32,"little").hex()
         return dbytes_to_hexstr(h2.digest())
 
+def _dSHA256_chunk(buf,size=HDR_LEN):
+    """ Double SHA256 of every item in a contiguous buffer, returns packed raw digests """
+    sha256 = hashlib.sha256
+    mv = memoryview(buf)
+    return b"".join([ sha256(sha256(mv[i:i+size]).digest()).digest()
+                      for i in range(0,len(mv),size) ])
+
+def dSHA256_batch(buf,size=HDR_LEN,outputformat="bytes",processes=1,cutoff=BATCH_POOL_CUTOFF):
+    """ Double SHA256 of N fixed size values (e.g., 80 byte headers) stored back to back in buf.
+    Returns the raw digests (as dSHA256 with raw=True) packed into one bytes object of N*32 bytes,
+    or as NumPy array of shape (N,32) with outputformat="numpy".
+    The process pool is opt-in: with processes > 1, or None for one per core, batches of
+    at least cutoff items are spread over a process pool, since hashlib does not release
+    the GIL for small inputs.
+    """
+    assert type(buf) in (bytes,bytearray,memoryview), "argument must be bytes-like"
+    assert len(buf) % size == 0, "buffer length must be a multiple of the item size"
+    n = len(buf)//size
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1 or n < cutoff:
+        digests = _dSHA256_chunk(buf,size)
+    else:
+        mv = memoryview(buf)
+        step = math.ceil(n/(processes*BATCH_POOL_CHUNKS))*size
+        chunks = [ bytes(mv[i:i+step]) for i in range(0,len(mv),step) ]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+            digests = b"".join(pool.map(_dSHA256_chunk,chunks,itertools.repeat(size)))
+
+    if outputformat=="bytes":
+        return digests
+    elif outputformat=="numpy":
+        import numpy
+        return numpy.frombuffer(digests,dtype=numpy.uint8).reshape(n,32)
+    else:
+        assert False, "Wrong output format given, must be either 'bytes' or 'numpy'"
+
 def dbytes_to_hexstr(h,swap=True):
     """ conve rts and swaps bytes from digest to hex string representation of hash """
     #return int(h.hex(),16).to_bytes(32,"little").hex()  # also works
@@ -75,11 +157,10 @@ def hexstr_to_dbytes(h,swap=True):
         h = h[2:]
     if len(h)%2 != 0:
         h = h.zfill(len(h)+1)
-    num_bytes = len(h)//2
     if swap:
-        return int(h,16).to_bytes(num_bytes,"little")
+        return bytes.fromhex(h)[::-1]
     else:
-        return int(h,16).to_bytes(num_bytes,"big")
+        return bytes.fromhex(h)
 
 def int_to_dbytes(h):
     """ converts and swaps int representation of hash to bytes for generating digest """
@@ -91,12 +172,12 @@ def dbytes_to_int(h):
 
 def endSwap(b):
     """ change endianess of bytes """
-    if type(b) is bytes:
-        return bytes(reversed(b))
-    elif type(b) is bytearray:
-        return bytearray(reversed(b))
+    if type(b) is bytes or type(b) is bytearray:
+        return b[::-1]
+    elif type(b) is memoryview:
+        return bytes(b)[::-1]
     else:
-        assert False,"Type must be byte or bytearray!"
+        assert False,"Type must be byte, bytearray or memoryview!"
 
 def tx_hashes_to_dbytes(tx_hashes):
     """ Convert list of transaction hashes to list of swaped bytes values to feed into digest """
@@ -176,6 +257,31 @@ def nBits_to_Target(nBits,big_endian=True,strict=True):
 
     return T
 
+@functools.lru_cache(maxsize=TARGET_CACHE_SIZE)
+def _nBits_to_Target_cached(nBits):
+    return nBits_to_Target(nBits)
+
+def nBits_to_Target_cached(nBits,big_endian=True):
+    """ Memoized strict nBits_to_Target shared by header parsing, validation and calldata preparation.
+    nBits only changes once per DIFFICULTY_PERIOD, so most lookups are hits which skip the decoding
+    and the overflow and sign checks. Invalid nBits are not cached and raise on every lookup.
+    nBits may also be a bytearray or memoryview e.g., sliced from a BtcHdrStore header.
+    """
+    if type(nBits) is bytearray or type(nBits) is memoryview:
+        nBits = bytes(nBits) # hashable cache key
+    assert type(nBits) is bytes, "Must be big-endian bytes or big_endian=False"
+    if not big_endian:
+        nBits = endSwap(nBits)
+    return _nBits_to_Target_cached(nBits)
+
+def target_cache_info():
+    """ Returns hits, misses, maxsize and currsize of the shared target cache """
+    return _nBits_to_Target_cached.cache_info()
+
+def target_cache_clear():
+    """ Empties the shared target cache and resets its counters """
+    _nBits_to_Target_cached.cache_clear()
+
 def within_difficulty_period(startBlkidx,endBlkidx):
     """ Helper script to check if attack interval is between two difficulty adjustments.
     i.e., no difficutly adjustments occures during attack
@@ -211,6 +317,240 @@ def replace_at_offset(hdr,offset,replace=None):
         new_hdr[offset + pos] = octet
     return bytes(new_hdr)
 
+# --- Header chain validation ---
+def iter_hdrs(path,binary=None,chunk_hdrs=4096):
+    """ Stream 80 byte headers from a file, either hex text with one header per line
+    (e.g., testdata/btc_hex_hdr_samples/500from300k.txt) or binary with 80 byte records
+    back to back. If binary is None the format is detected from the start of the file.
+    """
+    with open(path,"rb") as hdr_file:
+        if binary is None:
+            start = hdr_file.read(2*HDR_LEN).strip()
+            binary = not all(c in b"0123456789abcdefABCDEFx\r\n" for c in start)
+            hdr_file.seek(0)
+
+        if binary:
+            while True:
+                data = hdr_file.read(HDR_LEN*chunk_hdrs)
+                if not data:
+                    break
+                if len(data) % HDR_LEN != 0:
+                    raise BtcHdrException("Truncated header at end of binary file!")
+                for i in range(0,len(data),HDR_LEN):
+                    yield data[i:i+HDR_LEN]
+        else:
+            for line in hdr_file:
+                line = line.strip()
+                if not line:
+                    continue
+                if line[:2] == b"0x":
+                    line = line[2:]
+                if len(line) != HDR_LEN*2:
+                    raise BtcHdrException("Header length not 80*2 chars")
+                yield bytes.fromhex(line.decode())
+
+def vrfy_hdr_chain(hdrs,start_height=0,hashPrevBlock=None):
+    """ Verify a stream of 80 byte headers in one pass with constant memory.
+    Every header must link to the hash of the previous header via hashPrevBlock
+    and its hash must meet the target encoded in its nBits.
+
+    :param hdrs: iterable of headers as little endian bytes, e.g., from iter_hdrs
+    :param start_height: height of the first header
+    :param hashPrevBlock: expected hashPrevBlock of the first header as hex string or
+                          raw digest bytes, if None the first link is not checked
+    :return: dict with the number of valid headers, the first bad height and the reason
+             if any, as well as the raw digest of the last valid header to resume with
+    :rtype: dict
+    """
+    if type(hashPrevBlock) is str:
+        hashPrevBlock = hexstr_to_dbytes(hashPrevBlock)
+    sha256 = hashlib.sha256
+    from_bytes = int.from_bytes
+    prev = hashPrevBlock
+    last_nBits = None
+    target = None
+    height = start_height
+    error = None
+
+    for hdr in hdrs:
+        if len(hdr) != HDR_LEN:
+            error = "Header length not 80 bytes"
+            break
+        if prev is not None and hdr[NVERSION_LEN:NVERSION_LEN + HASHPREVBLOCK_LEN] != prev:
+            error = "hashPrevBlock does not match previous header"
+            break
+        nBits = hdr[NBITS_OFFSET:NNONCE_OFFSET]
+        if nBits != last_nBits:
+            try:
+                target = nBits_to_Target_cached(nBits,big_endian=False)
+            except NBitsDecodingExcpetion as e:
+                error = str(e)
+                break
+            last_nBits = nBits
+        digest = sha256(sha256(hdr).digest()).digest()
+        if from_bytes(digest,"little") > target:
+            error = "Header hash above target"
+            break
+        prev = digest
+        height += 1
+
+    return {"valid": error is None,
+            "count": height - start_height,
+            "bad_height": height if error is not None else None,
+            "error": error,
+            "last_hash": prev}
+
+def vrfy_hdr_file(path,start_height=0,hashPrevBlock=None,binary=None):
+    """ Verify the header chain stored in a hex text or binary file, see vrfy_hdr_chain """
+    return vrfy_hdr_chain(iter_hdrs(path,binary=binary),
+                          start_height=start_height,
+                          hashPrevBlock=hashPrevBlock)
+
+# --- Offset based block parsing ---
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<L")
+_U64 = struct.Struct("<Q")
+
+def vint_at(buf,offset):
+    """ parse var int at offset of buf without copying, returns tuple of var int length and value """
+    first = buf[offset]
+    if first < 0xFD:
+        return (1,first) # uint8_t
+    elif first == 0xFD:
+        return (3,_U16.unpack_from(buf,offset+1)[0]) # uint16_t
+    elif first == 0xFE:
+        return (5,_U32.unpack_from(buf,offset+1)[0]) # uint32_t
+    else:
+        return (9,_U64.unpack_from(buf,offset+1)[0]) # uint64_t
+
+def scan_btc_tx(buf,offset,tx_in=None,tx_out=None,stripped=None):
+    """ Walk the serialized transaction starting at offset of buf using integer offsets only.
+    If lists are given, the (offset,length) of every input and output is appended.
+    If stripped is a list, the (offset,length) spans of the serialization without
+    marker, flag and witnesses are appended, which is what the txid is computed over.
+    Returns the length of the transaction including witnesses.
+    """
+    start = offset
+    offset += 4 # nVersion
+    segwit = buf[offset] == 0 and buf[offset+1] == 1
+    if segwit:
+        offset += 2 # marker and flag
+    body_start = offset
+
+    vlen,tx_in_cnt = vint_at(buf,offset)
+    offset += vlen
+    for i in range(0,tx_in_cnt):
+        txin_start = offset
+        offset += 36 # prev_output
+        vlen,script_len = vint_at(buf,offset)
+        offset += vlen + script_len + 4 # script_sig, sequence
+        if tx_in is not None:
+            tx_in.append((txin_start,offset - txin_start))
+
+    vlen,n = vint_at(buf,offset)
+    offset += vlen
+    for i in range(0,n):
+        txout_start = offset
+        offset += 8 # value
+        vlen,script_len = vint_at(buf,offset)
+        offset += vlen + script_len # script_pk
+        if tx_out is not None:
+            tx_out.append((txout_start,offset - txout_start))
+    body_end = offset
+
+    if segwit:
+        # one witness stack per input, each a var int count of var int length prefixed items
+        for i in range(0,tx_in_cnt):
+            vlen,items = vint_at(buf,offset)
+            offset += vlen
+            for j in range(0,items):
+                vlen,item_len = vint_at(buf,offset)
+                offset += vlen + item_len
+
+    offset += 4 # nLockTime
+    if offset > len(buf):
+        raise IndexError("Transaction exceeds buffer")
+    if stripped is not None:
+        if segwit:
+            stripped.append((start,4))
+            stripped.append((body_start,body_end - body_start))
+            stripped.append((offset - 4,4))
+        else:
+            stripped.append((start,offset - start))
+    return offset - start
+
+def dSHA256_spans(buf,spans,raw=False):
+    """ Double SHA256 over the concatenation of the (offset,length) spans of buf, without copying """
+    mv = memoryview(buf)
+    h1 = hashlib.sha256()
+    for offset,length in spans:
+        h1.update(mv[offset:offset + length])
+    d = hashlib.sha256(h1.digest()).digest()
+    if raw:
+        return d
+    else:
+        return dbytes_to_hexstr(d)
+
+def scan_btc_txids(blk,tx_n=None,wtxids=False):
+    """ Single pass over a raw block (segwit or not) computing the txids over the stripped
+    serialization of every transaction, without copying. With wtxids the witness txids are
+    computed as well, i.e., over the full serialization. For the witness commitment (BIP141)
+    the coinbase wtxid has to be replaced by 32 zero bytes.
+    Returns the tx count and the lists of raw digests (little endian), wtxids is None if not requested.
+    """
+    mv = memoryview(blk)
+    offset = HDR_LEN
+    vlen,tx_count = vint_at(mv,offset)
+    offset += vlen
+    if tx_n is None:
+        tx_n = tx_count
+    assert tx_n <= tx_count,"Number of tx to parse higher than available tx!"
+
+    txids = list()
+    wtxids_list = list() if wtxids else None
+    for i in range(0,tx_n):
+        stripped = list()
+        tx_len = scan_btc_tx(mv,offset,stripped=stripped)
+        txids.append(dSHA256_spans(mv,stripped,raw=True))
+        if wtxids:
+            if len(stripped) == 1:
+                wtxids_list.append(txids[-1]) # no witness, wtxid equals txid
+            else:
+                wtxids_list.append(dSHA256(mv[offset:offset + tx_len],raw=True))
+        offset += tx_len
+    return {"tx_count":tx_count,
+            "txids":txids,
+            "wtxids":wtxids_list}
+
+def parse_btc_blk_offsets(blk,tx_n=None):
+    """ Single pass over a raw block without copying.
+    Returns the tx count as well as the (offset,length) of every transaction and lists of
+    (offset,length) of the inputs and outputs per transaction, relative to the block start.
+    """
+    mv = memoryview(blk)
+    offset = HDR_LEN
+    vlen,tx_count = vint_at(mv,offset)
+    offset += vlen
+    if tx_n is None:
+        tx_n = tx_count
+    assert tx_n <= tx_count,"Number of tx to parse higher than available tx!"
+
+    txs = list()
+    tx_in = list()
+    tx_out = list()
+    for i in range(0,tx_n):
+        txins = list()
+        txouts = list()
+        tx_len = scan_btc_tx(mv,offset,txins,txouts)
+        txs.append((offset,tx_len))
+        tx_in.append(txins)
+        tx_out.append(txouts)
+        offset += tx_len
+    return {"tx_count":tx_count,
+            "txs":txs,
+            "tx_in":tx_in,
+            "tx_out":tx_out}
+
 # --- Merkle path generation and verification ---
 def vrfy_mrkl_root(tx_hashes,hashMerkleRoot):
     """ verify given Merkle tree root hash by recomputing Merkle tree
@@ -222,171 +562,462 @@ def vrfy_mrkl_root(tx_hashes,hashMerkleRoot):
     :return: True if the calculated hash matches the given one
     :rtype: bool
     """
-    return mrkl_root(tx_hashes.copy()) == hashMerkleRoot
-
-def mrkl_root(hashes):
-    """ compute Merkle tree root hash """
-    assert type(hashes[0]) is bytes,"tx_hashes must be little endian bytes"
-    if len(hashes) == 1:
-        #return int(hashes[0].hex(),16).to_bytes(32,"little").hex()
-        return dbytes_to_hexstr(hashes[0])
-    if len(hashes) % 2 != 0:
-        hashes.append(hashes[-1])
-    nextlevel=list()
-    i=0
-    while i < len(hashes):
-        nextlevel.append(dSHA256(hashes[i] + hashes[i+1],raw=True))
-        i+=2
-    return mrkl_root(nextlevel)
+    return mrkl_root(tx_hashes) == hashMerkleRoot
 
-def vrfy_root_path(hashMerkleRoot,shash,mpath,flags):
-    """ Verify given tx search hash against given Merkle tree root hash """
-    #if flags[0] == 1:
-    mpath.insert(0,hexstr_to_dbytes(shash))
-    #elif flags[0] == 0:
-    #    mpath.insert(1,hexstr_to_dbytes(shash))
-    #else:
-    #    assert False,"Flags must be list of integers!"
-
-    flags.reverse()
-    while len(mpath)>1:
-        flag = flags.pop()
-        if flag == 0:
-            calculated_hash = dSHA256(mpath[1] + mpath[0],raw=True)
-        elif flag == 1:
-            calculated_hash = dSHA256(mpath[0] + mpath[1],raw=True)
+def mrkl_root(hashes,processes=1,cutoff=MRKL_POOL_CUTOFF):
+    """ compute Merkle tree root hash as big endian hex string, see mrkl_root_raw """
+    return dbytes_to_hexstr(mrkl_root_raw(hashes,processes,cutoff))
+
+def _mrkl_reduce(mv,n,levels=None):
+    """ Hash the n packed nodes in mv up in place, until a single node is left or for
+    exactly levels levels. An odd last node of a level is hashed with itself, also if it
+    is the only one, as it is in a subtree which has siblings on its left.
+    Returns the number of nodes left at the front of mv.
+    """
+    sha256 = hashlib.sha256
+    while (n > 1) if levels is None else (levels > 0):
+        # parent j overwrites child 2j, which is not read again on this level
+        for j in range(0,n//2):
+            mv[j*32:(j+1)*32] = sha256(sha256(mv[j*64:(j+1)*64]).digest()).digest()
+        if n % 2 != 0:
+            last = bytes(mv[(n-1)*32:n*32])
+            mv[(n//2)*32:(n//2+1)*32] = sha256(sha256(last + last).digest()).digest()
+        n = (n + 1)//2
+        if levels is not None:
+            levels -= 1
+    return n
+
+def _mrkl_subtree_root(chunk,levels):
+    """ raw root of a subtree of 2**levels leaves, or of the fewer leaves of the last one """
+    buf = bytearray(chunk)
+    _mrkl_reduce(memoryview(buf),len(buf)//32,levels)
+    return bytes(buf[0:32])
+
+def mrkl_root_raw(hashes,processes=1,cutoff=MRKL_POOL_CUTOFF):
+    """ compute Merkle tree root hash iteratively, level by level in one reusable buffer.
+    Returns the raw (little endian) root as in the block header. hashes is either a list of
+    raw tx hashes or all of them packed into one bytes-like object, it is not modified.
+    An odd last hash of a level is hashed with itself, as in Bitcoin.
+    The process pool is opt-in: with processes > 1, or None for one per core, sets of at
+    least cutoff leaves are split into subtrees of 2**k leaves whose roots are computed in
+    a process pool and combined in-process, with the same result.
+    """
+    if type(hashes) is list:
+        assert type(hashes[0]) is bytes,"tx_hashes must be little endian bytes"
+        buf = bytearray().join(hashes)
+    else:
+        buf = bytearray(hashes)
+    n = len(buf)//32
+    assert n > 0 and len(buf) == n*32, "tx_hashes must be a multiple of 32 bytes"
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes > 1 and n >= max(cutoff,2):
+        # smallest power of two subtree giving each worker BATCH_POOL_CHUNKS subtrees
+        k = max(1,math.ceil(math.log2(n/(processes*BATCH_POOL_CHUNKS))))
+        step = (1<<k)*32
+        mv = memoryview(buf)
+        chunks = [ bytes(mv[i:i+step]) for i in range(0,len(mv),step) ]
+        if len(chunks) > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+                buf = bytearray().join(pool.map(_mrkl_subtree_root,chunks,itertools.repeat(k)))
+            n = len(chunks)
+
+    mv = memoryview(buf)
+    _mrkl_reduce(mv,n)
+    return bytes(mv[0:32])
+
+def _mrkl_path_nodes(mpath):
+    """ Yield the 32 byte sibling hashes of a Merkle path given either as a list
+    of raw hashes or as one packed buffer (e.g. mp_hashes_bytes_big) """
+    if isinstance(mpath,(bytes,bytearray,memoryview)):
+        assert len(mpath) % 32 == 0,"Packed Merkle path length must be a multiple of 32!"
+        mv = memoryview(mpath)
+        return (mv[i:i+32] for i in range(0,len(mv),32))
+    return mpath
+
+def mrkl_root_from_path(shash,mpath,flags):
+    """ Hash the given tx hash up along the Merkle path and return the raw root.
+    shash is either a hex string or a raw hash, flag 1 means the sibling is on the
+    right, flag 0 on the left. Neither mpath nor flags are modified. """
+    node = hexstr_to_dbytes(shash) if isinstance(shash,str) else bytes(shash)
+    sha256 = hashlib.sha256
+    for i,sibling in enumerate(_mrkl_path_nodes(mpath)):
+        flag = flags[i]
+        if flag == 1:
+            node = sha256(sha256(node + sibling).digest()).digest()
+        elif flag == 0:
+            node = sha256(sha256(bytes(sibling) + node).digest()).digest()
         else:
-            assert False,"Falgs must be list of integers!"
-        del mpath[0:2]
-        mpath.insert(0,calculated_hash)
-    return dbytes_to_hexstr(mpath[0]) == hashMerkleRoot
+            assert False,"Flags must be list of integers!"
+    return node
+
+def vrfy_root_path(hashMerkleRoot,shash,mpath,flags):
+    """ Verify given tx search hash against given Merkle tree root hash.
+    The path and flags are only read, so callers do not need to pass copies. """
+    return dbytes_to_hexstr(mrkl_root_from_path(shash,mpath,flags)) == hashMerkleRoot
+
+def vrfy_root_paths(hashMerkleRoot,proofs,cache=None):
+    """ Verify many (shash,mpath,flags) proofs against the same Merkle root.
+    Internal nodes which were already shown to lead to the root are remembered per
+    level in cache, so a proof stops hashing as soon as it joins a verified branch
+    and nodes shared between proofs are only hashed once. Pass the same cache set
+    to further calls for the same root to reuse it. Returns a list of bools. """
+    root = hexstr_to_dbytes(hashMerkleRoot) if isinstance(hashMerkleRoot,str) else bytes(hashMerkleRoot)
+    if cache is None:
+        cache = set()
+    sha256 = hashlib.sha256
+    res = []
+    for shash,mpath,flags in proofs:
+        node = hexstr_to_dbytes(shash) if isinstance(shash,str) else bytes(shash)
+        seen = []
+        ok = None
+        for i,sibling in enumerate(_mrkl_path_nodes(mpath)):
+            if (i,node) in cache:
+                ok = True
+                break
+            seen.append((i,node))
+            flag = flags[i]
+            if flag == 1:
+                node = sha256(sha256(node + sibling).digest()).digest()
+            elif flag == 0:
+                node = sha256(sha256(bytes(sibling) + node).digest()).digest()
+            else:
+                assert False,"Flags must be list of integers!"
+        if ok is None:
+            ok = node == root
+        if ok:
+            cache.update(seen)
+        res.append(ok)
+    return res
+
+def mrkl_root_from_coinbase(cb_tx,mp_hashes):
+    """ Raw Merkle root of a block after replacing its coinbase tx by cb_tx, in O(log n).
+    mp_hashes is the Merkle branch of the coinbase (mp_hashes_list or the packed
+    mp_hashes_bytes_big of the calldata), which does not change with the coinbase
+    since it is the leftmost leaf, i.e., all flags are 1.
+    cb_tx is the raw coinbase tx without witnesses, e.g., cb_pfx + cb + cb_sfx.
+    """
+    flags = [1]*(len(mp_hashes)//32 if isinstance(mp_hashes,(bytes,bytearray,memoryview)) else len(mp_hashes))
+    return mrkl_root_from_path(dSHA256(cb_tx,raw=True),mp_hashes,flags)
+
+def hdr_with_coinbase(blockHeader,cb_tx,mp_hashes):
+    """ 80 byte header with hashMerkleRoot replaced by the root for the coinbase tx cb_tx,
+    see mrkl_root_from_coinbase, e.g., to build candidate rblock headers """
+    assert len(blockHeader) == HDR_LEN, "Header length not 80 bytes"
+    offset = NVERSION_LEN + HASHPREVBLOCK_LEN
+    root = mrkl_root_from_coinbase(cb_tx,mp_hashes)
+    return b"".join((bytes(blockHeader[:offset]),root,bytes(blockHeader[offset+HASHMERKLEROOT_LEN:])))
+
+def vrfy_coinbase_path(blockHeader,cb_tx,merklePath):
+    """ Verify that the raw coinbase transaction cb_tx is the first tx of the block
+    with the given 80 byte header, see mrkl_root_from_coinbase """
+    assert len(blockHeader) == HDR_LEN, "Header length not 80 bytes"
+    offset = NVERSION_LEN + HASHPREVBLOCK_LEN
+    return mrkl_root_from_coinbase(cb_tx,merklePath) == bytes(blockHeader[offset:offset+HASHMERKLEROOT_LEN])
+
+def vrfy_coinbase_pfx(cb_pfx):
+    """ Check that a coinbase tx prefix has a single input spending the null outpoint """
+    offset = NVERSION_LEN
+    l,tx_in_cnt = vint_at(cb_pfx,offset)
+    offset += l
+    return (tx_in_cnt == 1 and
+            bytes(cb_pfx[offset:offset+32]) == CB_TXHASH and
+            _U32.unpack_from(cb_pfx,offset+32)[0] == CB_TXIDX)
 
 def mrkl_root_path(hashes,shash=None,mpath=None,flags=None):
-    """ create Merkel inclusion proof
+    """ create Merkel inclusion proof of the tx hash shash (hex string) by appending the
+    sibling hashes to mpath and their flags to flags, returns the root node.
+    Use MerkleTree directly to create proofs for several txs of the same block.
     """
-    initlevel = list()
-    for h in hashes:
-        initlevel.append({"value":h,"hit":False})
-    #print("init level: ",initlevel)
-    return mrkl_path(initlevel,shash=shash,mpath=mpath,flags=flags)
-
-def mrkl_path(level,shash=None,mpath=None,flags=None):
-    assert type(level[0]["value"]) is bytes,"tx_hashes must be little endian bytes"
-    if len(level) == 1:
-        return level[0]
-    if len(level) % 2 != 0:
-        level.append({"value":level[-1]["value"],"hit":False})
-    nextlevel=list()
-    i=0
-    while i < len(level):
-        nextparent = dict()
-        if dbytes_to_hexstr(level[i]["value"]) == shash:
-            mpath.append(level[i+1]["value"])
-            nextparent["hit"] = True
-            flags.append(1)
-
-        elif dbytes_to_hexstr(level[i+1]["value"]) == shash:
-            mpath.append(level[i]["value"])
-            nextparent["hit"] = True
-            flags.append(0)
-
-        elif level[i]["hit"] == True:
-            nextparent["hit"] = True
-            mpath.append(level[i+1]["value"])
-            flags.append(1)
-
-        elif level[i+1]["hit"] == True:
-            nextparent["hit"] = True
-            mpath.append(level[i]["value"])
-            flags.append(0)
+    tree = MerkleTree(hashes)
+    idx = tree.index(shash) if shash is not None else None
+    if idx is not None:
+        path,path_flags = tree.path(idx)
+        mpath.extend(path)
+        flags.extend(path_flags)
+    return {"value":tree.root,"hit":idx is not None}
+
+class MerkleTree:
+    """ Bitcoin Merkle tree with all levels kept in one flat buffer.
+
+    Level 0 holds the raw tx hashes, every further level the parents of the previous one,
+    where an odd last node is hashed with itself. After the O(n) build, the inclusion proof of
+    any tx is read from the buffer in O(log n), using the txid to index map.
+    """
+    def __init__(self,hashes):
+        if type(hashes) is list:
+            assert type(hashes[0]) is bytes,"tx_hashes must be little endian bytes"
+            leaves = b"".join(hashes)
         else:
-            nextparent["hit"] = False
-        nextparent["value"] = dSHA256(level[i]["value"] + level[i+1]["value"],raw=True)
-        nextlevel.append(nextparent)
-        i+=2
-    return mrkl_path(nextlevel,shash=shash,mpath=mpath,flags=flags)
+            leaves = bytes(hashes)
+        n = len(leaves)//32
+        assert n > 0 and len(leaves) == n*32, "tx_hashes must be a multiple of 32 bytes"
+
+        # node count and start node of every level
+        self.counts = [n]
+        while self.counts[-1] > 1:
+            self.counts.append((self.counts[-1] + 1)//2)
+        self.starts = list(itertools.accumulate([0] + self.counts[:-1]))
+
+        self.nodes = bytearray(sum(self.counts)*32)
+        mv = memoryview(self.nodes)
+        mv[0:len(leaves)] = leaves
+        sha256 = hashlib.sha256
+        for level in range(0,len(self.counts) - 1):
+            start = self.starts[level]*32
+            count = self.counts[level]
+            parents = self.starts[level + 1]*32
+            for j in range(0,count//2):
+                pair = start + j*64
+                mv[parents + j*32:parents + (j+1)*32] = sha256(sha256(mv[pair:pair + 64]).digest()).digest()
+            if count % 2 != 0:
+                last = bytes(mv[start + (count-1)*32:start + count*32])
+                mv[parents + (count//2)*32:parents + (count//2+1)*32] = sha256(sha256(last + last).digest()).digest()
+
+        # first index of every tx hash
+        self._index = dict()
+        for i in range(n - 1,-1,-1):
+            self._index[leaves[i*32:(i+1)*32]] = i
+
+    def __len__(self):
+        """ number of leaves """
+        return self.counts[0]
+
+    @property
+    def root(self):
+        """ raw (little endian) Merkle root as in the block header """
+        return self.get_node(len(self.counts) - 1,0)
+
+    @property
+    def hashMerkleRoot(self):
+        """ Merkle root as big endian hex string """
+        return dbytes_to_hexstr(self.root)
+
+    def get_node(self,level,i):
+        """ raw hash of node i of level, level 0 are the leaves """
+        offset = (self.starts[level] + i)*32
+        return bytes(self.nodes[offset:offset + 32])
+
+    def index(self,tx_hash):
+        """ leaf index of the tx hash (hex string or raw), None if not in the tree """
+        if type(tx_hash) is str:
+            tx_hash = hexstr_to_dbytes(tx_hash)
+        return self._index.get(bytes(tx_hash))
+
+    def path(self,i):
+        """ Merkle path of leaf i as lists of sibling hashes and flags, as mrkl_root_path.
+        Flag 1 means the sibling is on the right, 0 on the left.
+        """
+        assert 0 <= i < len(self), "Leaf index out of range"
+        mpath = list()
+        flags = list()
+        for level in range(0,len(self.counts) - 1):
+            if i % 2 == 0:
+                # an odd last node is its own sibling
+                mpath.append(self.get_node(level,min(i + 1,self.counts[level] - 1)))
+                flags.append(1)
+            else:
+                mpath.append(self.get_node(level,i - 1))
+                flags.append(0)
+            i //= 2
+        return (mpath,flags)
+
+    def proof(self,tx_hash):
+        """ Merkle path of the tx hash (hex string or raw), see path """
+        i = self.index(tx_hash)
+        if i is None:
+            raise KeyError("Tx hash not in Merkle tree")
+        return self.path(i)
 
 # --- Bitcoin style Merkle Blocks verification  ---
-class Node():
-    """ Merkle Tree node """
-    def __init__(self, value, left=None, right=None):
-        self.value = value  # The node value
-        self.left = left    # Left child
-        self.right = right  # Right child
+def _partial_mrkl_width(tx_count,height):
+    """ number of nodes at height of the Merkle tree, height 0 are the leaves """
+    return (tx_count + (1 << height) - 1) >> height
+
+def gen_partial_mrkl_tree(tx_hashes,matches):
+    """ Partial Merkle tree (BIP37) of the tx hashes for the set of matched raw tx hashes.
+    Returns the hashes and flag bits in depth-first order, as in a merkleblock message.
+    Matched txs of the same block share the internal nodes of their paths.
+    """
+    tree = tx_hashes if type(tx_hashes) is MerkleTree else MerkleTree(tx_hashes)
+    n = len(tree)
+    height = len(tree.counts) - 1
+    # matched leaves up to index i, to check subtrees for matches in O(1)
+    matched = [0]*(n + 1)
+    for i in range(0,n):
+        matched[i+1] = matched[i] + (tree.get_node(0,i) in matches)
+
+    hashes = list()
+    flags = list()
+    stack = [(height,0)]
+    while stack:
+        h,pos = stack.pop()
+        first = pos << h
+        last = min((pos + 1) << h,n)
+        parent_of_match = matched[last] - matched[first] > 0
+        flags.append(int(parent_of_match))
+        if h == 0 or not parent_of_match:
+            hashes.append(tree.get_node(h,pos))
+        else:
+            # right subtree, if any, is traversed after the left one
+            if 2*pos + 1 < tree.counts[h-1]:
+                stack.append((h-1,2*pos + 1))
+            stack.append((h-1,2*pos))
+    return (hashes,flags)
+
+def vrfy_partial_mrkl_tree(tx_count,hashes,flags):
+    """ Recompute the root of a partial Merkle tree (BIP37) from hashes and flag bits in
+    depth-first order, using a stack of the open left subtrees instead of node objects.
+    Returns the raw root and a list of (index,hash) of the matched txs,
+    or None if the partial tree is invalid.
+    """
+    if tx_count == 0 or len(hashes) > tx_count or len(flags) < len(hashes):
+        return None
+    height = 0
+    while _partial_mrkl_width(tx_count,height) > 1:
+        height += 1
+
+    hi = 0 # next hash
+    fi = 0 # next flag
+    matched = list()
+    stack = list() # [height,pos,left hash] of inner nodes whose left subtree is not done yet
+    h = height
+    pos = 0
+    while True:
+        # descend to the next node given by hash
+        if fi == len(flags):
+            return None
+        flag = flags[fi]
+        fi += 1
+        if h > 0 and flag == 1:
+            stack.append([h,pos,None])
+            h -= 1
+            pos *= 2
+            continue
+        if hi == len(hashes):
+            return None
+        node = hashes[hi]
+        hi += 1
+        if h == 0 and flag == 1:
+            matched.append((pos,node))
+
+        # ascend while both subtrees of the open inner nodes are done
+        while stack:
+            frame = stack[-1]
+            if frame[2] is None:
+                frame[2] = node
+                if 2*frame[1] + 1 < _partial_mrkl_width(tx_count,frame[0] - 1):
+                    break # traverse the right subtree
+                right = node
+            else:
+                right = node
+                if right == frame[2]:
+                    return None # identical siblings, CVE-2012-2459
+            node = dSHA256(frame[2] + right,raw=True)
+            stack.pop()
+        if not stack:
+            break
+        h = frame[0] - 1
+        pos = 2*frame[1] + 1
+
+    # all hashes and all flags up to the padding of the last byte have to be used
+    if hi != len(hashes) or (fi + 7)//8 != (len(flags) + 7)//8:
+        return None
+    return (node,matched)
 
 def gen_mrkl_block(tx_hash,tx_hashes):
-    # TODO create Bitcoin style Merkle Blocks
-    mrkl_block={"hashMerkleRoot":mrkl_root(tx_hashes),
-                "tx_count":len(tx_hashes),
-                "tx_hashes":hashes_bytes,
-                "flag_bytes":math.ceil(len(flags)/8),
-                "flags":[0,0,0,1,1,1,0,1]}
+    """ Create Bitcoin style Merkle Block for one raw tx hash or a list of them.
+    The hashes and the flags, padded to full bytes, are stored in reverse depth-first order
+    as expected by vrfy_mrkl_block, the root as hex string of the raw hash.
+    """
+    matches = set([tx_hash]) if type(tx_hash) is bytes else set(tx_hash)
+    tree = MerkleTree(tx_hashes)
+    hashes,flags = gen_partial_mrkl_tree(tree,matches)
+    flag_bytes = math.ceil(len(flags)/8)
+    flags = flags + [0]*(flag_bytes*8 - len(flags))
+    mrkl_block={"hashMerkleRoot":tree.root.hex(),
+                "tx_count":len(tree),
+                "tx_hashes":hashes[::-1],
+                "flag_bytes":flag_bytes,
+                "flags":flags[::-1]}
     return mrkl_block
 
 def vrfy_mrkl_block(tx_hash,mrkl_block):
-    """ Verfiy Bitcoin style Merkle Blocks """
-    depth = math.ceil(math.log(mrkl_block["tx_count"],2))
+    """ Verfiy Bitcoin style Merkle Blocks, as created by gen_mrkl_block, and that the raw
+    tx hash, or all of a list of them, is matched. The Merkle Block is not modified.
+    """
     assert type(mrkl_block["tx_hashes"]) is list,"tx_hashes must be list"
     assert type(mrkl_block["tx_hashes"][0]) is bytes,"tx_hashes must be list of bytes objects"
-    hashes = mrkl_block["tx_hashes"]
     assert type(mrkl_block["flags"]) is list,"Flags must be list"
     assert type(mrkl_block["flags"][0]) is int,"Flags must be list of int"
-    flags = mrkl_block["flags"]
-
-    height = 0
-    flag = flags.pop()
-    if depth > 0 and flag == 1:
-        node = Node(1)
-        height += 1
-        node.left = build_tree(height,flags,hashes,depth,tx_hash)
-        node.right = build_tree(height,flags,hashes,depth,tx_hash)
-        node.value = dSHA256(node.left.value + node.right.value,raw=True)
-    elif depth == 0 and flag == 1:
-        node = Node(hashes.pop())
-        print("Only coinbase hash")
-    else:
-        print("Invalid merkle block")
-        return None
-    #print("Node value: ",node.value.hex())
-    #print("Shoudl be : ",mrkl_block["hashMerkleRoot"])
-    return mrkl_block["hashMerkleRoot"] == node.value.hex()
-
-def build_tree(height,flags,hashes,depth,tx_hash=None):
-    if height < depth:
-        if flags.pop() is 1:
-            node = Node(1)
-            height += 1
-            node.left = build_tree(height,flags,hashes,depth,tx_hash)
-            node.right = build_tree(height,flags,hashes,depth,tx_hash)
-            node.value = dSHA256(node.left.value + node.right.value,raw=True)
-            return node
-        else:
-            node = Node(hashes.pop())
-            return node
-    if height == depth:
-        if flags.pop() is 1:
-            if tx_hash is not None:
-                assert tx_hash == hashes[-1]
-        node = Node(hashes.pop())
-        return node
-
+    rslt = vrfy_partial_mrkl_tree(mrkl_block["tx_count"],
+                                  mrkl_block["tx_hashes"][::-1],
+                                  mrkl_block["flags"][::-1])
+    if rslt is None:
+        return False
+    root,matched = rslt
+    tx_hashes = [tx_hash] if type(tx_hash) is bytes else tx_hash
+    matched = set([ h for i,h in matched ])
+    return mrkl_block["hashMerkleRoot"] == root.hex() and all([ h in matched for h in tx_hashes ])
 
 # --- Prepare input blocks calldata ---
-def fetch_input_blocks(startHeight,n,blks):
-    """ Fetch some full bitcoin blocks from the interwebz """
-    for h in range(startHeight,startHeight + n):
-        url = "https://blockchain.info/block-height/" + str(h) + "?format=json"
-        r1 = requests.get(url)
-        blocks = r1.json()
-        assert len(blocks["blocks"]) == 1,"fork at height" # check if there was a fork at height
-        block = blocks["blocks"][0]
-        blks.append(block)
-
-        # get raw block
-        url = "https://insight.bitpay.com/api/rawblock/" + block["hash"]
-        r2 = requests.get(url)
-        block_raw = r2.json()["rawblock"]
-        blks[-1]["rawblock"] = block_raw
+def fetch_input_blocks(startHeight,n,blks,source=None,workers=FETCH_WORKERS,progress=None):
+    """ Fetch some full bitcoin blocks from the interwebz, or any other BtcBlkSource, and append
+    them to blks in height order.
+    Up to workers heights are fetched concurrently, each worker thread reuses its own session.
+    With a progress file every fetched block is appended to it as JSON line when done, and
+    heights found in it are not fetched again, so an interrupted fetch can be resumed.
+    If fetching a height fails, the other heights are still fetched and written to progress,
+    then the error of the lowest failed height is raised.
+    """
+    if source is None:
+        source = BtcBlkSource()
+    heights = range(startHeight,startHeight + n)
+    fetched = dict()
+    if progress is not None and os.path.exists(progress):
+        with open(progress) as progress_file:
+            for line in progress_file:
+                try:
+                    block = json.loads(line)
+                except ValueError:
+                    continue # line cut off by an interruption, fetched again
+                if block["height"] in heights:
+                    fetched[block["height"]] = block
+
+    missing = [ h for h in heights if h not in fetched ]
+    if missing:
+        progress_file = None
+        if progress is not None:
+            cut_off = False
+            if os.path.exists(progress) and os.path.getsize(progress) > 0:
+                with open(progress,"rb") as f:
+                    f.seek(-1,os.SEEK_END)
+                    cut_off = f.read(1) != b"\n"
+            progress_file = open(progress,"a")
+            if cut_off:
+                progress_file.write("\n") # end the cut off line
+        errors = dict()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers,len(missing))) as pool:
+                futures = { pool.submit(source.fetch,h): h for h in missing }
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        block = future.result()
+                    except Exception as e:
+                        errors[futures[future]] = e
+                        continue
+                    fetched[block["height"]] = block
+                    if progress_file is not None:
+                        progress_file.write(json.dumps(block) + "\n")
+                        progress_file.flush()
+        finally:
+            if progress_file is not None:
+                progress_file.close()
+        if errors:
+            raise errors[min(errors)]
+
+    blks.extend([ fetched[h] for h in heights ])
     return blks
 
 def store_input_blocks(path,blks):
@@ -407,92 +1038,153 @@ def load_input_blocks(path):
         blks = json.load(json_file)
     return blks
 
-def get_input_block_calldata(blks,n):
+def get_hdr_from_json_block(blk):
+    """ Return the raw 80 byte header of a blockchain.info style JSON block.
+    Uses the rawblock field if present, otherwise the header is built from the header fields.
+    """
+    if "rawblock" in blk:
+        return bytes.fromhex(blk["rawblock"][:HDR_LEN*2])
+    return BtcBlk(nVersion=blk["ver"],
+                  hashPrevBlock=blk["prev_block"],
+                  hashMerkleRoot=blk["mrkl_root"],
+                  nTime=blk["time"],
+                  nBits=blk["bits"],
+                  nNonce=blk["nonce"],
+                  strict=False).get_hdr(outputformat="bytes")
+
+def get_input_block_calldata(blks,n,cache=None,level="standard",counters=None):
+    """ Calldata of the block blks[n], looked up in and added to the CalldataCache cache if given.
+    See get_block_calldata for level and counters. """
+    b = cache.get(blks[n]["hash"],level=level) if cache is not None else None
+    if b is None:
+        b = get_block_calldata(*get_calldata_input(blks[n]),level=level,counters=counters)
+        if cache is not None:
+            cache.put(b,level=level)
+    elif level != "trusted":
+        assert b["blockHeight"] == blks[n]["height"], "Cached block height does not match"
+
+    # check if previous block hash fits
+    if n > 0:
+        assert blks[n-1]["hash"] == b["blockHashPrevBlock_str"]
+    return b
+
+def get_calldata_input(blk):
+    """ Extract the raw block as bytes and the few fields of a blockchain.info style JSON block
+    that the calldata preparation checks against, as arguments for get_block_calldata.
+    This keeps the data handed to worker processes small.
+    """
+    return (bytes.fromhex(blk["rawblock"]),
+            blk["hash"],
+            blk["height"],
+            blk["mrkl_root"],
+            blk["tx"][0]["hash"],
+            blk["tx"][0]["inputs"][0]["script"])
+
+def get_calldata_input_from_view(view):
+    """ Arguments for get_block_calldata from a BtcBlkView e.g., of a blk*.dat file.
+    The fields checked against are taken from the block itself and the height from
+    the view, or from the coinbase if the view has none.
+    """
+    cbtx = view.get_tx(0)
+    height = view.height
+    if height is None:
+        height = cbtx.parse_coinbase()["blk_height"]
+    return (bytes(view.blk),
+            view.hash,
+            height,
+            view.hashMerkleRoot,
+            cbtx.txhash,
+            cbtx.tx_in[0].script_sig.hex())
+
+def get_block_calldata(block_bytes_big,blockHash_str,height,mrkl_root,cb_txhash,cb_script,level="standard",counters=None,txids=None):
+    """ Calldata of a single raw block, checked against the given hash, height, merkle root
+    as well as coinbase txid and script (hex) e.g., from the block JSON dumps.
+    level is one of VRFY_LEVELS and selects which checks run, each at most once. The runs and
+    time of every check are added to counters (a VrfyCounters), by default to CALLDATA_COUNTERS.
+    txids are the precomputed packed txids of the block, if any, see BtcBlkView.
+    The hashPrevBlock is not checked, see get_input_block_calldata and get_input_blocks_calldata.
+    """
+    assert level in VRFY_LEVELS, "Verification level must be one of " + ", ".join(VRFY_LEVELS)
+    standard = level != "trusted"
+    paranoid = level == "paranoid"
+    if counters is None:
+        counters = CALLDATA_COUNTERS
+
     # hash
-    blockHash_str = blks[n]["hash"]
     blockHash_bytes_little = hexstr_to_dbytes(blockHash_str,swap=False)
-    blockHash_bytes_big = hexstr_to_dbytes(blockHash_str)
+    blockHash_bytes_big = endSwap(blockHash_bytes_little)
 
     # header
-    blockHeader_bytes_big = hexstr_to_dbytes(blks[n]["rawblock"][:80*2],swap=False)
-    assert dSHA256(blockHeader_bytes_big) == blockHash_str, "Invalid block header or hash"
-    assert endSwap(dSHA256(blockHeader_bytes_big,raw=True)) == blockHash_bytes_little, "Invalid block hash in bytes"
-    assert dSHA256(blockHeader_bytes_big,raw=True) == blockHash_bytes_big, "Invalid block hash in bytes"
-
+    blockHeader_bytes_big = block_bytes_big[:HDR_LEN]
+    if standard:
+        t = time.perf_counter()
+        assert dSHA256(blockHeader_bytes_big,raw=True) == blockHash_bytes_big, "Invalid block header or hash"
+        counters.add("hdr_hash",t)
+    if paranoid:
+        t = time.perf_counter()
+        target = nBits_to_Target_cached(blockHeader_bytes_big[NBITS_OFFSET:NNONCE_OFFSET],big_endian=False)
+        assert int.from_bytes(blockHash_bytes_big,"little") <= target, "Block hash does not meet target"
+        counters.add("pow",t)
 
     # coinbase
-    block_str = blks[n]["rawblock"]
-    block_bytes_big = hexstr_to_dbytes(block_str,swap=False)
-    #b = BtcBlk(blk=blk_bytes,tx_n=1) # parse only coinbase
-    block = BtcBlk(blk=block_bytes_big) # parse whole block
-    coinbaseTx = block.txs[0]
+    # index tx boundaries only, just the coinbase is parsed
+    block = BtcBlkView(block_bytes_big,txids=txids)
+    coinbaseTx = block.get_tx(0)
     coinbase = coinbaseTx.parse_coinbase()
     # get parsed block height from coinbase
     blockHeight = coinbase["blk_height"]
-    assert blks[n]["height"] == blockHeight
     # get previous block hash
     blockHashPrevBlock_str = block.hashPrevBlock
-    blockHashPrevBlock_bytes_big = hexstr_to_dbytes(block.hashPrevBlock)
-    blockHashPrevBlock_bytes_little = hexstr_to_dbytes(block.hashPrevBlock,swap=False)
+    blockHashPrevBlock_bytes_big = block.get_hashPrevBlock(raw=True)
+    blockHashPrevBlock_bytes_little = endSwap(blockHashPrevBlock_bytes_big)
     # get coinbase prefix,suffix and coinbase
     cb_pfx = coinbase["coinbasetx_prefix"]
     cb = coinbase["coinbase_full"]
     cb_sfx = coinbase["coinbasetx_suffix"]
     cb_hash = coinbaseTx.txhash
-    cb_tx = b"".join([ cb_pfx, cb, cb_sfx])
-    assert hexstr_to_dbytes(blks[n]["tx"][0]["inputs"][0]["script"],swap=False) == cb
-    assert dSHA256(cb_tx) == coinbaseTx.txhash # check if coinbaseTx is valid, also in slices
-    assert coinbaseTx.txhash == blks[n]["tx"][0]["hash"]
+    if standard:
+        t = time.perf_counter()
+        assert height == blockHeight, "Coinbase block height does not match"
+        counters.add("height",t)
+        t = time.perf_counter()
+        assert bytes.fromhex(cb_script) == cb, "Coinbase script does not match"
+        assert cb_hash == cb_txhash, "Coinbase txid does not match"
+        counters.add("coinbase",t)
     # hashMerkleRoot
     blockHashMerkleRoot_str = block.hashMerkleRoot
-    blockHashMerkleRoot_bytes_big = hexstr_to_dbytes(block.hashMerkleRoot)
-    assert blockHashMerkleRoot_str == blks[n]["mrkl_root"]
-
-    # tx hashes of block
-    block_txhash_list_str = list()
-    for t in block.txs:
-        block_txhash_list_str.append(t.txhash)
+    blockHashMerkleRoot_bytes_big = block.get_hashMerkleRoot(raw=True)
 
-    # verify all hashes sum up to merkle path again
-    block_txhash_list_bytes = tx_hashes_to_dbytes(block_txhash_list_str)
-    assert vrfy_mrkl_root(block_txhash_list_bytes,blockHashMerkleRoot_str)
+    # tx hashes of block, as raw digests to feed into the merkle tree
+    # the tree is built once for root and path
+    tree = MerkleTree(block.get_txids(raw=True))
+    if standard:
+        t = time.perf_counter()
+        assert blockHashMerkleRoot_str == mrkl_root, "Merkle root does not match"
+        assert tree.root == blockHashMerkleRoot_bytes_big, "Merkle root does not match txs"
+        counters.add("mrkl_root",t)
 
     # merkle path to coinbase
-    # input data:
-    mpath = list()
-    flags = list()
-    shash = coinbaseTx.txhash
-
-    result = mrkl_root_path(block_txhash_list_bytes,
-                               shash=shash,
-                               mpath=mpath,
-                               flags=flags)
-    assert dbytes_to_hexstr(result["value"]) == blockHashMerkleRoot_str
-    assert vrfy_root_path(blockHashMerkleRoot_str,
-                          coinbaseTx.txhash,
-                          mpath.copy(),
-                          flags.copy()) # copy because call-by-ref. and gets deleted
+    mpath,flags = tree.path(0)
     mp_hashes_bytes_big = b''.join(mpath) # concat all merkle path hashes, they are fixed size this is good
+    if paranoid:
+        # the coinbase as split for the template hashes up the path to the root
+        t = time.perf_counter()
+        assert mrkl_root_from_coinbase(b"".join((cb_pfx,cb,cb_sfx)),mp_hashes_bytes_big) == blockHashMerkleRoot_bytes_big, "Coinbase Merkle path is invalid"
+        counters.add("coinbase_path",t)
 
     # prepare tblock
-    # replace Merkle tree root hash
-    tblockHeader_bytes_big = replace_found_bytes(blockHeader_bytes_big,hexstr_to_dbytes(blockHashMerkleRoot_str))
-    # replace previous block hash
-    tblockHeader_bytes_big = replace_found_bytes(tblockHeader_bytes_big,hexstr_to_dbytes(blockHashPrevBlock_str))
+    # zero previous block hash and Merkle tree root hash
+    offset = NVERSION_LEN + HASHPREVBLOCK_LEN + HASHMERKLEROOT_LEN
+    tblockHeader_bytes_big = b"".join((blockHeader_bytes_big[:NVERSION_LEN],
+                                       bytes(HASHPREVBLOCK_LEN + HASHMERKLEROOT_LEN),
+                                       blockHeader_bytes_big[offset:]))
     # calculate new tblock hash
-    tblockHash_str = dSHA256(tblockHeader_bytes_big)
-    tblockHash_bytes_big = hexstr_to_dbytes(tblockHash_str)
-
-    offset = NVERSION_LEN + HASHPREVBLOCK_LEN
-    undo_replace = replace_at_offset(tblockHeader_bytes_big,offset,replace=blockHashMerkleRoot_bytes_big)
-    offset = NVERSION_LEN
-    undo_replace = replace_at_offset(undo_replace,offset,replace=blockHashPrevBlock_bytes_big)
-    assert undo_replace == blockHeader_bytes_big
-    assert dSHA256(undo_replace) == blockHash_str
-
-    # check if previous block hash fits
-    if n > 0:
-        assert blks[n-1]["hash"] == blockHashPrevBlock_str
+    tblockHash_bytes_big = dSHA256(tblockHeader_bytes_big,raw=True)
+    if paranoid:
+        t = time.perf_counter()
+        undo_replace = replace_at_offset(tblockHeader_bytes_big,NVERSION_LEN,replace=blockHashPrevBlock_bytes_big + blockHashMerkleRoot_bytes_big)
+        assert undo_replace == blockHeader_bytes_big, "tblock header does not match block header"
+        counters.add("tblock",t)
 
     return {"blockHash_str": blockHash_str,
             "blockHash_bytes_little":  blockHash_bytes_little,
@@ -514,6 +1206,56 @@ def get_input_block_calldata(blks,n):
             "mp_hashes_bytes_big": mp_hashes_bytes_big,
             "mp_flags": flags}
 
+def _get_block_calldata_counted(*args,level="standard"):
+    """ get_block_calldata in a worker process, returning the calldata and the worker's counters """
+    counters = VrfyCounters()
+    return get_block_calldata(*args,level=level,counters=counters),counters
+
+def get_input_blocks_calldata(blks,start=0,end=None,processes=None,cutoff=CALLDATA_POOL_CUTOFF,cache=None,level="standard",counters=None):
+    """ Calldata of the blocks blks[start:end], in the same order.
+    Ranges of at least cutoff blocks are spread over a process pool. Only the raw blocks and the
+    fields checked against are sent to the workers, not the full JSON blocks.
+    With a CalldataCache cache only the blocks missing from it, or cached at a lower level,
+    are prepared, and then added.
+    See get_block_calldata for level and counters, the counters of the workers are added up.
+    The hashPrevBlock continuity of the range, and to blks[start-1] if any, is checked afterwards.
+    """
+    blks_range = blks[start:end]
+    b = [ cache.get(blk["hash"],level=level) if cache is not None else None for blk in blks_range ]
+    if level != "trusted":
+        for blk,calldata in zip(blks_range,b):
+            if calldata is not None:
+                assert calldata["blockHeight"] == blk["height"], "Cached block height does not match"
+    missing = [ i for i,calldata in enumerate(b) if calldata is None ]
+
+    inputs = [ get_calldata_input(blks_range[i]) for i in missing ]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1 or len(inputs) < max(cutoff,2):
+        prepared = [ get_block_calldata(*args,level=level,counters=counters) for args in inputs ]
+    else:
+        if counters is None:
+            counters = CALLDATA_COUNTERS
+        chunksize = max(1,len(inputs)//(processes*BATCH_POOL_CHUNKS))
+        worker = functools.partial(_get_block_calldata_counted,level=level)
+        prepared = list()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+            for calldata,worker_counters in pool.map(worker,*zip(*inputs),chunksize=chunksize):
+                prepared.append(calldata)
+                counters.update(worker_counters)
+    for i,calldata in zip(missing,prepared):
+        b[i] = calldata
+        if cache is not None:
+            cache.put(calldata,level=level)
+
+    # check if previous block hashes fit
+    prev_hash = blks[start-1]["hash"] if start > 0 else None
+    for calldata in b:
+        if prev_hash is not None:
+            assert calldata["blockHashPrevBlock_str"] == prev_hash, "hashPrevBlock of block {} does not match previous block".format(calldata["blockHeight"])
+        prev_hash = calldata["blockHash_str"]
+    return b
+
 # === Classes ===
 class BtcHdrException(Exception):
     """ Class for custom Bitcoin header related excptions """
@@ -552,8 +1294,8 @@ class BtcBlk:
 
             # compleate header as bytes in little endian
             hdr = struct.pack("<l",self.nVersion)
-            hdr += int(self.hashPrevBlock,16).to_bytes(HASHPREVBLOCK_LEN,"little")
-            hdr += int(self.hashMerkleRoot,16).to_bytes(HASHMERKLEROOT_LEN,"little")
+            hdr += self.get_hashPrevBlock(raw=True)
+            hdr += self.get_hashMerkleRoot(raw=True)
             hdr += struct.pack("<l",self.nTime)
             hdr += struct.pack("<l",self.nBits)
             hdr += struct.pack("<l",self.nNonce)
@@ -567,7 +1309,7 @@ class BtcBlk:
         self.hash=dSHA256(self.hdr)
         self.height=height
 
-        self.target = nBits_to_Target( struct.pack("<l",self.nBits),False )
+        self.target = nBits_to_Target_cached( struct.pack("<l",self.nBits),False )
         self.bdifficulty=MAX_BTARGET/self.target
         self.pdifficutly=MAX_PTARGET/self.target
         self.tdifficutly=MAX_REGTEST_TARGET/self.target
@@ -578,19 +1320,31 @@ class BtcBlk:
         #print("difficulty: ",self.bdifficulty)
         if strict:
             # check if block meets target
-            assert int(self.hash,16) <= self.target
+            assert dbytes_to_int(bytes.fromhex(self.hash)) <= self.target
 
-    def check_btc_hdr(self,hdr):
+    @classmethod
+    def from_hdr_lazy(cls,hdr,height=None,strict=True):
+        """ Opt-in lazy header, the drop-in for BtcBlk(hdr=...,height=...,strict=...) where only
+        the header is needed. Returns a BtcHdr, which decodes the fields, hash and target on
+        first access and has no txs. strict checks the proof-of-work right away, as BtcBlk does.
+        """
+        return BtcHdr(hdr,height=height,strict=strict)
+
+    @staticmethod
+    def check_btc_hdr(hdr):
         if type(hdr) is bytes:
             #print("bytes hdr")
             assert len(hdr) == 80, "Header length not 80 bytes"
             hdr_bytes_little = hdr
+        elif type(hdr) is bytearray or type(hdr) is memoryview:
+            assert len(hdr) == 80, "Header length not 80 bytes"
+            hdr_bytes_little = bytes(hdr)
         elif type(hdr) is str:
             #print("str hdr")
             if hdr[:2] == "0x":
                 hdr = hdr[2:]
             assert len(hdr) == 80*2 or len(hdr) == (80*2)-1, "Header length not 80*2 chars"
-            hdr_bytes_little = int(hdr,16).to_bytes(80,"big")
+            hdr_bytes_little = bytes.fromhex(hdr.zfill(80*2))
         elif type(hdr) is int:
             #print("int hdr")
             assert hdr < 1<<80*8  and hdr > 1<<79*8, "Header length not in 80 bytes range"
@@ -636,7 +1390,7 @@ class BtcBlk:
             # returns little endian raw bytes
             return hashPrevBlock_little
         else:
-            return int(hashPrevBlock_little.hex(),16).to_bytes(32,"little").hex()
+            return dbytes_to_hexstr(hashPrevBlock_little)
 
     def getHashMerkleRootFromHeader(self,hdr,raw=False):
         hashMerkleRoot_little = self._getXFromHeader(hdr,
@@ -646,7 +1400,7 @@ class BtcBlk:
             # returns little endian raw bytes
             return hashMerkleRoot_little
         else:
-            return int(hashMerkleRoot_little.hex(),16).to_bytes(32,"little").hex()
+            return dbytes_to_hexstr(hashMerkleRoot_little)
 
     def getNTimeFromHeader(self,hdr,raw=False):
         nTime_little = self._getXFromHeader(hdr,
@@ -695,8 +1449,8 @@ class BtcBlk:
         elif outputformat=="string":
             # little endian string
             hdr = bytes.hex(struct.pack("<l",self.nVersion))
-            hdr += bytes.hex(int(self.hashPrevBlock,16).to_bytes(HASHPREVBLOCK_LEN,"little"))
-            hdr += bytes.hex(int(self.hashMerkleRoot,16).to_bytes(HASHMERKLEROOT_LEN,"little"))
+            hdr += bytes.hex(self.get_hashPrevBlock(raw=True))
+            hdr += bytes.hex(self.get_hashMerkleRoot(raw=True))
             hdr += bytes.hex(struct.pack("<l",self.nTime))
             hdr += bytes.hex(struct.pack("<l",self.nBits))
             hdr += bytes.hex(struct.pack("<l",self.nNonce))
@@ -737,7 +1491,7 @@ class BtcBlk:
     def hashPrevBlock(self,hashPrevBlock):
         if type(hashPrevBlock) is bytes:
             assert len(hashPrevBlock) == HASHPREVBLOCK_LEN, "hashPrevBlock invalid length"
-            self.__hashPrevBlock = hashPrevBlock.hex().to_bytes(HASHPREVBLOCK_LEN,"little").hex()
+            self.__hashPrevBlock = dbytes_to_hexstr(hashPrevBlock)
         elif type(hashPrevBlock) is str:
             assert len(hashPrevBlock) == HASHPREVBLOCK_LEN*2 or len(hashPrevBlock) == (HASHPREVBLOCK_LEN*2)-1, "hashPrevBlock invalid length"
             self.__hashPrevBlock = hashPrevBlock
@@ -751,7 +1505,7 @@ class BtcBlk:
     def get_hashPrevBlock(self,raw=False):
         if raw:
             # return little endian representation of hash as bytes
-            return int(self.hashPrevBlock,16).to_bytes(HASHPREVBLOCK_LEN,"little")
+            return hexstr_to_dbytes(self.hashPrevBlock.zfill(HASHPREVBLOCK_LEN*2))
         else:
             # return big endian (standard) represenatioan of hash as hex string
             return self.hashPrevBlock
@@ -766,7 +1520,7 @@ class BtcBlk:
     def hashMerkleRoot(self,hashMerkleRoot):
         if type(hashMerkleRoot) is bytes:
             assert len(hashMerkleRoot) == HASHMERKLEROOT_LEN, "hashMerkleRoot invalid length"
-            self.__hashMerkleRoot = hashMerkleRoot.hex().to_bytes(HASHMERKLEROOT_LEN,"little").hex()
+            self.__hashMerkleRoot = dbytes_to_hexstr(hashMerkleRoot)
         elif type(hashMerkleRoot) is str:
             assert len(hashMerkleRoot) == HASHMERKLEROOT_LEN*2 or len(hashMerkleRoot) == (HASHMERKLEROOT_LEN*2)-1, "hashMerkleRoot invalid length"
             self.__hashMerkleRoot = hashMerkleRoot
@@ -780,7 +1534,7 @@ class BtcBlk:
     def get_hashMerkleRoot(self,raw=False):
         if raw:
             # return little endian representation of hash as bytes
-            return int(self.hashMerkleRoot,16).to_bytes(HASHMERKLEROOT_LEN,"little")
+            return hexstr_to_dbytes(self.hashMerkleRoot.zfill(HASHMERKLEROOT_LEN*2))
         else:
             # return big endian (standard) represenatioan of hash as hex string
             return self.hashMerkleRoot
@@ -848,6 +1602,7 @@ class BtcBlk:
         self.blk = blk
         self.hdr = self.parse_btc_hdr(hdr=blk[:80])
         self.data = blk[80:]
+        raw = blk
         blk = blk[80:]
         # tx_count, var_int
         #print("blk bytes start = ",blk[:9].hex())
@@ -855,7 +1610,6 @@ class BtcBlk:
         #print("tx_count var_int = ",var_int)
         self.tx_count = var_int[1]
         self.tx_count_raw = blk[0:var_int[0]]
-        blk = blk[var_int[0]:]
         #print("tx_n = ",tx_n)
         if tx_n is None:
             tx_n = self.tx_count
@@ -863,14 +1617,302 @@ class BtcBlk:
         #print("tx_count = ",self.tx_count)
 
         # txs, Bitcoin transactions
+        # find the end of each tx by offset first and only copy the tx itself,
+        # instead of copying the remaining block after every tx
         self.txs = list()
-        i = 0
+        offset = HDR_LEN + var_int[0]
         for i in range(0,tx_n):
-            tx = BtcTx(rawbytes=blk)
+            tx_len = scan_btc_tx(raw,offset)
+            tx = BtcTx(rawbytes=raw[offset:offset + tx_len])
             self.txs.append(tx)
-            blk = blk[ tx.tx_len: ]
+            offset += tx_len
         return
 
+class BtcHdr:
+    """ Compact Bitcoin block header.
+    Keeps only the 80 raw header bytes and decodes fields, hash, target and
+    difficulties lazily on first access. Provides the same header getters as BtcBlk,
+    so BtcBlk(hdr=...) can be replaced by BtcHdr(...) where only the header is needed.
+    """
+    __slots__ = ("hdr","height","_fields","_digest","_hash","_target")
+
+    _HDR_STRUCT = struct.Struct("<l32s32sLLL")
+
+    def __init__(self,hdr,height=None,strict=False):
+        if type(hdr) is not bytes:
+            hdr = BtcBlk.check_btc_hdr(hdr)
+        assert len(hdr) == HDR_LEN, "Header length not 80 bytes"
+        self.hdr = hdr
+        self.height = height
+        self._fields = None
+        self._digest = None
+        self._hash = None
+        self._target = None
+        if strict:
+            # check if block meets target
+            assert self.check_pow()
+
+    def _get_fields(self):
+        """ decode all header fields at once and cache them """
+        if self._fields is None:
+            self._fields = self._HDR_STRUCT.unpack(self.hdr)
+        return self._fields
+
+    def check_pow(self):
+        """ check if the header hash meets the target encoded in nBits """
+        return dbytes_to_int(endSwap(self.digest)) <= self.target
+
+    # --- hash ---
+    @property
+    def digest(self):
+        """ raw double SHA256 digest of the header, as dSHA256 with raw=True """
+        if self._digest is None:
+            self._digest = dSHA256(self.hdr,raw=True)
+        return self._digest
+
+    @property
+    def hash(self):
+        """ block hash as big endian hex string """
+        if self._hash is None:
+            self._hash = dbytes_to_hexstr(self.digest)
+        return self._hash
+
+    # --- target and difficulty ---
+    @property
+    def target(self):
+        if self._target is None:
+            self._target = nBits_to_Target_cached(self.get_nBits(raw=True),big_endian=False)
+        return self._target
+
+    @property
+    def bdifficulty(self):
+        return MAX_BTARGET/self.target
+
+    @property
+    def pdifficutly(self):
+        return MAX_PTARGET/self.target
+
+    @property
+    def tdifficutly(self):
+        return MAX_REGTEST_TARGET/self.target
+
+    # --- header fields ---
+    @property
+    def nVersion(self):
+        return self._get_fields()[0]
+
+    @property
+    def hashPrevBlock(self):
+        return dbytes_to_hexstr(self._get_fields()[1])
+
+    @property
+    def hashMerkleRoot(self):
+        return dbytes_to_hexstr(self._get_fields()[2])
+
+    @property
+    def nTime(self):
+        return self._get_fields()[3]
+
+    @property
+    def nBits(self):
+        return self._get_fields()[4]
+
+    @property
+    def nBits_raw(self):
+        return self.get_nBits(raw=True)
+
+    @property
+    def nNonce(self):
+        return self._get_fields()[5]
+
+    def get_nVersion(self,raw=False):
+        if raw:
+            # returns little endian raw bytes
+            return self.hdr[0:NVERSION_LEN]
+        else:
+            return self.nVersion
+
+    def get_hashPrevBlock(self,raw=False):
+        if raw:
+            # return little endian representation of hash as bytes
+            return self._get_fields()[1]
+        else:
+            # return big endian (standard) represenatioan of hash as hex string
+            return self.hashPrevBlock
+
+    def get_hashMerkleRoot(self,raw=False):
+        if raw:
+            # return little endian representation of hash as bytes
+            return self._get_fields()[2]
+        else:
+            # return big endian (standard) represenatioan of hash as hex string
+            return self.hashMerkleRoot
+
+    def get_nTime(self,raw=False):
+        if raw:
+            # returns little endian raw bytes
+            return self.hdr[NTIME_OFFSET:NBITS_OFFSET]
+        else:
+            return self.nTime
+
+    def get_nBits(self,raw=False):
+        if raw:
+            # returns little endian raw bytes
+            return self.hdr[NBITS_OFFSET:NNONCE_OFFSET]
+        else:
+            return self.nBits
+
+    def get_nNonce(self,raw=False):
+        if raw:
+            # returns little endian raw bytes
+            return self.hdr[NNONCE_OFFSET:HDR_LEN]
+        else:
+            return self.nNonce
+
+    def get_hdr(self,outputformat="dict"):
+        """ return btc header in specified format """
+        if outputformat=="bytes":
+            return self.hdr
+        elif outputformat=="dict":
+            return {"nVersion":self.nVersion,
+                "hashPrevBlock":self.hashPrevBlock,
+                "hashMerkleRoot":self.hashMerkleRoot,
+                "nTime":self.nTime,
+                "nBits":self.nBits,
+                "nBits_raw":self.nBits_raw,
+                "nNonce":self.nNonce}
+        elif outputformat=="string":
+            # little endian string
+            return self.hdr.hex()
+        else:
+            assert False, "Wrong output format given, must be either 'dict', 'bytes' or 'string'"
+
+    def __str__(self):
+        """ String represenation of class is the header as hex string """
+        return self.get_hdr(outputformat="string")
+
+class BtcBlkView:
+    """ Lazy view on a raw Bitcoin block.
+    Only the transaction boundaries are indexed on construction. Transactions are parsed
+    into BtcTx objects when accessed and txids are hashed from the raw slices when requested,
+    nothing of either is kept. Use BtcBlk(blk=...) if all transactions are needed as objects.
+    txids are the precomputed raw txids of all transactions packed back to back, e.g., from a
+    BtcBlkArchive, they are then returned instead of being hashed.
+    """
+    __slots__ = ("blk","height","tx_count","txids","_offsets","_wit","_hdr")
+
+    def __init__(self,blk,height=None,tx_n=None,txids=None):
+        assert type(blk) in (bytes,bytearray,memoryview), "blk must be bytes!"
+        self.blk = memoryview(blk)
+        self.height = height
+        self._hdr = None
+
+        offset = HDR_LEN
+        vlen,self.tx_count = vint_at(self.blk,offset)
+        offset += vlen
+        if tx_n is None:
+            tx_n = self.tx_count
+        assert tx_n <= self.tx_count,"Number of tx to parse higher than available tx!"
+        assert txids is None or len(txids) == self.tx_count*32, "txids must be 32 bytes per tx"
+        self.txids = txids
+
+        # start offset of every tx plus the end of the last one
+        self._offsets = array.array("Q",[offset])
+        # start of the witnesses of every segwit tx, 0 for non segwit txs
+        self._wit = array.array("Q")
+        for i in range(0,tx_n):
+            stripped = list()
+            offset += scan_btc_tx(self.blk,offset,stripped=stripped)
+            self._offsets.append(offset)
+            if len(stripped) == 1:
+                self._wit.append(0)
+            else:
+                self._wit.append(stripped[1][0] + stripped[1][1])
+
+    def __len__(self):
+        """ number of indexed transactions """
+        return len(self._offsets) - 1
+
+    def __getitem__(self,i):
+        return self.get_tx(i)
+
+    def __iter__(self):
+        for i in range(0,len(self)):
+            yield self.get_tx(i)
+
+    # --- header ---
+    @property
+    def hdr(self):
+        if self._hdr is None:
+            self._hdr = BtcHdr(bytes(self.blk[:HDR_LEN]),height=self.height)
+        return self._hdr
+
+    @property
+    def hash(self):
+        return self.hdr.hash
+
+    @property
+    def hashPrevBlock(self):
+        return self.hdr.hashPrevBlock
+
+    @property
+    def hashMerkleRoot(self):
+        return self.hdr.hashMerkleRoot
+
+    def get_hashPrevBlock(self,raw=False):
+        return self.hdr.get_hashPrevBlock(raw=raw)
+
+    def get_hashMerkleRoot(self,raw=False):
+        return self.hdr.get_hashMerkleRoot(raw=raw)
+
+    # --- transactions ---
+    def _index(self,i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Transaction index out of range")
+        return i
+
+    def get_tx_raw(self,i):
+        """ raw serialized transaction i, including witnesses, as memoryview into the block """
+        i = self._index(i)
+        return self.blk[self._offsets[i]:self._offsets[i+1]]
+
+    def is_segwit(self,i):
+        return self._wit[self._index(i)] != 0
+
+    def get_tx(self,i):
+        """ parse transaction i into a new BtcTx """
+        return BtcTx(rawbytes=self.get_tx_raw(i))
+
+    def get_txid(self,i,raw=False):
+        """ txid of transaction i over the serialization without witnesses,
+        as hex string or as raw digest (little endian) if raw
+        """
+        i = self._index(i)
+        if self.txids is not None:
+            digest = bytes(self.txids[i*32:(i+1)*32])
+            return digest if raw else dbytes_to_hexstr(digest)
+        start = self._offsets[i]
+        end = self._offsets[i+1]
+        wit = self._wit[i]
+        if wit == 0:
+            return dSHA256(self.blk[start:end],raw=raw)
+        # skip marker and flag as well as the witnesses
+        return dSHA256_spans(self.blk,((start,4),(start + 6,wit - start - 6),(end - 4,4)),raw=raw)
+
+    def get_wtxid(self,i,raw=False):
+        """ wtxid of transaction i over the full serialization """
+        return dSHA256(self.get_tx_raw(i),raw=raw)
+
+    def get_txids(self,raw=False):
+        """ txids of all indexed transactions in block order """
+        return [ self.get_txid(i,raw=raw) for i in range(0,len(self)) ]
+
+    def get_wtxids(self,raw=False):
+        """ wtxids of all indexed transactions in block order """
+        return [ self.get_wtxid(i,raw=raw) for i in range(0,len(self)) ]
+
 class BtcTx:
     def __init__(self,rawbytes=None,
                       nVersion=None,
@@ -884,20 +1926,46 @@ class BtcTx:
         if rawbytes is not None:
             self.parse_btc_tx(tx=rawbytes)
         else:
+            self._raw=None
             self.nVersion=nVersion
             self.nVersion_raw=struct.pack("<l",nVersion) # int32_t
-            self.flag=flag # 2 bytes
+            # flag is given as its 2 raw bytes, marker 0x00 and flag, or as the flag byte as int.
+            # self.flag holds the flag byte as int and self.flag_raw the 2 raw bytes, as parsed
+            if flag is None:
+                self.flag=None
+                self.flag_raw=None
+            elif type(flag) is int:
+                self.flag=flag
+                self.flag_raw=b"\x00" + bytes([flag])
+            else:
+                assert len(flag) == 2 and flag[0] == 0, "Invalid flag, must be the marker 0x00 and the flag byte"
+                self.flag=flag[1]
+                self.flag_raw=bytes(flag)
+            if self.flag is not None:
+                assert tx_wit is not None and len(tx_wit) == len(tx_in), "Witness flag set, tx_wit must hold one witness stack per input"
+            else:
+                assert tx_wit is None, "Witnesses given but no flag set"
             self.tx_in_cnt=tx_in_cnt
             self.tx_in_cnt_raw=int_to_vint(tx_in_cnt) # var_int
             self.tx_in=tx_in
             self.tx_out_cnt=tx_out_cnt
             self.tx_out_cnt_raw=int_to_vint(tx_out_cnt) # var_int
             self.tx_out=tx_out
-            self.tx_wit=tx_wit # TODO
+            self.tx_wit=tx_wit # list of witness stacks, one list of items per input
+            self.tx_wit_raw=None
+            if tx_wit is not None:
+                self.tx_wit_raw = b"".join([ int_to_vint(len(stack)) + b"".join([ int_to_vint(len(item)) + item for item in stack ])
+                                             for stack in tx_wit ])
             self.nLockTime=nLockTime
             self.nLockTime_raw=struct.pack("<L",nLockTime)
             self.txb = self.get_tx("bytes")
+            self.wtxb = self.get_tx("wbytes")
+        # the txid is computed without witnesses, the wtxid over the full serialization
         self.txhash = dSHA256(self.txb)
+        if self.flag is None:
+            self.wtxhash = self.txhash
+        else:
+            self.wtxhash = dSHA256(self.wtxb)
 
     def parse_coinbase(self):
         """ Chekcs if this transaction is a valid coinbase transaction, and if so returns
@@ -911,21 +1979,25 @@ class BtcTx:
         blk_height = int.from_bytes(cb.script_sig[1:1+blk_height_len],"little")
         assert 2 <= len(cb.script_sig) and len(cb.script_sig) <= 100, "Invalid coinbase length, must be between 2 and 100 bytes"
 
-        # extract the raw coinbase transaction up to, but not including the coinbase
-        assert self.flag is None and self.tx_wit is None, "Only works for non segwit coinbases"
-        coinbasetx_prefix = ( self.nVersion_raw +
-                              self.tx_in_cnt_raw +
-                              cb.prev_output_raw +
-                              cb.script_len_raw )
-
-        # extract the rest of the raw coinbase transaction after the coinbase
-        tx_out_raw = b""
-        for tx in self.tx_out:
-            tx_out_raw = tx_out_raw + tx.get_txout("bytes")
-        coinbasetx_suffix = ( cb.sequence_raw +
-                              self.tx_out_cnt_raw +
-                              tx_out_raw +
-                              self.nLockTime_raw )
+        # extract the raw coinbase transaction up to, but not including the coinbase.
+        # Prefix and suffix are taken from the serialization without witnesses,
+        # so they also hash to the txid of segwit coinbases
+        if self.is_unchanged():
+            # slice the parsed serialization, the coinbase is the single input
+            prefix_len = NVERSION_LEN + len(self.tx_in_cnt_raw) + len(cb.prev_output_raw) + len(cb.script_len_raw)
+            coinbasetx_prefix = self.txb[:prefix_len]
+            coinbasetx_suffix = self.txb[prefix_len + len(cb.script_sig):]
+        else:
+            coinbasetx_prefix = b"".join((self.nVersion_raw,
+                                          self.tx_in_cnt_raw,
+                                          cb.prev_output_raw,
+                                          cb.script_len_raw))
+
+            # extract the rest of the raw coinbase transaction after the coinbase
+            coinbasetx_suffix = b"".join([cb.sequence_raw,
+                                          self.tx_out_cnt_raw,
+                                          *[ tx.get_txout("bytes") for tx in self.tx_out ],
+                                          self.nLockTime_raw])
 
         return {"blk_height":blk_height,
                 "coinbase":cb.script_sig[1+blk_height_len:],
@@ -934,38 +2006,40 @@ class BtcTx:
                 "coinbasetx_suffix": coinbasetx_suffix}
 
     def get_tx(self,outputformat="dict"):
-        """ return tx data in specified format """
-        tx_out_raw = b""
-        for tx in self.tx_out:
-            tx_out_raw = tx_out_raw + tx.get_txout("bytes")
-
-        tx_in_raw = b""
-        for tx in self.tx_in:
-            tx_in_raw = tx_in_raw + tx.get_txin("bytes")
-
-
+        """ return tx data in specified format.
+        The serializations of a parsed tx are returned as parsed unless a field was replaced since,
+        otherwise they are joined from the raw fields in one go.
+        """
         if outputformat=="bytes":
-            if self.flag is not None:
-                return ( self.nVersion_raw +
-                         self.flag +
-                         self.tx_in_cnt_raw +
-                         tx_in_raw +
-                         self.tx_out_cnt_raw +
-                         tx_out_raw +
-                         self.tx_wit +
-                         self.nLockTime_raw )
-            else:
-                return ( self.nVersion_raw +
-                         self.tx_in_cnt_raw +
-                         tx_in_raw +
-                         self.tx_out_cnt_raw +
-                         tx_out_raw +
-                         self.nLockTime_raw )
+            # serialization without witnesses, as used for the txid
+            if self.is_unchanged():
+                return self.txb
+            return b"".join([self.nVersion_raw,
+                             self.tx_in_cnt_raw,
+                             *[ tx.get_txin("bytes") for tx in self.tx_in ],
+                             self.tx_out_cnt_raw,
+                             *[ tx.get_txout("bytes") for tx in self.tx_out ],
+                             self.nLockTime_raw])
+        elif outputformat=="wbytes":
+            # full serialization including witnesses, as used for the wtxid
+            if self.flag is None:
+                return self.get_tx("bytes")
+            if self.is_unchanged():
+                return self.wtxb
+            return b"".join([self.nVersion_raw,
+                             self.flag_raw,
+                             self.tx_in_cnt_raw,
+                             *[ tx.get_txin("bytes") for tx in self.tx_in ],
+                             self.tx_out_cnt_raw,
+                             *[ tx.get_txout("bytes") for tx in self.tx_out ],
+                             self.tx_wit_raw,
+                             self.nLockTime_raw])
 
         elif outputformat=="dict":
             return {"nVersion":self.nVersion,
                     "nVersion_raw":self.nVersion_raw,
                     "flag":self.flag,
+                    "flag_raw":self.flag_raw,
                     "tx_in_cnt":self.tx_in_cnt,
                     "tx_in_cnt_raw":self.tx_in_cnt_raw,
                     "tx_in":self.tx_in,
@@ -973,17 +2047,22 @@ class BtcTx:
                     "tx_out_cnt_raw":self.tx_out_cnt_raw,
                     "tx_out":self.tx_out,
                     "tx_wit":self.tx_wit,
+                    "tx_wit_raw":self.tx_wit_raw,
                     "nLockTime":self.nLockTime,
                     "nLockTime_raw":self.nLockTime_raw,
                     "txb":self.txb,
-                    "txhash":self.txhash
+                    "txhash":self.txhash,
+                    "wtxb":self.wtxb,
+                    "wtxhash":self.wtxhash
                    }
         else:
-            assert False, "Wrong output format given, must be either 'dict' or 'bytes'"
+            assert False, "Wrong output format given, must be either 'dict', 'bytes' or 'wbytes'"
 
     def parse_btc_tx(self,tx,tx_n=None):
         if type(tx) is bytes:
             tx_bytes_little = tx
+        elif type(tx) is bytearray or type(tx) is memoryview:
+            tx_bytes_little = bytes(tx)
         elif type(tx) is str:
             if tx[:2] == "0x":
                 tx = tx[2:]
@@ -994,82 +2073,108 @@ class BtcTx:
             assert False,"Invalid tx type, must be bytes,str or int!"
 
         txb = tx_bytes_little
+        # find the (offset,length) of every input and output first, so each one is parsed
+        # from its own slice instead of copying the remaining tx after every input and output
+        tx_in_spans = list()
+        tx_out_spans = list()
+        self.tx_len = scan_btc_tx(txb,0,tx_in_spans,tx_out_spans)
+
         # nVerison, 4 bytes
         self.nVersion = struct.unpack("<l",txb[0:4])[0] # int32_t
         self.nVersion_raw = txb[0:4]
-        txb = txb[4:]
-        self.tx_len = 4
+        offset = 4
         #print("nVersion = ",self.nVersion)
         #print("nVersion_raw = ",self.nVersion_raw)
 
         # flag if available, 0 or 2 bytes, if set must be \x00\x01 uint8_t[2]
-        if txb[:2] == b"\x00\x01":
-            self.flag_raw = txb[:2]
-            self.flag = 1
-            txb = txb[2:]
-            self.tx_len += 2
+        if txb[4:6] == b"\x00\x01":
+            self.flag_raw = txb[4:6]
+            self.flag = txb[5]
+            offset += 2
             #print("Falg_raw = ",self.flag_raw)
         else:
             self.flag = None
+            self.flag_raw = None
             self.tx_wit = None
+            self.tx_wit_raw = None
 
         # tx_in_cnt, var_int
-        var_int = vint_to_int(txb[:9])
-        self.tx_in_cnt = var_int[1]
-        self.tx_in_cnt_raw = txb[ :var_int[0] ]
-        txb = txb[ var_int[0]: ]
-        self.tx_len += var_int[0]
+        vlen,self.tx_in_cnt = vint_at(txb,offset)
+        self.tx_in_cnt_raw = txb[offset:offset + vlen]
+        offset += vlen
         #print("tx_in_cnt = ",self.tx_in_cnt)
         #print("tx_in_cnt_raw = ",self.tx_in_cnt_raw)
 
         # tx_in, transaction input(s)
         self.tx_in = list()
-        i = 0
-        prev_txin_len = 0
-        #print("tx_len = ",self.tx_len)
-        for i in range(0,self.tx_in_cnt):
-            txin = BtcTxIn(rawbytes=txb)
-            self.tx_len += txin.tx_in_len
-            self.tx_in.append(txin)
-            prev_txin_len = txin.tx_in_len
-            txb = txb[ prev_txin_len: ]
-
-        #print("tx_len = ",self.tx_len)
+        for off,ln in tx_in_spans:
+            self.tx_in.append(BtcTxIn(rawbytes=txb[off:off + ln]))
+            offset += ln
 
         # tx_out_cnt, var_int
-        var_int = vint_to_int(txb[:9])
-        self.tx_out_cnt = var_int[1]
-        self.tx_out_cnt_raw = txb[ :var_int[0] ]
-        txb = txb[var_int[0]:]
-        self.tx_len += var_int[0]
+        vlen,self.tx_out_cnt = vint_at(txb,offset)
+        self.tx_out_cnt_raw = txb[offset:offset + vlen]
+        offset += vlen
         #print("tx_out_cnt = ",self.tx_out_cnt)
         #print("tx_out_cnt_raw = ",self.tx_out_cnt)
 
         # tx_out, transaction output(s)
         self.tx_out = list()
-        i = 0
-        prev_txout_len = 0
-        for i in range(0,self.tx_out_cnt):
-            txout = BtcTxOut(rawbytes=txb)
-            self.tx_len += txout.tx_out_len
-            self.tx_out.append(txout)
-            prev_txout_len = txout.tx_out_len
-            txb = txb[ prev_txout_len: ]
-
-        # tx_witnesses, if flag
+        for off,ln in tx_out_spans:
+            self.tx_out.append(BtcTxOut(rawbytes=txb[off:off + ln]))
+            offset += ln
+
+        body_end = offset
+
+        # tx_witnesses, if flag, one stack of var int length prefixed items per input
         if self.flag is not None:
-            # TODO witnesses
-            assert False,"Witnesses not implemented"
+            self.tx_wit = list()
+            for i in range(0,self.tx_in_cnt):
+                vlen,items = vint_at(txb,offset)
+                offset += vlen
+                stack = list()
+                for j in range(0,items):
+                    vlen,item_len = vint_at(txb,offset)
+                    offset += vlen
+                    stack.append(txb[offset:offset + item_len])
+                    offset += item_len
+                self.tx_wit.append(stack)
+            self.tx_wit_raw = txb[body_end:offset]
 
         # lock_time, 4 bytes
-        self.nLockTime = struct.unpack("<L",txb[0:4])[0]
-        self.nLockTime_raw = txb[0:4]
-        txb = txb[4:]
-        self.tx_len += 4
+        self.nLockTime = struct.unpack("<L",txb[offset:offset + 4])[0]
+        self.nLockTime_raw = txb[offset:offset + 4]
+        offset += 4
+        assert offset == self.tx_len
 
-        self.txb = tx_bytes_little[0:self.tx_len]
+        self.wtxb = txb[0:self.tx_len]
+        if self.flag is not None:
+            # strip marker, flag and witnesses for the txid
+            self.txb = b"".join((self.nVersion_raw,txb[6:body_end],self.nLockTime_raw))
+        else:
+            self.txb = self.wtxb
+        # keep the parsed fields, the raw serialization is reused as long as none of them is replaced
+        self._raw = self._get_raw_fields()
         return
 
+    def _get_raw_fields(self):
+        """ raw fields, inputs and outputs making up the serialization """
+        return (self.nVersion_raw,
+                self.flag_raw,
+                self.tx_in_cnt_raw,
+                tuple(self.tx_in),
+                self.tx_out_cnt_raw,
+                tuple(self.tx_out),
+                self.tx_wit_raw,
+                self.nLockTime_raw)
+
+    def is_unchanged(self):
+        """ True if the tx was parsed and none of its raw fields, inputs or outputs was replaced since """
+        return ( self._raw is not None and
+                 self._raw == self._get_raw_fields() and
+                 all([ txin.is_unchanged() for txin in self.tx_in ]) and
+                 all([ txout.is_unchanged() for txout in self.tx_out ]) )
+
 class BtcTxIn:
     def __init__(self,rawbytes=None,
                       prev_txhash=None,
@@ -1080,6 +2185,7 @@ class BtcTxIn:
         if rawbytes is not None:
             self.parse_btc_txin(rawbytes=rawbytes)
         else:
+            self._raw = None
             self.prev_txhash = prev_txhash
             self.prev_txidx = prev_txidx
             self.prev_output_raw = self.prev_txhash + struct.pack("<L",self.prev_txidx)
@@ -1092,7 +2198,7 @@ class BtcTxIn:
     def get_txin(self,outputformat="dict"):
         """ return tx output in specified format """
         if outputformat=="bytes":
-            return self.prev_output_raw + self.script_len_raw + self.script_sig + self.sequence_raw
+            return b"".join(self._get_raw_fields())
 
         elif outputformat=="dict":
             return {"prev_txhash":self.prev_txhash,
@@ -1106,6 +2212,13 @@ class BtcTxIn:
         else:
             assert False, "Wrong output format given, must be either 'dict' or 'bytes'"
 
+    def _get_raw_fields(self):
+        return (self.prev_output_raw,self.script_len_raw,self.script_sig,self.sequence_raw)
+
+    def is_unchanged(self):
+        """ True if the input was parsed and none of its raw fields was replaced since """
+        return self._raw is not None and self._raw == self._get_raw_fields()
+
     def parse_btc_txin(self,rawbytes=None):
         assert rawbytes is not None,"rawbytes must not be None!"
 
@@ -1142,6 +2255,8 @@ class BtcTxIn:
         #print("sequence = ",self.sequence)
         #print("sequence_raw = ",self.sequence_raw)
 
+        # raw fields as parsed
+        self._raw = self._get_raw_fields()
         return rawbytes
 
 class BtcTxOut:
@@ -1153,6 +2268,7 @@ class BtcTxOut:
         if rawbytes is not None:
             self.parse_btc_txout(rawbytes=rawbytes)
         else:
+            self._raw = None
             self.value = value
             self.value_raw = struct.pack("<Q",value)
             self.script_len = script_len
@@ -1162,7 +2278,7 @@ class BtcTxOut:
     def get_txout(self,outputformat="dict"):
         """ return tx output in specified format """
         if outputformat=="bytes":
-            return self.value_raw + self.script_len_raw + self.script_pk
+            return b"".join(self._get_raw_fields())
 
         elif outputformat=="dict":
             return {"value":self.value,
@@ -1174,6 +2290,13 @@ class BtcTxOut:
         else:
             assert False, "Wrong output format given, must be either 'dict' or 'bytes'"
 
+    def _get_raw_fields(self):
+        return (self.value_raw,self.script_len_raw,self.script_pk)
+
+    def is_unchanged(self):
+        """ True if the output was parsed and none of its raw fields was replaced since """
+        return self._raw is not None and self._raw == self._get_raw_fields()
+
     def parse_btc_txout(self,rawbytes=None):
         assert rawbytes is not None,"rawbytes must not be None!"
 
@@ -1193,9 +2316,801 @@ class BtcTxOut:
         # script pub. key, uchar[]
         self.script_pk = rawbytes[0:self.script_len]
         rawbytes = rawbytes[self.script_len:]
+
+        # raw fields as parsed
+        self._raw = self._get_raw_fields()
         return rawbytes
 
+# --- Header and block storage ---
+class BtcHdrStore:
+    """ Memory-mapped binary header store with one 80 byte record per height.
+
+    <path>.hdr holds the raw headers back to back, starting at start_height.
+    <path>.idx holds a small header (magic, version, start height, count) followed by
+    (raw digest, height) entries sorted by digest for hash to height lookups.
+    Headers and ranges of headers are returned as zero-copy memoryview slices of the
+    mapped file, they must be released before the store is closed.
+    """
+    MAGIC = b"P2WH"
+    VERSION = 1
+    _IDX_HDR = struct.Struct("<4sIII")
+    _IDX_ENTRY = struct.Struct("<32sI")
+
+    def __init__(self,path):
+        self.path = path
+        with open(path + ".idx","rb") as idx_file:
+            magic,version,self.start_height,self.count = self._IDX_HDR.unpack(idx_file.read(self._IDX_HDR.size))
+        if magic != self.MAGIC or version != self.VERSION:
+            raise BtcHdrException("Invalid header store index or version!")
+        self._hdr_file = open(path + ".hdr","rb")
+        self._idx_file = open(path + ".idx","rb")
+        if self.count > 0:
+            self._hdrs = mmap.mmap(self._hdr_file.fileno(),0,access=mmap.ACCESS_READ)
+            self._idx = mmap.mmap(self._idx_file.fileno(),0,access=mmap.ACCESS_READ)
+            assert len(self._hdrs) == self.count*HDR_LEN, "Header store size does not match index"
+        else:
+            self._hdrs = None
+            self._idx = None
+
+    @classmethod
+    def create(cls,path,hdrs,start_height=0,chunk_hdrs=4096):
+        """ Write headers to a new store at path and return it opened """
+        entries = list()
+        height = start_height
+        with open(path + ".hdr","wb") as hdr_file:
+            chunk = list()
+            for hdr in itertools.chain(hdrs,[None]):
+                if hdr is not None:
+                    assert len(hdr) == HDR_LEN, "Header length not 80 bytes"
+                    chunk.append(bytes(hdr))
+                if len(chunk) == chunk_hdrs or (hdr is None and chunk):
+                    buf = b"".join(chunk)
+                    hdr_file.write(buf)
+                    digests = dSHA256_batch(buf)
+                    for i in range(0,len(chunk)):
+                        entries.append((digests[i*32:(i+1)*32],height))
+                        height += 1
+                    chunk = list()
+        entries.sort()
+        with open(path + ".idx","wb") as idx_file:
+            idx_file.write(cls._IDX_HDR.pack(cls.MAGIC,cls.VERSION,start_height,len(entries)))
+            idx_file.write(b"".join([ cls._IDX_ENTRY.pack(d,h) for d,h in entries ]))
+        return cls(path)
+
+    @classmethod
+    def import_hex_hdrs(cls,src,path,start_height=0):
+        """ Import a hex text file with one header per line, e.g., 500from300k.txt """
+        return cls.create(path,iter_hdrs(src,binary=False),start_height=start_height)
+
+    @classmethod
+    def import_json_blocks(cls,src,path):
+        """ Import the headers of a blockchain.info style JSON dump,
+        either a list of blocks as written by store_input_blocks or a single block.
+        The heights of the blocks must be contiguous.
+        """
+        blks = load_input_blocks(src)
+        if type(blks) is dict:
+            blks = [blks]
+        blks = sorted(blks,key=lambda b: b["height"])
+        for i in range(1,len(blks)):
+            assert blks[i]["height"] == blks[i-1]["height"] + 1, "Block heights not contiguous"
+        return cls.create(path,
+                          [ get_hdr_from_json_block(b) for b in blks ],
+                          start_height=blks[0]["height"])
+
+    @property
+    def end_height(self):
+        """ height after the last stored header """
+        return self.start_height + self.count
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self,height):
+        return self.start_height <= height < self.end_height
+
+    def get(self,height):
+        """ Return the header at height as zero-copy memoryview """
+        if height not in self:
+            raise IndexError("Height not in header store")
+        offset = (height - self.start_height)*HDR_LEN
+        return memoryview(self._hdrs)[offset:offset + HDR_LEN]
+
+    def range(self,start,end):
+        """ Return the headers of heights start up to but excluding end as one zero-copy memoryview """
+        assert start <= end, "start not smaller or equal end height"
+        if start not in self or end > self.end_height:
+            raise IndexError("Heights not in header store")
+        return memoryview(self._hdrs)[(start - self.start_height)*HDR_LEN:(end - self.start_height)*HDR_LEN]
+
+    def __iter__(self):
+        """ Iterate over all headers as bytes, e.g., for vrfy_hdr_chain """
+        for offset in range(0,self.count*HDR_LEN,HDR_LEN):
+            yield self._hdrs[offset:offset + HDR_LEN]
+
+    def height_of(self,blockHash):
+        """ Return the height of the header with the given hash (hex string or raw digest),
+        or None if it is not stored. Binary search over the mapped index. """
+        if type(blockHash) is str:
+            blockHash = hexstr_to_dbytes(blockHash)
+        assert len(blockHash) == 32, "Hash must be 32 bytes"
+        base = self._IDX_HDR.size
+        size = self._IDX_ENTRY.size
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi)//2
+            digest = self._idx[base + mid*size:base + mid*size + 32]
+            if digest < blockHash:
+                lo = mid + 1
+            elif digest > blockHash:
+                hi = mid
+            else:
+                return self._IDX_ENTRY.unpack_from(self._idx,base + mid*size)[1]
+        return None
+
+    def close(self):
+        if self._hdrs is not None:
+            self._hdrs.close()
+            self._idx.close()
+        self._hdr_file.close()
+        self._idx_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+class BtcBlkFile:
+    """ Memory-mapped Bitcoin Core style block file (blk*.dat).
+
+    Every block is stored as network magic, uint32_t length and the raw block. Blocks are
+    in the order they were received, not necessarily by height, and the end of a file may be
+    zero padded. Blocks are returned as lazy BtcBlkView on the mapped file, they must be
+    released before the file is closed.
+    """
+    _FRAME = struct.Struct("<4sL")
+
+    def __init__(self,path,magic=BLK_MAGIC_MAIN):
+        self.path = path
+        self.magic = magic
+        with open(path,"rb") as blk_file:
+            if os.fstat(blk_file.fileno()).st_size > 0:
+                self._blks = mmap.mmap(blk_file.fileno(),0,access=mmap.ACCESS_READ)
+            else:
+                self._blks = None
+
+    def records(self):
+        """ Iterate over the (offset,length) of every raw block in the file, without parsing """
+        if self._blks is None:
+            return
+        offset = 0
+        size = len(self._blks)
+        while offset + self._FRAME.size <= size:
+            magic,length = self._FRAME.unpack_from(self._blks,offset)
+            if magic == b"\x00\x00\x00\x00":
+                break # zero padded end of file
+            if magic != self.magic:
+                raise BtcHdrException("Invalid block file magic at offset {}".format(offset))
+            offset += self._FRAME.size
+            if offset + length > size:
+                raise BtcHdrException("Truncated block at offset {}".format(offset))
+            yield (offset,length)
+            offset += length
+
+    def get(self,offset,length,height=None):
+        """ Return the block at offset as lazy BtcBlkView """
+        return BtcBlkView(memoryview(self._blks)[offset:offset + length],height=height)
+
+    def get_hdr(self,offset):
+        """ Return the header of the block at offset as bytes """
+        return self._blks[offset:offset + HDR_LEN]
+
+    def __iter__(self):
+        """ Iterate over all blocks of the file as lazy BtcBlkView, in file order """
+        for offset,length in self.records():
+            yield self.get(offset,length)
+
+    def close(self):
+        if self._blks is not None:
+            self._blks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+def iter_blk_files(paths,magic=BLK_MAGIC_MAIN):
+    """ Iterate over all blocks of several blk*.dat files as lazy BtcBlkView, one file mapped at a time.
+    A file is unmapped once all of its views are released. """
+    for path in paths:
+        yield from BtcBlkFile(path,magic=magic)
+
+class BtcBlkIndex:
+    """ Height to block location index over a set of blk*.dat files.
+
+    The blocks are linked by hashPrevBlock and the longest chain is indexed, blocks of
+    shorter forks are left out. The index file holds a small header (magic, version, start height,
+    count, length of the file list), the blk file paths and one (raw digest, file, offset, length)
+    entry per height, so a block can be looked up by height without scanning the blk files again.
+    """
+    MAGIC = b"P2WB"
+    VERSION = 1
+    _IDX_HDR = struct.Struct("<4sIIII")
+    _IDX_ENTRY = struct.Struct("<32sIQL")
+
+    def __init__(self,path,magic=BLK_MAGIC_MAIN):
+        self.path = path
+        self.magic = magic
+        with open(path,"rb") as idx_file:
+            magic_idx,version,self.start_height,self.count,paths_len = self._IDX_HDR.unpack(idx_file.read(self._IDX_HDR.size))
+            if magic_idx != self.MAGIC or version != self.VERSION:
+                raise BtcHdrException("Invalid block index or version!")
+            self.paths = json.loads(idx_file.read(paths_len))
+            self._entries = idx_file.read(self.count*self._IDX_ENTRY.size)
+        assert len(self._entries) == self.count*self._IDX_ENTRY.size, "Block index truncated"
+        self._files = dict()
+
+    @classmethod
+    def create(cls,path,blk_paths,start_height=None,magic=BLK_MAGIC_MAIN):
+        """ Scan the headers of all blocks in blk_paths and write the index of the longest chain to path.
+        The height of the first indexed block is start_height, by default 0 for the genesis block
+        or the height in the coinbase (BIP34) otherwise.
+        """
+        blks = dict() # digest -> (prev digest, file, offset, length)
+        for i,blk_path in enumerate(blk_paths):
+            with BtcBlkFile(blk_path,magic=magic) as blk_file:
+                for offset,length in blk_file.records():
+                    hdr = blk_file.get_hdr(offset)
+                    blks[dSHA256(hdr,raw=True)] = (hdr[4:36],i,offset,length)
+
+        # chain length up to every block, iteratively to not hit the recursion limit
+        depth = dict()
+        for digest in blks:
+            chain = list()
+            while digest in blks and digest not in depth:
+                chain.append(digest)
+                digest = blks[digest][0]
+            d = depth.get(digest,0)
+            for digest in reversed(chain):
+                d += 1
+                depth[digest] = d
+
+        # walk back from the tip of the longest chain
+        chain = list()
+        if depth:
+            digest = max(depth,key=depth.get)
+            while digest in blks:
+                chain.append(digest)
+                digest = blks[digest][0]
+            chain.reverse()
+            if start_height is None:
+                if blks[chain[0]][0] == CB_TXHASH:
+                    start_height = 0 # genesis block
+                else:
+                    prev,i,offset,length = blks[chain[0]]
+                    with BtcBlkFile(blk_paths[i],magic=magic) as blk_file:
+                        view = blk_file.get(offset,length)
+                        start_height = view.get_tx(0).parse_coinbase()["blk_height"]
+                        del view
+        if start_height is None:
+            start_height = 0
+
+        paths = json.dumps(list(blk_paths)).encode()
+        with open(path,"wb") as idx_file:
+            idx_file.write(cls._IDX_HDR.pack(cls.MAGIC,cls.VERSION,start_height,len(chain),len(paths)))
+            idx_file.write(paths)
+            idx_file.write(b"".join([ cls._IDX_ENTRY.pack(digest,*blks[digest][1:]) for digest in chain ]))
+        return cls(path,magic=magic)
+
+    @property
+    def end_height(self):
+        """ height after the last indexed block """
+        return self.start_height + self.count
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self,height):
+        return self.start_height <= height < self.end_height
+
+    def get_location(self,height):
+        """ Return the blk file path, offset and length of the block at height """
+        if height not in self:
+            raise IndexError("Height not in block index")
+        digest,i,offset,length = self._IDX_ENTRY.unpack_from(self._entries,(height - self.start_height)*self._IDX_ENTRY.size)
+        return (self.paths[i],offset,length)
+
+    def get_hash(self,height,raw=False):
+        """ Return the hash of the block at height, as hex string or raw digest """
+        if height not in self:
+            raise IndexError("Height not in block index")
+        digest = self._IDX_ENTRY.unpack_from(self._entries,(height - self.start_height)*self._IDX_ENTRY.size)[0]
+        return digest if raw else dbytes_to_hexstr(digest)
+
+    def get(self,height):
+        """ Return the block at height as lazy BtcBlkView, the blk file is mapped on first use """
+        path,offset,length = self.get_location(height)
+        if path not in self._files:
+            self._files[path] = BtcBlkFile(path,magic=self.magic)
+        return self._files[path].get(offset,length,height=height)
+
+    def range(self,start,end):
+        """ Iterate over the blocks of heights start up to but excluding end as lazy BtcBlkView """
+        for height in range(start,end):
+            yield self.get(height)
+
+    def close(self):
+        for blk_file in self._files.values():
+            blk_file.close()
+        self._files = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+class BtcBlkArchive:
+    """ Binary archive of raw blocks, e.g., imported from the JSON dumps of store_input_blocks.
+
+    <path>.blk holds the raw blocks back to back.
+    <path>.txid holds the raw txids of all blocks back to back, in block and tx order.
+    <path>.idx holds a small header (magic, version, count) followed by one
+    (raw digest, height, offset, length, first txid, tx count) entry per block.
+    The index is read on open, the blocks and txids are mapped and returned as lazy
+    BtcBlkView on the mapped files, which must be released before the archive is closed.
+    """
+    MAGIC = b"P2WA"
+    VERSION = 1
+    _IDX_HDR = struct.Struct("<4sII")
+    _IDX_ENTRY = struct.Struct("<32sIQLQL")
+
+    def __init__(self,path):
+        self.path = path
+        with open(path + ".idx","rb") as idx_file:
+            magic,version,self.count = self._IDX_HDR.unpack(idx_file.read(self._IDX_HDR.size))
+            if magic != self.MAGIC or version != self.VERSION:
+                raise BtcHdrException("Invalid block archive index or version!")
+            self._entries = idx_file.read(self.count*self._IDX_ENTRY.size)
+        assert len(self._entries) == self.count*self._IDX_ENTRY.size, "Block archive index truncated"
+        self._heights = dict()
+        self._hashes = dict()
+        for i,entry in enumerate(self._IDX_ENTRY.iter_unpack(self._entries)):
+            assert entry[1] not in self._heights, "Duplicate height {} in block archive index".format(entry[1])
+            self._heights[entry[1]] = i
+            self._hashes[entry[0]] = i
+        self._blks = None
+        self._txids = None
+        if self.count > 0:
+            with open(path + ".blk","rb") as blk_file:
+                self._blks = mmap.mmap(blk_file.fileno(),0,access=mmap.ACCESS_READ)
+            with open(path + ".txid","rb") as txid_file:
+                self._txids = mmap.mmap(txid_file.fileno(),0,access=mmap.ACCESS_READ)
+
+    @classmethod
+    def create(cls,path,blks):
+        """ Write the (height, raw block) pairs of blks to a new archive at path and return it opened.
+        The txids are computed once here. A block given again at the same height is skipped,
+        e.g., from overlapping dumps, another block at the same height is rejected. """
+        entries = list()
+        digests = dict()
+        offset = 0
+        txid_n = 0
+        with open(path + ".blk","wb") as blk_file, open(path + ".txid","wb") as txid_file:
+            for height,blk in blks:
+                digest = dSHA256(bytes(blk[:HDR_LEN]),raw=True)
+                if height in digests:
+                    assert digests[height] == digest, "Conflicting blocks at height {}".format(height)
+                    continue # same block in several dumps
+                digests[height] = digest
+                view = BtcBlkView(blk)
+                txids = b"".join(view.get_txids(raw=True))
+                blk_file.write(view.blk)
+                txid_file.write(txids)
+                entries.append(cls._IDX_ENTRY.pack(digest,height,offset,len(view.blk),txid_n,view.tx_count))
+                offset += len(view.blk)
+                txid_n += view.tx_count
+                del view
+        with open(path + ".idx","wb") as idx_file:
+            idx_file.write(cls._IDX_HDR.pack(cls.MAGIC,cls.VERSION,len(entries)))
+            idx_file.write(b"".join(entries))
+        return cls(path)
+
+    @classmethod
+    def import_json_blocks(cls,srcs,path):
+        """ Import blockchain.info style JSON dumps with rawblock, either lists of blocks as written
+        by store_input_blocks or single blocks. srcs is one path or a list of paths. """
+        if type(srcs) is str:
+            srcs = [srcs]
+
+        def raw_blks():
+            for src in srcs:
+                blks = load_input_blocks(src)
+                if type(blks) is dict:
+                    blks = [blks]
+                for blk in blks:
+                    assert "rawblock" in blk, "Block {} has no rawblock".format(blk["height"])
+                    raw = bytes.fromhex(blk["rawblock"])
+                    assert dSHA256(raw[:HDR_LEN]) == blk["hash"], "Invalid block header or hash"
+                    yield blk["height"],raw
+                del blks
+        return cls.create(path,raw_blks())
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self,height):
+        return height in self._heights
+
+    @property
+    def heights(self):
+        """ heights of all archived blocks, in archive order """
+        return list(self._heights)
+
+    def _entry(self,i):
+        return self._IDX_ENTRY.unpack_from(self._entries,i*self._IDX_ENTRY.size)
+
+    def _view(self,i):
+        digest,height,offset,length,txid_start,tx_count = self._entry(i)
+        txids = memoryview(self._txids)[txid_start*32:(txid_start + tx_count)*32]
+        return BtcBlkView(memoryview(self._blks)[offset:offset + length],height=height,txids=txids)
+
+    def get(self,height):
+        """ Return the block at height as lazy BtcBlkView with its precomputed txids """
+        if height not in self._heights:
+            raise IndexError("Height not in block archive")
+        return self._view(self._heights[height])
+
+    def get_by_hash(self,blockHash):
+        """ Return the block with the given hash (hex string or raw digest) as lazy BtcBlkView """
+        digest = hexstr_to_dbytes(blockHash) if type(blockHash) is str else bytes(blockHash)
+        if digest not in self._hashes:
+            raise KeyError("Hash not in block archive")
+        return self._view(self._hashes[digest])
+
+    def get_hash(self,height,raw=False):
+        """ Return the hash of the block at height, as hex string or raw digest """
+        if height not in self._heights:
+            raise IndexError("Height not in block archive")
+        digest = self._entry(self._heights[height])[0]
+        return digest if raw else dbytes_to_hexstr(digest)
+
+    def range(self,start,end):
+        """ Iterate over the blocks of heights start up to but excluding end as lazy BtcBlkView """
+        for height in range(start,end):
+            yield self.get(height)
+
+    def __iter__(self):
+        """ Iterate over all blocks as lazy BtcBlkView, in archive order """
+        for i in range(0,self.count):
+            yield self._view(i)
+
+    def get_calldata(self,height,level="standard",counters=None):
+        """ Calldata of the block at height, see get_block_calldata. The Merkle tree is
+        built from the archived txids, which the standard level checks against the header. """
+        view = self.get(height)
+        calldata = get_block_calldata(*get_calldata_input_from_view(view),
+                                      level=level,
+                                      counters=counters,
+                                      txids=bytes(view.txids))
+        del view
+        return calldata
+
+    def close(self):
+        if self._blks is not None:
+            self._blks.close()
+            self._txids.close()
+            self._blks = None
+            self._txids = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+class BtcBlkRepo:
+    """ Repository over a directory of blockchain.info style JSON dumps, e.g., as written by
+    store_input_blocks, with one persisted height and hash index over all of them.
+
+    The index file (by default one per directory in REPO_INDEX_DIR, the dump directory is never
+    written to) holds a small header (magic, version,
+    count, length of the file list), the file names with their size and mtime as JSON, and one
+    (raw digest, height, file, position in file) entry per block sorted by height. Files which
+    changed since are indexed again on open, files which are no block dumps are skipped.
+    Blocks are returned as JSON dicts, only the dumps which hold them are parsed and the last
+    cache_files of them are kept. If the index can not be written, it is kept in memory only.
+    """
+    MAGIC = b"P2WJ"
+    VERSION = 1
+    _IDX_HDR = struct.Struct("<4sIII")
+    _IDX_ENTRY = struct.Struct("<32sIII")
+
+    def __init__(self,directory,index_path=None,cache_files=REPO_CACHE_FILES):
+        self.directory = directory
+        if index_path is None:
+            key = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()[:32]
+            index_path = os.path.join(REPO_INDEX_DIR,key + ".idx")
+        self.index_path = index_path
+        self._load = functools.lru_cache(maxsize=cache_files)(self._load_file)
+        self.refresh()
+
+    def _read_index(self):
+        """ Return the file list and entries of the persisted index, or None if missing or invalid """
+        try:
+            with open(self.index_path,"rb") as idx_file:
+                magic,version,count,files_len = self._IDX_HDR.unpack(idx_file.read(self._IDX_HDR.size))
+                if magic != self.MAGIC or version != self.VERSION:
+                    return None
+                files = json.loads(idx_file.read(files_len))
+                entries = idx_file.read(count*self._IDX_ENTRY.size)
+        except (OSError,struct.error,ValueError):
+            return None
+        if len(entries) != count*self._IDX_ENTRY.size:
+            return None
+        return files,list(self._IDX_ENTRY.iter_unpack(entries))
+
+    def _index_file(self,name):
+        """ (raw digest, height, position) of every block of a dump, empty if it is no block dump """
+        try:
+            blks = load_input_blocks(os.path.join(self.directory,name))
+        except (ValueError,UnicodeDecodeError):
+            return []
+        if type(blks) is dict:
+            blks = [blks]
+        if type(blks) is not list or not all([ type(b) is dict and "height" in b and "hash" in b for b in blks ]):
+            return []
+        return [ (hexstr_to_dbytes(b["hash"]),b["height"],pos) for pos,b in enumerate(blks) ]
+
+    def refresh(self):
+        """ Index new or changed dumps, drop removed ones and persist the index if it changed """
+        names = sorted([ e.name for e in os.scandir(self.directory)
+                         if e.is_file() and not e.name.startswith(".") and
+                            os.path.join(self.directory,e.name) != self.index_path ])
+        stats = { name: os.stat(os.path.join(self.directory,name)) for name in names }
+        files = [ [name,stats[name].st_size,stats[name].st_mtime_ns] for name in names ]
+
+        index = self._read_index()
+        old = dict() # file name -> entries of unchanged files
+        if index is not None:
+            old_files,old_entries = index
+            current = set([ tuple(f) for f in files ])
+            unchanged = { i: f[0] for i,f in enumerate(old_files) if tuple(f) in current }
+            for digest,height,i,pos in old_entries:
+                if i in unchanged:
+                    old.setdefault(unchanged[i],[]).append((digest,height,pos))
+            for f in old_files:
+                if tuple(f) in current and f[0] not in old:
+                    old[f[0]] = [] # unchanged file without blocks
+        changed = index is None or index[0] != files
+
+        entries = list()
+        for i,name in enumerate(names):
+            for digest,height,pos in (old[name] if name in old else self._index_file(name)):
+                entries.append((digest,height,i,pos))
+        entries.sort(key=lambda e: e[1])
+
+        self.files = names
+        self._heights = dict()
+        self._hashes = dict()
+        for digest,height,i,pos in entries:
+            if height in self._heights:
+                assert self._heights[height][0] == digest, "Conflicting blocks at height {}".format(height)
+                continue # same block in several dumps
+            self._heights[height] = (digest,i,pos)
+            self._hashes[digest] = height
+        self._load.cache_clear()
+
+        if changed:
+            files_json = json.dumps(files).encode()
+            tmp_path = "{}.{}.tmp".format(self.index_path,os.getpid())
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.index_path)),exist_ok=True)
+                with open(tmp_path,"wb") as idx_file:
+                    idx_file.write(self._IDX_HDR.pack(self.MAGIC,self.VERSION,len(entries),len(files_json)))
+                    idx_file.write(files_json)
+                    idx_file.write(b"".join([ self._IDX_ENTRY.pack(*e) for e in entries ]))
+                os.replace(tmp_path,self.index_path)
+            except OSError:
+                # e.g., read-only cache, the index is built again on the next open
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _load_file(self,i):
+        blks = load_input_blocks(os.path.join(self.directory,self.files[i]))
+        return [blks] if type(blks) is dict else blks
+
+    def __len__(self):
+        return len(self._heights)
+
+    def __contains__(self,height):
+        return height in self._heights
+
+    @property
+    def heights(self):
+        """ heights of all indexed blocks, ascending """
+        return sorted(self._heights)
+
+    def get(self,height):
+        """ Return the block at height as JSON dict """
+        if height not in self._heights:
+            raise IndexError("Height {} not in block repository".format(height))
+        digest,i,pos = self._heights[height]
+        return self._load(i)[pos]
+
+    def range(self,start,end):
+        """ Return the blocks of heights start up to but excluding end as list of JSON dicts,
+        e.g., for get_input_blocks_calldata. All heights must be in the repository. """
+        return [ self.get(height) for height in range(start,end) ]
+
+    def by_hash(self,blockHash):
+        """ Return the block with the given hash (hex string or raw digest) as JSON dict """
+        digest = hexstr_to_dbytes(blockHash) if type(blockHash) is str else bytes(blockHash)
+        if digest not in self._hashes:
+            raise KeyError("Hash not in block repository")
+        return self.get(self._hashes[digest])
+
+class CalldataCache:
+    """ On-disk cache of finished get_block_calldata records, one file per block hash.
+
+    Records are stored under <path>/v<VERSION>/<block hash> together with VERSION, so
+    changing the calldata format only requires bumping VERSION to invalidate old records.
+    Every record keeps the verification level (see VRFY_LEVELS) it was prepared at, and is
+    only returned for that level or a lower one, so a stricter level prepares it again.
+    A record is only returned if its header still hashes to the requested block hash.
+    The records are pickled, the cache directory must only be writable by trusted users.
+    """
+    VERSION = 2
+
+    def __init__(self,path):
+        self.path = os.path.join(path,"v{}".format(self.VERSION))
+        os.makedirs(self.path,exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self,blockHash_str):
+        assert len(blockHash_str) == 64, "Block hash must be a 64 char hex string"
+        return os.path.join(self.path,blockHash_str)
+
+    def get(self,blockHash_str,level="trusted"):
+        """ Return the cached calldata of the block, prepared at least at level, or None """
+        try:
+            with open(self._file(blockHash_str),"rb") as cache_file:
+                version,b_level,b = pickle.load(cache_file)
+        except Exception:
+            # missing, truncated or unreadable record, it is prepared and written again
+            version,b_level,b = None,None,None
+        if (version != self.VERSION or
+                b_level not in VRFY_LEVELS or
+                VRFY_LEVELS.index(b_level) < VRFY_LEVELS.index(level) or
+                b["blockHash_str"] != blockHash_str or
+                dSHA256(b["blockHeader_bytes_big"]) != blockHash_str):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return b
+
+    def put(self,b,level="standard"):
+        """ Store the calldata b of a block prepared at level, replacing the file atomically """
+        assert level in VRFY_LEVELS, "Verification level must be one of " + ", ".join(VRFY_LEVELS)
+        path = self._file(b["blockHash_str"])
+        tmp_path = "{}.{}.tmp".format(path,os.getpid())
+        with open(tmp_path,"wb") as cache_file:
+            pickle.dump((self.VERSION,level,b),cache_file,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path,path)
+
+    def __contains__(self,blockHash_str):
+        return os.path.exists(self._file(blockHash_str))
+
+class VrfyCounters:
+    """ Number of runs and total time in seconds per calldata check, see get_block_calldata """
+
+    def __init__(self):
+        self.runs = dict()
+        self.seconds = dict()
+
+    def add(self,name,start):
+        """ Count a run of the check name which started at time.perf_counter() start """
+        self.runs[name] = self.runs.get(name,0) + 1
+        self.seconds[name] = self.seconds.get(name,0.0) + time.perf_counter() - start
+
+    def update(self,other):
+        """ Add the runs and times of other VrfyCounters """
+        for name,runs in other.runs.items():
+            self.runs[name] = self.runs.get(name,0) + runs
+            self.seconds[name] = self.seconds.get(name,0.0) + other.seconds[name]
+
+    def clear(self):
+        self.runs = dict()
+        self.seconds = dict()
+
+    def __repr__(self):
+        return ", ".join([ "{}: {} runs {:.6f} s".format(name,self.runs[name],self.seconds[name]) for name in self.runs ])
+
+# counters of all calldata checks without explicit counters
+CALLDATA_COUNTERS = VrfyCounters()
+
+# --- Block fetching ---
+class BtcBlkSource:
+    """ HTTP source of blockchain.info style JSON blocks with their raw block.
+
+    block_url and rawblock_url are formatted with the height and the block hash. Requests which
+    time out, fail to connect or return 429 or 5xx are retried with exponential backoff,
+    other errors are raised. Each thread uses its own requests.Session, so connections are
+    reused. Subclass and override get_block and get_rawblock for sources of other formats.
+    """
+    BLOCK_URL = "https://blockchain.info/block-height/{height}?format=json"
+    RAWBLOCK_URL = "https://insight.bitpay.com/api/rawblock/{hash}"
+
+    def __init__(self,block_url=BLOCK_URL,rawblock_url=RAWBLOCK_URL,retries=FETCH_RETRIES,backoff=FETCH_BACKOFF,timeout=FETCH_TIMEOUT):
+        assert retries >= 0, "Number of retries must not be negative"
+        self.block_url = block_url
+        self.rawblock_url = rawblock_url
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """ requests.Session of the calling thread """
+        if not hasattr(self._local,"session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def get_json(self,url):
+        """ GET url and return the decoded JSON, retrying transient errors """
+        for attempt in range(0,self.retries + 1):
+            try:
+                r = self.session.get(url,timeout=self.timeout)
+                if r.status_code != 429 and r.status_code < 500:
+                    r.raise_for_status()
+                    return r.json()
+                error = requests.HTTPError("{} for url: {}".format(r.status_code,url),response=r)
+            except (requests.ConnectionError,requests.Timeout) as e:
+                error = e
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2**attempt)
+        raise error
+
+    def get_block(self,height):
+        blocks = self.get_json(self.block_url.format(height=height))
+        assert len(blocks["blocks"]) == 1,"fork at height" # check if there was a fork at height
+        return blocks["blocks"][0]
+
+    def get_rawblock(self,blockHash):
+        return self.get_json(self.rawblock_url.format(hash=blockHash))["rawblock"]
+
+    def fetch(self,height):
+        """ JSON block at height with its raw block as hex string in rawblock """
+        block = self.get_block(height)
+        block["rawblock"] = self.get_rawblock(block["hash"])
+        return block
+
 # --- Client ---
+# state getters of the EMR contract, read together by EMRC.state
+EMR_STATE_GETTERS = ("get_currentState",
+                     "_startHeight",
+                     "_kV",
+                     "_kB",
+                     "_startHash",
+                     "_remaining_init_cblocks",
+                     "_remaining_init_tblocks")
+
+# snapshot of the EMR state at blockNumber
+EMRState = collections.namedtuple("EMRState",
+                                  ["blockNumber",
+                                   "currentState",
+                                   "startHeight",
+                                   "kV",
+                                   "kB",
+                                   "startHash",
+                                   "remaining_init_cblocks",
+                                   "remaining_init_tblocks"])
+
 class EMRC:
     """ Ephemeral Mining Relay Client
     Deploys and manages an EMR
@@ -1225,6 +3140,9 @@ class EMRC:
 
         self.gas_number_payouts = 0
 
+        # next nonce per account for pipelined transactions
+        self.nonces = dict()
+
     def connect(self,path,compiler="/smartcode/contracts/solc",poa=False):
         """ connect to deployed contract """
         self.w3 = util.connect(host=self.host,
@@ -1271,13 +3189,50 @@ class EMRC:
 
         return self.check(1,startHeight,kV,kB,startHash,kV,kV+1)
 
+    # --- validity checks ---
+    # reject locally what the contract would reject anyway, saves the gas.
+    # Each returns the reason the submission is invalid or None.
+    @staticmethod
+    def cblock_invalid(blockHeader):
+        if len(blockHeader) != HDR_LEN:
+            return "invalid header length"
+        if not BtcHdr(bytes(blockHeader)).check_pow():
+            return "invalid header"
+        return None
+
+    @staticmethod
+    def tblock_invalid(blockHeader,blockCoinbase_pfx,merklePath):
+        # the tblock header has hashPrevBlock and hashMerkleRoot zeroed, so only
+        # the format of the header, coinbase prefix and Merkle path can be checked
+        if len(blockHeader) != HDR_LEN:
+            return "invalid header length"
+        if any(blockHeader[NVERSION_LEN:NVERSION_LEN + HASHPREVBLOCK_LEN + HASHMERKLEROOT_LEN]):
+            return "header fields not zeroed"
+        if len(merklePath) % 32 != 0:
+            return "invalid Merkle path length"
+        if not vrfy_coinbase_pfx(blockCoinbase_pfx):
+            return "invalid coinbase prefix"
+        return None
+
+    @staticmethod
+    def rblock_invalid(blockHeader,blockCoinbase,blockCoinbase_pfx,blockCoinbase_sfx,merklePath):
+        if len(merklePath) % 32 != 0:
+            return "invalid Merkle path length"
+        if not vrfy_coinbase_pfx(blockCoinbase_pfx):
+            return "invalid coinbase prefix"
+        cb_tx = b"".join((blockCoinbase_pfx,blockCoinbase,blockCoinbase_sfx))
+        if not vrfy_coinbase_path(blockHeader,cb_tx,merklePath):
+            return "invalid coinbase path"
+        return None
+
     def submit_cblock(self,
                       blockHeader,
                       blockHeight,
                       blockReward,
                       blockMiner,
                       validityChecks=False):
-        # TODO: implement validity checks
+        if validityChecks and self.cblock_invalid(blockHeader) is not None:
+            return False
         r = self.instance.functions._remaining_init_cblocks().call()
 
         tx_hash = self.instance.functions.submit_cblock(blockHeader,
@@ -1304,7 +3259,8 @@ class EMRC:
                       blockReward,
                       blockBribe,
                       validityChecks=False):
-        # TODO: implement validity checks
+        if validityChecks and self.tblock_invalid(blockHeader,blockCoinbase_pfx,merklePath) is not None:
+            return False
         ntb = self.instance.functions._number_tblocks().call()
 
         tx_hash = self.instance.functions.submit_tblock(blockHeader,
@@ -1340,9 +3296,12 @@ class EMRC:
                       blockCoinbase_pfx,
                       blockCoinbase_sfx,
                       merklePath,
-                      account=None):
+                      account=None,
+                      validityChecks=False):
         if account is None:
             account = self.w3.eth.accounts[0]
+        if validityChecks and self.rblock_invalid(blockHeader,blockCoinbase,blockCoinbase_pfx,blockCoinbase_sfx,merklePath) is not None:
+            return False
 
         event_filter = self.instance.events.New_rblock.createFilter(fromBlock='latest')
         tx_hash = self.instance.functions.submit_rblock(blockHeader,
@@ -1369,20 +3328,194 @@ class EMRC:
 
         return True
 
+    # --- pipelined submission ---
+    def _send(self,function,tx):
+        """ Send a contract function call as transaction with the next local nonce of its sender.
+        If sending fails the nonce is read from the node again on the next send. """
+        account = tx["from"]
+        if account not in self.nonces:
+            self.nonces[account] = self.w3.eth.getTransactionCount(account,"pending")
+        tx = dict(tx,nonce=self.nonces[account])
+        try:
+            tx_hash = function.transact(tx)
+        except Exception:
+            del self.nonces[account]
+            raise
+        self.nonces[account] += 1
+        return tx_hash
+
+    def _pipeline(self,blocks,calls,failed,workers=PIPELINE_WORKERS,timeout=PIPELINE_TIMEOUT):
+        """ Send all (index,function,tx) calls for blocks[index] back to back, then collect their
+        receipts concurrently. The nonces are read from the node once per pipeline, since
+        transactions may have been sent without them in between.
+        Returns a dict with the tx hashes and receipts per block (None if not sent or mined) and
+        the failures, given ones included, each with the index and height of the block. """
+        self.nonces = dict()
+        tx_hashes = [None]*len(blocks)
+        receipts = [None]*len(blocks)
+        failed = list(failed)
+
+        def fail(i,error):
+            failed.append({"index": i,"blockHeight": blocks[i]["blockHeight"],"tx_hash": tx_hashes[i],"error": error})
+
+        for i,function,tx in calls:
+            try:
+                tx_hashes[i] = self._send(function,tx)
+            except Exception as e:
+                # e.g., rejected by gas estimation, the block would have reverted
+                fail(i,str(e))
+
+        def wait(tx_hash):
+            return self.w3.eth.waitForTransactionReceipt(tx_hash,timeout=timeout)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = { pool.submit(wait,tx_hash): i for i,tx_hash in enumerate(tx_hashes) if tx_hash is not None }
+            for future in concurrent.futures.as_completed(futures):
+                i = futures[future]
+                try:
+                    receipts[i] = future.result()
+                except Exception as e:
+                    fail(i,str(e))
+                    continue
+                if receipts[i]["status"] != 1:
+                    fail(i,"reverted")
+        failed.sort(key=lambda f: f["index"])
+        return {"tx_hashes": tx_hashes,"receipts": receipts,"failed": failed}
+
+    @staticmethod
+    def _gas_used(result):
+        """ gas of all mined transactions of a pipeline, reverted ones included """
+        return sum([ r["gasUsed"] for r in result["receipts"] if r is not None ])
+
+    @staticmethod
+    def _succeeded(result):
+        return sum([ 1 for r in result["receipts"] if r is not None and r["status"] == 1 ])
+
+    def submit_cblocks(self,blocks,blockReward,blockMiner,gas=None,validityChecks=False):
+        """ Pipelined submit_cblock of all calldata dicts in blocks, see _pipeline for the result,
+        the phase succeeded if its failed list is empty.
+        Without gas the gas limit is estimated when sending, which requires the node to include
+        the previous transactions first (e.g., ganache's automine); give a limit otherwise. """
+        calls = list()
+        failed = list()
+        for i,b in enumerate(blocks):
+            error = self.cblock_invalid(b["blockHeader_bytes_big"]) if validityChecks else None
+            if error is not None:
+                failed.append({"index": i,"blockHeight": b["blockHeight"],"tx_hash": None,"error": error})
+                continue
+            tx = {"from": self.w3.eth.accounts[0],"value": blockReward}
+            if gas is not None:
+                tx["gas"] = gas
+            calls.append((i,
+                          self.instance.functions.submit_cblock(b["blockHeader_bytes_big"],
+                                                                b["blockHeight"],
+                                                                blockReward,
+                                                                blockMiner),
+                          tx))
+        result = self._pipeline(blocks,calls,failed)
+
+        gas_used = self._gas_used(result)
+        self.gas_total += gas_used
+        self.gas_init += gas_used
+        self.gas_submit_cblock += gas_used
+        self.gas_number_cblocks += self._succeeded(result)
+        return result
+
+    def submit_tblocks(self,blocks,blockReward,blockBribe,gas=None,validityChecks=False):
+        """ Pipelined submit_tblock of all calldata dicts in blocks, see submit_cblocks """
+        calls = list()
+        failed = list()
+        for i,b in enumerate(blocks):
+            error = self.tblock_invalid(b["tblockHeader_bytes_big"],b["cb_pfx"],b["mp_hashes_bytes_big"]) if validityChecks else None
+            if error is not None:
+                failed.append({"index": i,"blockHeight": b["blockHeight"],"tx_hash": None,"error": error})
+                continue
+            tx = {"from": self.w3.eth.accounts[0],"value": blockReward + blockBribe}
+            if gas is not None:
+                tx["gas"] = gas
+            calls.append((i,
+                          self.instance.functions.submit_tblock(b["tblockHeader_bytes_big"],
+                                                                b["cb_pfx"],
+                                                                b["blockHeight"],
+                                                                b["cb_sfx"],
+                                                                b["mp_hashes_bytes_big"],
+                                                                blockReward,
+                                                                blockBribe),
+                          tx))
+        result = self._pipeline(blocks,calls,failed)
+
+        # cblocks are not submitted in the same phase, so this holds for all tblocks of it
+        gas_used = self._gas_used(result)
+        self.gas_total += gas_used
+        if self.instance.functions._remaining_init_cblocks().call() > 0:
+            self.gas_init += gas_used
+        else:
+            self.gas_attack += gas_used
+        self.gas_submit_tblock += gas_used
+        self.gas_number_tblocks += self._succeeded(result)
+        return result
+
+    def submit_rblocks(self,blocks,account=None,gas=None,validityChecks=False):
+        """ Pipelined submit_rblock of all calldata dicts in blocks, see submit_cblocks.
+        A mined rblock without its New_rblock event is reported as failed. """
+        if account is None:
+            account = self.w3.eth.accounts[0]
+        calls = list()
+        failed = list()
+        for i,b in enumerate(blocks):
+            error = self.rblock_invalid(b["blockHeader_bytes_big"],b["cb"],b["cb_pfx"],b["cb_sfx"],b["mp_hashes_bytes_big"]) if validityChecks else None
+            if error is not None:
+                failed.append({"index": i,"blockHeight": b["blockHeight"],"tx_hash": None,"error": error})
+                continue
+            tx = {"from": account,"value": 0}
+            if gas is not None:
+                tx["gas"] = gas
+            calls.append((i,
+                          self.instance.functions.submit_rblock(b["blockHeader_bytes_big"],
+                                                                b["cb"],
+                                                                b["cb_pfx"],
+                                                                b["cb_sfx"],
+                                                                b["mp_hashes_bytes_big"]),
+                          tx))
+        result = self._pipeline(blocks,calls,failed)
+
+        for i,receipt in enumerate(result["receipts"]):
+            if receipt is None or receipt["status"] != 1:
+                continue
+            events = self.instance.events.New_rblock().processReceipt(receipt)
+            rblockHash = endSwap(dSHA256(blocks[i]["blockHeader_bytes_big"],raw=True))
+            if len(events) != 1 or events[0].args._rblockHash != rblockHash:
+                result["failed"].append({"index": i,"blockHeight": blocks[i]["blockHeight"],"tx_hash": result["tx_hashes"][i],"error": "no New_rblock event"})
+        result["failed"].sort(key=lambda f: f["index"])
+
+        gas_used = self._gas_used(result)
+        self.gas_total += gas_used
+        self.gas_attack += gas_used
+        self.gas_submit_rblock += gas_used
+        self.gas_number_rblocks += self._succeeded(result)
+        return result
+
     def payout(self,account=None):
         if ( account is None):
             account = self.w3.eth.accounts[0]
-        balance_account_before = self.w3.eth.getBalance(account)
-        balance_contract_before = self.w3.eth.getBalance(self.instance.address)
+        # balances right before sending, in one batch request
+        (balance_account_before,
+         balance_contract_before) = util.batch_request([("eth_getBalance",[account,"latest"],util.hex_to_int),
+                                                        ("eth_getBalance",[self.instance.address,"latest"],util.hex_to_int)],
+                                                       w3_instance=self.w3)
 
         tx_hash = self.instance.functions.payout().transact(
                 {"from":account,
                  "value":0})
         tx_receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
-        tx_info = self.w3.eth.getTransaction(tx_hash)
 
-        balance_account_after = self.w3.eth.getBalance(account)
-        balance_contract_after = self.w3.eth.getBalance(self.instance.address)
+        # balances after, at the block of the payout, and the gas price in one batch request
+        block = tx_receipt["blockNumber"]
+        (balance_account_after,
+         balance_contract_after,
+         gasPrice) = util.batch_request([("eth_getBalance",[account,util.block_param(block)],util.hex_to_int),
+                                         ("eth_getBalance",[self.instance.address,util.block_param(block)],util.hex_to_int),
+                                         ("eth_getTransactionByHash",[self.w3.toHex(tx_hash)],lambda tx: util.hex_to_int(tx["gasPrice"]))],
+                                        w3_instance=self.w3)
 
         self.gas_total += tx_receipt["gasUsed"]
         self.gas_payout += tx_receipt["gasUsed"]
@@ -1390,7 +3523,22 @@ class EMRC:
 
         #assert balance_account_before < balance_account_after
         #assert balance_contract_before > balance_contract_after
-        return balance_account_after - balance_account_before + tx_receipt["gasUsed"]*tx_info["gasPrice"]
+        return balance_account_after - balance_account_before + tx_receipt["gasUsed"]*gasPrice
+
+    def state(self,block_identifier=None):
+        """ Reads all state getters of the contract in one batch request against the
+        same block (the latest one if block_identifier is None) and returns an EMRState """
+        if block_identifier is None:
+            block_identifier = self.w3.eth.blockNumber
+        outputs = { f["name"]: [ o["type"] for o in f["outputs"] ]
+                    for f in self.instance.abi if f["type"] == "function" }
+        results = util.batch_call([ (self.instance.address,self.instance.encodeABI(fn_name=name))
+                                    for name in EMR_STATE_GETTERS ],
+                                  block_identifier,
+                                  w3_instance=self.w3)
+        values = [ self.w3.codec.decode_abi(outputs[name],result)[0]
+                   for name,result in zip(EMR_STATE_GETTERS,results) ]
+        return EMRState(block_identifier,*values)
 
     def check(self,
               currentState=None,
@@ -1402,35 +3550,23 @@ class EMRC:
               remaining_init_tblocks=None,
               printvalues=False):
         """ Helper function the gets and checks state of contract """
-        r = self.instance.functions.get_currentState().call()
+        state = self.state()
         if printvalues:
-            print("currentState = ",r)
+            print("currentState = ",state.currentState)
         if currentState is not None:
-            assert r == currentState
-
-        r = self.instance.functions._startHeight().call()
-        if startHash is not None:
-            assert r == startHeight
-
-        r = self.instance.functions._kV().call()
+            assert state.currentState == currentState
+        if startHeight is not None:
+            assert state.startHeight == startHeight
         if kV is not None:
-            assert r == kV
-
-        r = self.instance.functions._kB().call()
+            assert state.kV == kV
         if kB is not None:
-            assert r == kB
-
-        r = self.instance.functions._startHash().call()
+            assert state.kB == kB
         if startHash is not None:
-            assert r == startHash
-
-        r = self.instance.functions._remaining_init_cblocks().call()
+            assert state.startHash == startHash
         if remaining_init_cblocks is not None:
-            assert r == remaining_init_cblocks
-
-        r = self.instance.functions._remaining_init_tblocks().call()
+            assert state.remaining_init_cblocks == remaining_init_cblocks
         if remaining_init_tblocks is not None:
-            assert r == remaining_init_tblocks
+            assert state.remaining_init_tblocks == remaining_init_tblocks
 
         return True
 
@@ -0,0 +1,57 @@
+""" Sample blocks synthesized from the raw block 603268 of the test data, shared by
+test_BtcBlk.py and benchmark.py. Run from within ./client/ like both of them.
+"""
+import json
+
+import client
+
+RAW_BLOCK_SAMPLE = "../testdata/btc_blocks_json_samples/603268.raw"
+
+def load_raw_block_sample(path=RAW_BLOCK_SAMPLE):
+    """ load raw block sample as hex string """
+    with open(path) as json_file:
+        return json.load(json_file)["rawblock"]
+
+def calldata_sample_blks(blk_raw_hex=None):
+    """ blockchain.info style block list built from a raw block (by default block 603268),
+    with the fields get_input_block_calldata checks against. The height is the one of the coinbase. """
+    if blk_raw_hex is None:
+        blk_raw_hex = load_raw_block_sample()
+    bblk = client.BtcBlk(blk=bytes.fromhex(blk_raw_hex))
+    cbtx = bblk.txs[0]
+    return [{"hash": bblk.hash,
+             "height": cbtx.parse_coinbase()["blk_height"],
+             "mrkl_root": bblk.hashMerkleRoot,
+             "rawblock": blk_raw_hex,
+             "tx": [{"hash": cbtx.txhash,
+                     "inputs": [{"script": cbtx.tx_in[0].script_sig.hex()}]}]}]
+
+def calldata_sample_chain(n,blk_raw_hex=None):
+    """ chain of n copies of a raw block (by default block 603268), each header linked to the
+    previous one. All have the height of the coinbase, proof-of-work is not checked by the
+    calldata preparation. """
+    blk = calldata_sample_blks(blk_raw_hex)[0]
+    blk_raw = bytes.fromhex(blk["rawblock"])
+    blks = list()
+    prev = blk_raw[4:36]
+    for i in range(0,n):
+        raw = blk_raw[:4] + prev + blk_raw[36:]
+        prev = client.dSHA256(raw[:80],raw=True)
+        blks.append(dict(blk,hash=client.dbytes_to_hexstr(prev),rawblock=raw.hex()))
+    return blks
+
+def segwit_sample_blk(blk_raw=None):
+    """ raw block (by default block 603268) with a witness added to every tx. The txids and thus
+    the header stay valid. Returns the segwit block, the BtcBlk of the original and the segwit txs. """
+    if blk_raw is None:
+        blk_raw = bytes.fromhex(load_raw_block_sample())
+    bblk = client.BtcBlk(blk=blk_raw)
+    txs = list()
+    for i,tx in enumerate(bblk.txs):
+        if i == 0:
+            # witness reserved value of the coinbase
+            wit = b"\x01\x20" + b"\x00"*32
+        else:
+            wit = (b"\x02\x47" + b"\x30"*71 + b"\x21" + bytes([i%256])*33)*tx.tx_in_cnt
+        txs.append(tx.txb[:4] + b"\x00\x01" + tx.txb[4:-4] + wit + tx.txb[-4:])
+    return (blk_raw[:80] + client.int_to_vint(len(txs)) + b"".join(txs),bblk,txs)
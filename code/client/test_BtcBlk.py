@@ -4,6 +4,9 @@ import client
 import pytest
 
 import json
+import os
+
+from samples import calldata_sample_blks, calldata_sample_chain, segwit_sample_blk
 
 # --- test values ---
 hdr = "020000007ef055e1674d2e6551dba41cd214debbee34aeb544c7ec670000000000000000d3998963f80c5bab43fe8c26228e98d030edf4dcbe48a666f5c39e2d7a885c9102c86d536c890019593a470d"
@@ -46,6 +49,25 @@ def test_util():
     assert client.dSHA256(hdr_bytes,raw=True) == client.hexstr_to_dbytes(hdr_hash)
     assert client.dSHA256(hdr_bytes,raw=True,num=True) == client.dbytes_to_int(client.hexstr_to_dbytes(hdr_hash))
 
+def test_dSHA256_batch():
+    with open('../testdata/btc_hex_hdr_samples/500from300k.txt') as hdr_file:
+        hdrs = [ bytes.fromhex(line.strip()) for line in hdr_file ]
+    buf = b"".join(hdrs)
+    digests = b"".join([ client.dSHA256(h,raw=True) for h in hdrs ])
+
+    assert client.dSHA256_batch(buf) == digests
+    assert client.dSHA256_batch(memoryview(buf)) == digests
+    assert client.dSHA256_batch(buf,processes=2,cutoff=1) == digests
+    assert client.dSHA256_batch(buf,processes=None,cutoff=1) == digests
+    assert client.dSHA256_batch(b"") == b""
+    with pytest.raises(AssertionError):
+        client.dSHA256_batch(buf[:-1])
+
+    np = pytest.importorskip("numpy")
+    arr = client.dSHA256_batch(buf,outputformat="numpy")
+    assert arr.shape == (500,32)
+    assert arr[1].tobytes() == client.dSHA256(hdrs[1],raw=True)
+
 def test_init_hdr():
     bb = client.BtcBlk(hdr=hdr)
 
@@ -77,6 +99,54 @@ def test_init_hdr():
     assert str(bb) == hdr
     assert bb.get_hdr(outputformat="bytes") == hdr_bytes
 
+def test_init_lazy_hdr():
+    bh = client.BtcHdr(hdr_bytes)
+    bb = client.BtcBlk(hdr=hdr)
+
+    assert bh.nVersion == hdr_nVersion_int
+    assert bh.get_nVersion(raw=True) == hdr_nVersion_raw_bytes
+
+    assert bh.hashPrevBlock == hdr_hashPrevBlock_str
+    assert bh.get_hashPrevBlock(raw=True) == hdr_hashPrevBlock_raw_bytes
+
+    assert bh.hashMerkleRoot == hdr_hashMerkleRoot_str
+    assert bh.get_hashMerkleRoot(raw=True) == hdr_hashMerkleRoot_raw_bytes
+
+    assert bh.nTime == hdr_nTime_int
+    assert bh.get_nTime(raw=True) == hdr_nTime_raw_bytes
+
+    assert bh.nBits == hdr_nBits_int
+    assert bh.get_nBits(raw=True) == hdr_nBits_raw_bytes
+
+    assert bh.nNonce == hdr_nNonce_int
+    assert bh.get_nNonce(raw=True) == hdr_nNonce_raw_bytes
+
+    assert bh.hash == hdr_hash
+    assert bh.digest == client.dSHA256(hdr_bytes,raw=True)
+    assert bh.target == bb.target
+    assert bh.bdifficulty == bb.bdifficulty
+    assert bh.pdifficutly == bb.pdifficutly
+    assert bh.tdifficutly == bb.tdifficutly
+    assert bh.check_pow()
+    assert bh.get_hdr() == bb.get_hdr()
+    assert str(bh) == hdr
+    assert bh.get_hdr(outputformat="bytes") == hdr_bytes
+
+    assert client.BtcHdr(hdr,strict=True).hash == hdr_hash
+    assert client.BtcHdr(bytearray(hdr_bytes),height=300000).height == 300000
+    with pytest.raises(AttributeError):
+        bh.foo = 1
+
+    # opt-in of BtcBlk callers, checks the proof-of-work by default as BtcBlk
+    bl = client.BtcBlk.from_hdr_lazy(hdr,height=300000)
+    assert type(bl) is client.BtcHdr
+    assert bl.hash == hdr_hash and bl.height == 300000
+    assert bl.get_hdr() == bb.get_hdr()
+    bad = hdr_bytes[:76] + b"\x00"*4
+    with pytest.raises(AssertionError):
+        client.BtcBlk.from_hdr_lazy(bad)
+    assert client.BtcBlk.from_hdr_lazy(bad,strict=False).nNonce == 0
+
 def test_init_values():
     bb = client.BtcBlk(nVersion = hdr_nVersion_int,
                        hashPrevBlock = hdr_hashPrevBlock_str,
@@ -140,6 +210,46 @@ def test_mrkl_root():
     assert client.vrfy_mrkl_root(tx_hashes_bytes,hashMerkleRoot)
 
 
+def test_mrkl_root_raw():
+    def naive_root(hashes):
+        while len(hashes) > 1:
+            if len(hashes) % 2 != 0:
+                hashes = hashes + [hashes[-1]]
+            hashes = [ client.dSHA256(hashes[i] + hashes[i+1],raw=True) for i in range(0,len(hashes),2) ]
+        return hashes[0]
+
+    for n in (1,2,3,5,6,7,8,11,17):
+        hashes = [ client.dSHA256(bytes([i]),raw=True) for i in range(0,n) ]
+        copy = hashes.copy()
+        root = client.mrkl_root_raw(hashes)
+        assert hashes == copy # not mutated
+        assert root == naive_root(hashes)
+        assert client.mrkl_root_raw(b"".join(hashes)) == root
+        assert client.mrkl_root(hashes) == client.dbytes_to_hexstr(root)
+
+    with open('../testdata/btc_blocks_json_samples/300000') as json_file:
+        data = json.load(json_file)
+    tx_hashes_bytes = client.tx_hashes_to_dbytes([ tx["hash"] for tx in data["tx"] ])
+    assert client.mrkl_root_raw(tx_hashes_bytes) == client.hexstr_to_dbytes(data["mrkl_root"])
+
+def test_mrkl_root_pool(monkeypatch):
+    # full and partial last subtrees, whose last node has to be hashed with itself up to the split
+    for n in (2,3,9,16,17,31,33,237):
+        hashes = [ client.dSHA256(n.to_bytes(2,"little") + i.to_bytes(4,"little"),raw=True) for i in range(0,n) ]
+        root = client.mrkl_root_raw(hashes,processes=1)
+        assert client.mrkl_root_raw(hashes,processes=2,cutoff=0) == root
+        assert client.mrkl_root_raw(b"".join(hashes),processes=3,cutoff=0) == root
+    assert client.mrkl_root(hashes,processes=2,cutoff=0) == client.dbytes_to_hexstr(root)
+    assert client.mrkl_root_raw(hashes,processes=None,cutoff=0) == root
+
+    # the pools are opt-in, by default no process is started
+    def no_pool(*args,**kwargs):
+        raise AssertionError("process pool started")
+    monkeypatch.setattr(client.concurrent.futures,"ProcessPoolExecutor",no_pool)
+    assert client.mrkl_root_raw(hashes,cutoff=0) == root
+    assert client.vrfy_mrkl_root(hashes,client.dbytes_to_hexstr(root))
+    assert client.dSHA256_batch(b"".join(hashes),size=32,cutoff=0) == b"".join([ client.dSHA256(h,raw=True) for h in hashes ])
+
 def test_vrfy_mrkl_block():
     hashes_hex_big = [ 0x3612262624047ee87660be1a707519a443b1c1ce3d248cbfc6c15870f6c5daa2,
                0x019f5b01d4195ecbc9398fbf3c3b1fa9bb3183301d7a1fb3bd174fcfa40a2b65,
@@ -160,6 +270,47 @@ def test_vrfy_mrkl_block():
     tx_hash = 0x019f5b01d4195ecbc9398fbf3c3b1fa9bb3183301d7a1fb3bd174fcfa40a2b65.to_bytes(32,"big")
     assert client.vrfy_mrkl_block(tx_hash=tx_hash,mrkl_block=mrkl_block)
 
+def test_gen_mrkl_block():
+    with open('../testdata/btc_blocks_json_samples/300000') as json_file:
+        data = json.load(json_file)
+    tx_hashes_bytes = client.tx_hashes_to_dbytes([ tx["hash"] for tx in data["tx"] ])
+    n = len(tx_hashes_bytes)
+
+    for idx in ([0],[n-1],[1,2,n//2,n-1],list(range(0,n))):
+        matches = [ tx_hashes_bytes[i] for i in idx ]
+        mrkl_block = client.gen_mrkl_block(matches,tx_hashes_bytes)
+        assert mrkl_block["hashMerkleRoot"] == client.hexstr_to_dbytes(data["mrkl_root"]).hex()
+        assert len(mrkl_block["flags"]) == mrkl_block["flag_bytes"]*8
+        copy = dict(mrkl_block,tx_hashes=mrkl_block["tx_hashes"].copy(),flags=mrkl_block["flags"].copy())
+        assert client.vrfy_mrkl_block(matches,mrkl_block)
+        assert mrkl_block == copy # not mutated
+
+        hashes,flags = client.gen_partial_mrkl_tree(tx_hashes_bytes,set(matches))
+        root,matched = client.vrfy_partial_mrkl_tree(n,hashes,flags)
+        assert matched == [ (i,tx_hashes_bytes[i]) for i in idx ]
+
+    # several matches share the internal nodes of their paths
+    tree = client.MerkleTree(tx_hashes_bytes)
+    matches = tx_hashes_bytes[10:20]
+    hashes,flags = client.gen_partial_mrkl_tree(tree,set(matches))
+    assert len(hashes) < sum([ len(tree.proof(h)[0]) for h in matches ])
+
+    mrkl_block = client.gen_mrkl_block(tx_hashes_bytes[5],tx_hashes_bytes)
+    assert client.vrfy_mrkl_block(tx_hashes_bytes[5],mrkl_block)
+    assert not client.vrfy_mrkl_block(tx_hashes_bytes[6],mrkl_block)
+    # tampered hashes, flags or tx count
+    bad = dict(mrkl_block,tx_hashes=[client.CB_TXHASH] + mrkl_block["tx_hashes"][1:])
+    assert not client.vrfy_mrkl_block(tx_hashes_bytes[5],bad)
+    bad = dict(mrkl_block,flags=[1]*len(mrkl_block["flags"]))
+    assert not client.vrfy_mrkl_block(tx_hashes_bytes[5],bad)
+    assert client.vrfy_partial_mrkl_tree(n,hashes,flags[:-8]) is None
+    assert client.vrfy_partial_mrkl_tree(n,hashes + hashes[:1],flags) is None
+
+    # single tx block
+    mrkl_block = client.gen_mrkl_block(tx_hashes_bytes[0],tx_hashes_bytes[:1])
+    assert mrkl_block["tx_hashes"] == tx_hashes_bytes[:1]
+    assert client.vrfy_mrkl_block(tx_hashes_bytes[0],mrkl_block)
+
 def test_verfy_mrkl_paths():
     with open('../testdata/btc_blocks_json_samples/100014') as json_file:
         data = json.load(json_file)
@@ -190,6 +341,83 @@ def test_verfy_mrkl_paths():
     shash='652b0aa4cf4f17bdb31f7a1d308331bba91f3b3cbf8f39c9cb5e19d4015b9f01'
     assert client.vrfy_root_path(hashMerkleRoot,shash,mpath.copy(),flags.copy())
 
+def mrkl_path_reference(hashes,shash,mpath,flags):
+    """ previous recursive path builder, independent of MerkleTree, appends the sibling
+    hashes of the tx hash shash (hex string) to mpath and their flags to flags """
+    level = [ {"value": h,"hit": False} for h in hashes ]
+    while len(level) > 1:
+        if len(level) % 2 != 0:
+            level.append({"value": level[-1]["value"],"hit": False})
+        nextlevel = list()
+        for i in range(0,len(level),2):
+            left,right = level[i],level[i+1]
+            hit = True
+            if client.dbytes_to_hexstr(left["value"]) == shash or left["hit"]:
+                mpath.append(right["value"])
+                flags.append(1)
+            elif client.dbytes_to_hexstr(right["value"]) == shash or right["hit"]:
+                mpath.append(left["value"])
+                flags.append(0)
+            else:
+                hit = False
+            nextlevel.append({"value": client.dSHA256(left["value"] + right["value"],raw=True),"hit": hit})
+        level = nextlevel
+    return level[0]["value"]
+
+def test_mrkl_tree():
+    with open('../testdata/btc_blocks_json_samples/300000') as json_file:
+        data = json.load(json_file)
+    tx_hashes = [ tx["hash"] for tx in data["tx"] ]
+    tx_hashes_bytes = client.tx_hashes_to_dbytes(tx_hashes)
+
+    tree = client.MerkleTree(tx_hashes_bytes)
+    assert len(tree) == len(tx_hashes)
+    assert tree.hashMerkleRoot == data["mrkl_root"]
+    assert tree.root == client.mrkl_root_raw(tx_hashes_bytes)
+    assert client.MerkleTree(b"".join(tx_hashes_bytes)).root == tree.root
+
+    # paths of every tx, including the odd last ones, equal the ones of the reference
+    for i in (0,1,len(tx_hashes)//2,len(tx_hashes)-2,len(tx_hashes)-1):
+        mpath = list()
+        flags = list()
+        assert mrkl_path_reference(tx_hashes_bytes,tx_hashes[i],mpath,flags) == tree.root
+        assert tree.index(tx_hashes[i]) == i
+        assert tree.proof(tx_hashes[i]) == (mpath,flags)
+        path = (list(),list())
+        assert client.mrkl_root_path(tx_hashes_bytes,shash=tx_hashes[i],mpath=path[0],flags=path[1])["hit"]
+        assert path == (mpath,flags)
+        assert client.vrfy_root_path(data["mrkl_root"],tx_hashes[i],mpath,flags)
+
+    assert tree.index(client.CB_TXHASH) is None
+    with pytest.raises(KeyError):
+        tree.proof(client.CB_TXHASH)
+
+    # single tx
+    tree = client.MerkleTree(tx_hashes_bytes[:1])
+    assert tree.root == tx_hashes_bytes[0]
+    assert tree.path(0) == ([],[])
+
+def test_vrfy_root_paths():
+    with open('../testdata/btc_blocks_json_samples/300000') as json_file:
+        data = json.load(json_file)
+    tx_hashes = [ tx["hash"] for tx in data["tx"] ]
+    tree = client.MerkleTree(client.tx_hashes_to_dbytes(tx_hashes))
+
+    proofs = [ (tx_hashes[i],*tree.path(i)) for i in range(len(tx_hashes)) ]
+    mpath,flags = proofs[1][1:]
+    before = (list(mpath),list(flags))
+    assert client.vrfy_root_path(data["mrkl_root"],tx_hashes[1],mpath,flags)
+    assert (mpath,flags) == before # arguments are not consumed
+
+    cache = set()
+    assert client.vrfy_root_paths(data["mrkl_root"],proofs,cache) == [True]*len(proofs)
+    # every node below the root is visited once and remembered
+    assert len(cache) == sum(tree.counts[:-1])
+    # a bad proof is rejected even with a warm cache
+    bad = (client.CB_TXHASH,mpath,flags)
+    assert client.vrfy_root_paths(data["mrkl_root"],[proofs[0],bad],cache) == [True,False]
+    assert client.vrfy_root_paths(data["mrkl_root"],[bad]) == [False]
+
 def test_parse_blk_cb():
     with open('../testdata/btc_blocks_json_samples/603268.raw') as json_file:
         data = json.load(json_file)
@@ -329,6 +557,27 @@ def test_nBits_to_Target():
     #assert(client.nBits_to_Target(b"\x04\x92\x34\x56")  == 0x12345600) #8  # high bit set
     #assert(client.nBits_to_Target(b"\x01\xfe\xdc\xba")  == 0x7e) #9  # high bit set
 
+def test_nBits_to_Target_cached():
+    client.target_cache_clear()
+    assert client.nBits_to_Target_cached(b"\x18\x1b\xc3\x30") == 0x1bc330000000000000000000000000000000000000000000
+    assert client.nBits_to_Target_cached(b"\x30\xc3\x1b\x18",big_endian=False) == 0x1bc330000000000000000000000000000000000000000000
+    info = client.target_cache_info()
+    assert info.misses == 1 and info.hits == 1 and info.currsize == 1
+
+    with pytest.raises(client.NBitsDecodingExcpetion):
+        client.nBits_to_Target_cached(b"\x04\x92\x34\x56")
+    with pytest.raises(client.NBitsDecodingExcpetion):
+        client.nBits_to_Target_cached(b"\x04\x92\x34\x56")
+    assert client.target_cache_info().currsize == 1
+
+    # headers of the same difficulty period share one cache entry
+    client.target_cache_clear()
+    hdrs = list(client.iter_hdrs('../testdata/btc_hex_hdr_samples/500from300k.txt'))
+    for h in hdrs[:10]:
+        assert client.BtcBlk(hdr=h).target == client.nBits_to_Target(h[72:76],big_endian=False)
+    info = client.target_cache_info()
+    assert info.misses == 1 and info.hits == 9
+
 def test_within_difficulty_period():
     assert client.within_difficulty_period(0,2015) == True
     assert client.within_difficulty_period(1,2015) == True
@@ -359,3 +608,600 @@ def test_replace_bytes():
     original_hdr = client.replace_at_offset(other_hdr,offset,replace=mroot)
 
     assert original_hdr == old_hdr
+
+def test_vrfy_hdr_chain(tmp_path):
+    path = '../testdata/btc_hex_hdr_samples/500from300k.txt'
+    rslt = client.vrfy_hdr_file(path,start_height=300000,hashPrevBlock=hdr_hashPrevBlock_str)
+    assert rslt["valid"]
+    assert rslt["count"] == 500
+    assert rslt["bad_height"] is None
+
+    hdrs = list(client.iter_hdrs(path))
+    assert len(hdrs) == 500
+    assert hdrs[0] == hdr_bytes
+    assert rslt["last_hash"] == client.dSHA256(hdrs[-1],raw=True)
+
+    # same chain from a binary file
+    bin_path = tmp_path / "hdrs.bin"
+    bin_path.write_bytes(b"".join(hdrs))
+    assert list(client.iter_hdrs(bin_path)) == hdrs
+    assert client.vrfy_hdr_file(bin_path,start_height=300000)["count"] == 500
+
+    # broken link, header 300005 missing
+    rslt = client.vrfy_hdr_chain(hdrs[:5] + hdrs[6:],start_height=300000)
+    assert not rslt["valid"]
+    assert rslt["bad_height"] == 300005
+    assert rslt["count"] == 5
+    assert rslt["last_hash"] == client.dSHA256(hdrs[4],raw=True)
+
+    # header 300010 does not meet its target anymore
+    bad = bytearray(hdrs[10])
+    bad[-1] ^= 0xff
+    rslt = client.vrfy_hdr_chain(hdrs[:10] + [bytes(bad)] + hdrs[11:],start_height=300000)
+    assert rslt["bad_height"] == 300010
+    assert rslt["error"] == "Header hash above target"
+
+    # wrong previous hash of the first header
+    rslt = client.vrfy_hdr_chain(hdrs,start_height=300000,hashPrevBlock=hdr_hash)
+    assert rslt["bad_height"] == 300000
+
+def test_get_input_blocks_calldata():
+    blks = calldata_sample_chain(4)
+    b = [ client.get_input_block_calldata(blks,i) for i in range(0,4) ]
+    assert client.get_input_blocks_calldata(blks,processes=1) == b
+    assert client.get_input_blocks_calldata(blks,processes=2,cutoff=0) == b
+    assert client.get_input_blocks_calldata(blks,start=1,end=3,processes=2,cutoff=0) == b[1:3]
+
+    # broken hashPrevBlock continuity is found after the parallel stage
+    blks[2],blks[3] = blks[3],blks[2]
+    with pytest.raises(AssertionError):
+        client.get_input_blocks_calldata(blks,processes=2,cutoff=0)
+    with pytest.raises(AssertionError):
+        client.get_input_blocks_calldata(blks,start=3,processes=1)
+
+def test_calldata_cache(tmp_path):
+    blks = calldata_sample_chain(3)
+    b = client.get_input_blocks_calldata(blks,processes=1)
+    cache = client.CalldataCache(str(tmp_path))
+    assert client.get_input_blocks_calldata(blks,start=1,processes=1,cache=cache) == b[1:]
+    assert (cache.hits,cache.misses) == (0,2)
+    assert blks[1]["hash"] in cache and blks[0]["hash"] not in cache
+
+    # the second run only prepares the block missing from the cache
+    assert client.get_input_blocks_calldata(blks,processes=1,cache=cache) == b
+    assert (cache.hits,cache.misses) == (2,3)
+    assert client.get_input_block_calldata(blks,2,cache=cache) == b[2]
+    assert cache.hits == 3
+
+    # records of another format version or corrupted records are prepared again
+    assert client.CalldataCache.VERSION == 2
+    client.CalldataCache.VERSION = 3
+    try:
+        assert client.CalldataCache(str(tmp_path)).get(blks[0]["hash"]) is None
+    finally:
+        client.CalldataCache.VERSION = 2
+    with open(str(tmp_path / "v2" / blks[0]["hash"]),"wb") as f:
+        f.write(b"garbage")
+    assert cache.get(blks[0]["hash"]) is None
+    assert client.get_input_block_calldata(blks,0,cache=cache) == b[0]
+    assert cache.get(blks[0]["hash"]) == b[0]
+
+def test_calldata_vrfy_levels():
+    blks = calldata_sample_blks()
+    b = client.get_input_block_calldata(blks,0)
+    for level in client.VRFY_LEVELS:
+        counters = client.VrfyCounters()
+        assert client.get_input_block_calldata(blks,0,level=level,counters=counters) == b
+        checks = { "trusted": set(),
+                   "standard": {"hdr_hash","height","coinbase","mrkl_root"},
+                   "paranoid": {"hdr_hash","height","coinbase","mrkl_root","pow","coinbase_path","tblock"} }[level]
+        assert set(counters.runs) == checks
+        assert all([ runs == 1 for runs in counters.runs.values() ])
+    with pytest.raises(AssertionError):
+        client.get_input_block_calldata(blks,0,level="none")
+
+    # mismatching inputs are only found when checked
+    blks[0] = dict(blks[0],height=blks[0]["height"] + 1)
+    assert client.get_input_block_calldata(blks,0,level="trusted") == b
+    with pytest.raises(AssertionError):
+        client.get_input_block_calldata(blks,0,level="standard")
+
+def test_calldata_cache_levels(tmp_path):
+    blks = calldata_sample_blks()
+    blks[0] = dict(blks[0],mrkl_root="00"*32)
+    cache = client.CalldataCache(str(tmp_path))
+    b = client.get_input_block_calldata(blks,0,level="trusted",cache=cache)
+    assert cache.get(blks[0]["hash"],level="trusted") == b
+    assert cache.get(blks[0]["hash"],level="standard") is None
+
+    # a record prepared at a lower level is prepared again at the stricter one
+    for level in ("standard","paranoid"):
+        with pytest.raises(AssertionError):
+            client.get_input_block_calldata(blks,0,level=level,cache=cache)
+        with pytest.raises(AssertionError):
+            client.get_input_blocks_calldata(blks,processes=1,level=level,cache=cache)
+
+    # and replaces it, after which lower levels are served from the cache
+    blks = calldata_sample_blks()
+    assert client.get_input_blocks_calldata(blks,processes=1,level="paranoid",cache=cache) == [b]
+    assert cache.get(blks[0]["hash"],level="paranoid") == b
+    hits = cache.hits
+    assert client.get_input_block_calldata(blks,0,level="standard",cache=cache) == b
+    assert cache.hits == hits + 1
+
+    # trusted does not check the height of cached records either
+    blks[0] = dict(blks[0],height=blks[0]["height"] + 1)
+    assert client.get_input_block_calldata(blks,0,level="trusted",cache=cache) == b
+    with pytest.raises(AssertionError):
+        client.get_input_block_calldata(blks,0,level="standard",cache=cache)
+
+    # counters of worker processes are added up, the synthetic chain does not meet its target
+    blks = calldata_sample_chain(3)
+    counters = client.VrfyCounters()
+    client.get_input_blocks_calldata(blks,processes=2,cutoff=0,counters=counters)
+    assert counters.runs == {"hdr_hash": 3,"height": 3,"coinbase": 3,"mrkl_root": 3}
+    with pytest.raises(AssertionError):
+        client.get_input_blocks_calldata(blks,processes=1,level="paranoid")
+
+def test_get_input_block_calldata():
+    blks = calldata_sample_blks()
+    b = client.get_input_block_calldata(blks,0)
+
+    assert b["blockHeight"] == 603268
+    assert b["blockHash_str"] == blks[0]["hash"]
+    assert b["blockHash_bytes_big"] == client.hexstr_to_dbytes(blks[0]["hash"])
+    assert b["blockHash_bytes_little"] == client.hexstr_to_dbytes(blks[0]["hash"],swap=False)
+    assert b["blockHeader_bytes_big"] == bytes.fromhex(blks[0]["rawblock"][:160])
+    assert b["blockHashPrevBlock_str"] == '0000000000000000001157ff4e4da9777b9d440205610bd7d636817744ef9dc3'
+    assert b["blockHashMerkleRoot_str"] == "f4824ca2c070168b9537dce3691afd399f9c26b59d3c47c8a321315c2b23e274"
+    assert b["cb_hash"] == "de612b874b23a78805ed022f55befbc94d12e2e78208d1d6d560df1d998451cb"
+    assert client.dSHA256(b["cb_pfx"] + b["cb"] + b["cb_sfx"]) == b["cb_hash"]
+    assert b["mp_hashes_bytes_big"] == b"".join(b["mp_hashes_list"])
+    assert b["mp_flags"] == [1]*len(b["mp_hashes_list"])
+    assert client.vrfy_root_path(b["blockHashMerkleRoot_str"],b["cb_hash"],b["mp_hashes_list"],b["mp_flags"])
+    assert client.vrfy_root_path(b["blockHashMerkleRoot_str"],b["cb_hash"],b["mp_hashes_bytes_big"],b["mp_flags"])
+    cb_tx = b["cb_pfx"] + b["cb"] + b["cb_sfx"]
+    assert client.vrfy_coinbase_pfx(b["cb_pfx"])
+    assert client.vrfy_coinbase_path(b["blockHeader_bytes_big"],cb_tx,b["mp_hashes_bytes_big"])
+    assert not client.vrfy_coinbase_path(b["blockHeader_bytes_big"],cb_tx + b"\x00",b["mp_hashes_bytes_big"])
+    assert b["tblockHeader_bytes_big"][4:68] == b"\x00"*64
+    assert b["tblockHash_bytes_big"] == client.dSHA256(b["tblockHeader_bytes_big"],raw=True)
+
+def test_mrkl_root_from_coinbase():
+    blks = calldata_sample_blks()
+    b = client.get_input_block_calldata(blks,0)
+    cb_tx = b["cb_pfx"] + b["cb"] + b["cb_sfx"]
+    assert client.mrkl_root_from_coinbase(cb_tx,b["mp_hashes_list"]) == b["blockHashMerkleRoot_bytes_big"]
+    assert client.hdr_with_coinbase(b["tblockHeader_bytes_big"],cb_tx,b["mp_hashes_bytes_big"])[36:68] == b["blockHashMerkleRoot_bytes_big"]
+    assert client.hdr_with_coinbase(b["blockHeader_bytes_big"],cb_tx,b["mp_hashes_list"]) == b["blockHeader_bytes_big"]
+
+    # a coinbase variant with the same prefix and suffix, compared to rebuilding the whole tree
+    txids = client.BtcBlkView(bytes.fromhex(blks[0]["rawblock"])).get_txids(raw=True)
+    cb_tx = b["cb_pfx"] + b["cb"][:-4] + b"\x01\x02\x03\x04" + b["cb_sfx"]
+    root = client.mrkl_root_raw([client.dSHA256(cb_tx,raw=True)] + txids[1:],processes=1)
+    assert client.mrkl_root_from_coinbase(cb_tx,b["mp_hashes_bytes_big"]) == root
+    hdr = client.hdr_with_coinbase(b["blockHeader_bytes_big"],cb_tx,b["mp_hashes_list"])
+    assert hdr[36:68] == root and hdr[:36] == b["blockHeader_bytes_big"][:36] and hdr[68:] == b["blockHeader_bytes_big"][68:]
+    assert client.vrfy_coinbase_path(hdr,cb_tx,b["mp_hashes_bytes_big"])
+
+def test_hdr_store(tmp_path):
+    src = '../testdata/btc_hex_hdr_samples/500from300k.txt'
+    hdrs = list(client.iter_hdrs(src))
+    with client.BtcHdrStore.import_hex_hdrs(src,str(tmp_path / "hdrs"),start_height=300000) as store:
+        assert len(store) == 500
+        assert store.start_height == 300000 and store.end_height == 300500
+        assert 300499 in store and 300500 not in store
+        assert store.get(300000) == hdr_bytes
+        assert store.get(300321) == hdrs[321]
+        hrange = store.range(300010,300020)
+        assert hrange.tobytes() == b"".join(hdrs[10:20])
+        hrange.release()
+        assert store.height_of(hdr_hash) == 300000
+        assert store.height_of(client.dSHA256(hdrs[499],raw=True)) == 300499
+        assert store.height_of(hdr_hashPrevBlock_str) is None
+        assert client.vrfy_hdr_chain(store,start_height=store.start_height)["valid"]
+        # the zero-copy headers of get and range are validated as they are
+        rslt = client.vrfy_hdr_chain([ store.get(h) for h in range(300000,300010) ],start_height=300000)
+        assert rslt["valid"] and rslt["count"] == 10
+        hrange = store.range(300010,300020)
+        rslt = client.vrfy_hdr_chain([ hrange[i:i + 80] for i in range(0,len(hrange),80) ],
+                                     start_height=300010,hashPrevBlock=client.dSHA256(hdrs[9],raw=True))
+        assert rslt["valid"] and rslt["count"] == 10
+        bad = [ store.get(h) for h in range(300000,300003) ]
+        bad[1] = bytearray(bad[1])
+        bad[1][client.NBITS_OFFSET + 3] = 0xff # nBits overflows
+        rslt = client.vrfy_hdr_chain(bad,start_height=300000)
+        assert not rslt["valid"] and rslt["bad_height"] == 300001 and "Overflow" in rslt["error"]
+        assert client.endSwap(store.get(300000)[4:36]) == client.endSwap(bytes(hdrs[0][4:36]))
+        del bad,rslt
+        hrange.release()
+        with pytest.raises(IndexError):
+            store.get(300500)
+
+    # reopen without parsing again
+    store = client.BtcHdrStore(str(tmp_path / "hdrs"))
+    assert client.BtcHdr(store.get(300001)).hashPrevBlock == hdr_hash
+    store.close()
+
+    # headers from a JSON block dump
+    with client.BtcHdrStore.import_json_blocks('../testdata/btc_blocks_json_samples/300000',str(tmp_path / "json")) as store:
+        assert len(store) == 1
+        assert store.get(300000) == hdr_bytes
+        assert store.height_of(hdr_hash) == 300000
+
+def test_parse_blk_offsets():
+    with open('../testdata/btc_blocks_json_samples/603268.raw') as json_file:
+        blk_raw = bytes.fromhex(json.load(json_file)["rawblock"])
+
+    offsets = client.parse_btc_blk_offsets(blk_raw)
+    assert offsets["tx_count"] == 2312
+    assert len(offsets["txs"]) == 2312
+    assert offsets["txs"][0][0] == 80 + 3
+    off,ln = offsets["txs"][-1]
+    assert off + ln == len(blk_raw)
+
+    bblk = client.BtcBlk(blk=blk_raw)
+    for i in (0,1,1000,2311):
+        off,ln = offsets["txs"][i]
+        tx = bblk.txs[i]
+        assert blk_raw[off:off+ln] == tx.txb
+        assert len(offsets["tx_in"][i]) == tx.tx_in_cnt
+        assert len(offsets["tx_out"][i]) == tx.tx_out_cnt
+        for (off,ln),txin in zip(offsets["tx_in"][i],tx.tx_in):
+            assert blk_raw[off:off+ln] == txin.get_txin("bytes")
+        for (off,ln),txout in zip(offsets["tx_out"][i],tx.tx_out):
+            assert blk_raw[off:off+ln] == txout.get_txout("bytes")
+
+    assert client.parse_btc_blk_offsets(blk_raw,tx_n=1)["txs"] == offsets["txs"][:1]
+    assert client.vint_at(b"\x00\xfd\x08\x09",1) == (3,2312)
+    with pytest.raises(IndexError):
+        client.parse_btc_blk_offsets(blk_raw[:-1])
+
+def test_blk_view():
+    with open('../testdata/btc_blocks_json_samples/603268.raw') as json_file:
+        blk_raw = bytes.fromhex(json.load(json_file)["rawblock"])
+
+    bblk = client.BtcBlk(blk=blk_raw)
+    view = client.BtcBlkView(blk_raw,height=603268)
+    assert view.tx_count == 2312
+    assert len(view) == 2312
+    assert view.hash == bblk.hash
+    assert view.hashPrevBlock == bblk.hashPrevBlock
+    assert view.get_hashMerkleRoot(raw=True) == bblk.get_hashMerkleRoot(raw=True)
+    assert view.hdr.height == 603268
+
+    assert view.get_txids() == [ tx.txhash for tx in bblk.txs ]
+    assert client.vrfy_mrkl_root(view.get_txids(raw=True),view.hashMerkleRoot)
+    for i in (0,1,1000,-1):
+        assert bytes(view.get_tx_raw(i)) == bblk.txs[i].txb
+        assert view[i].txhash == bblk.txs[i].txhash
+    assert view[0].parse_coinbase()["blk_height"] == 603268
+    with pytest.raises(IndexError):
+        view.get_tx_raw(2312)
+
+    view = client.BtcBlkView(bytearray(blk_raw),tx_n=2)
+    assert len(view) == 2
+    assert [ tx.txhash for tx in view ] == view.get_txids()
+
+def test_segwit_txids():
+    blk_raw,bblk,wtxs = segwit_sample_blk()
+    txids = [ client.hexstr_to_dbytes(tx.txhash) for tx in bblk.txs ]
+
+    rslt = client.scan_btc_txids(blk_raw,wtxids=True)
+    assert rslt["tx_count"] == 2312
+    assert rslt["txids"] == txids
+    assert rslt["wtxids"] == [ client.dSHA256(tx,raw=True) for tx in wtxs ]
+    assert client.scan_btc_txids(blk_raw)["wtxids"] is None
+    assert client.vrfy_mrkl_root(rslt["txids"],bblk.hashMerkleRoot)
+
+    view = client.BtcBlkView(blk_raw)
+    assert view.is_segwit(1)
+    assert view.get_txids(raw=True) == txids
+    assert view.get_wtxid(5) == client.dSHA256(wtxs[5])
+    assert bytes(view.get_tx_raw(-1)) == wtxs[-1]
+
+    # a non segwit block scans the same
+    legacy_raw = blk_raw[:83] + b"".join([ tx.txb for tx in bblk.txs ])
+    assert client.scan_btc_txids(legacy_raw)["txids"] == txids
+    assert not client.BtcBlkView(legacy_raw).is_segwit(1)
+
+def test_parse_segwit_tx():
+    blk_raw,bblk,wtxs = segwit_sample_blk()
+    tx = client.BtcTx(rawbytes=wtxs[1])
+    assert tx.flag == 1
+    assert tx.txb == bblk.txs[1].txb
+    assert tx.txhash == bblk.txs[1].txhash
+    assert tx.wtxb == wtxs[1]
+    assert tx.wtxhash == client.dSHA256(wtxs[1])
+    assert tx.tx_len == len(wtxs[1])
+    assert len(tx.tx_wit) == tx.tx_in_cnt
+    assert tx.tx_wit[0] == [b"\x30"*71,b"\x01"*33]
+    assert tx.get_tx("bytes") == tx.txb
+    assert tx.get_tx("wbytes") == tx.wtxb
+
+    tx2 = client.BtcTx(nVersion=tx.nVersion,
+                       flag=tx.flag,
+                       tx_in_cnt=tx.tx_in_cnt,
+                       tx_in=tx.tx_in,
+                       tx_out_cnt=tx.tx_out_cnt,
+                       tx_out=tx.tx_out,
+                       tx_wit=tx.tx_wit,
+                       nLockTime=tx.nLockTime)
+    assert tx2.wtxb == tx.wtxb
+    assert tx2.wtxhash == tx.wtxhash
+    # the flag may be given as its raw bytes as well
+    tx3 = client.BtcTx(nVersion=tx.nVersion,
+                       flag=tx.flag_raw,
+                       tx_in_cnt=tx.tx_in_cnt,
+                       tx_in=tx.tx_in,
+                       tx_out_cnt=tx.tx_out_cnt,
+                       tx_out=tx.tx_out,
+                       tx_wit=tx.tx_wit,
+                       nLockTime=tx.nLockTime)
+    assert tx3.flag == 1 and tx3.flag_raw == b"\x00\x01"
+    assert tx3.wtxb == tx.wtxb
+    # a flag needs one witness stack per input
+    for tx_wit in (None,tx.tx_wit[1:]):
+        with pytest.raises(AssertionError):
+            client.BtcTx(nVersion=tx.nVersion,
+                         flag=1,
+                         tx_in_cnt=tx.tx_in_cnt,
+                         tx_in=tx.tx_in,
+                         tx_out_cnt=tx.tx_out_cnt,
+                         tx_out=tx.tx_out,
+                         tx_wit=tx_wit,
+                         nLockTime=tx.nLockTime)
+
+    # the coinbase prefix and suffix hash to the txid of a segwit coinbase as well
+    cbtx = client.BtcTx(rawbytes=wtxs[0])
+    cb = cbtx.parse_coinbase()
+    assert cb["blk_height"] == 603268
+    assert client.dSHA256(cb["coinbasetx_prefix"] + cb["coinbase_full"] + cb["coinbasetx_suffix"]) == cbtx.txhash
+
+    # the segwit block goes through the calldata preparation
+    blks = calldata_sample_blks()
+    blks[0]["rawblock"] = blk_raw.hex()
+    b = client.get_input_block_calldata(blks,0)
+    assert b["cb_hash"] == bblk.txs[0].txhash
+
+def test_blk_files(tmp_path):
+    blks = calldata_sample_chain(5)
+    raws = [ bytes.fromhex(b["rawblock"]) for b in blks ]
+    # fork of block 1, left out of the index as the shorter chain
+    fork = raws[2][:4] + client.dSHA256(raws[1][:80],raw=True) + raws[2][36:76] + b"\x00"*4 + raws[2][80:]
+
+    def frame(raw):
+        return client.BLK_MAGIC_MAIN + len(raw).to_bytes(4,"little") + raw
+    paths = [str(tmp_path / "blk00000.dat"),str(tmp_path / "blk00001.dat")]
+    with open(paths[0],"wb") as f:
+        f.write(frame(raws[0]) + frame(raws[2]) + frame(fork) + b"\x00"*64) # zero padded
+    with open(paths[1],"wb") as f:
+        f.write(frame(raws[1]) + frame(raws[4]) + frame(raws[3]))
+
+    with client.BtcBlkFile(paths[0]) as blk_file:
+        assert [ ln for off,ln in blk_file.records() ] == [len(raws[0]),len(raws[2]),len(fork)]
+        hashes = [ view.hash for view in blk_file ]
+        assert hashes[:2] == [blks[0]["hash"],blks[2]["hash"]]
+    assert [ view.hash for view in client.iter_blk_files(paths) ][3:] == [blks[1]["hash"],blks[4]["hash"],blks[3]["hash"]]
+
+    idx = client.BtcBlkIndex.create(str(tmp_path / "blk.idx"),paths)
+    assert idx.start_height == 603268 # from the coinbase
+    assert len(idx) == 5
+    idx.close()
+    with client.BtcBlkIndex(str(tmp_path / "blk.idx")) as idx:
+        assert [ idx.get_hash(h) for h in range(603268,603273) ] == [ b["hash"] for b in blks ]
+        assert idx.get_location(603269) == (paths[1],8,len(raws[1]))
+        view = idx.get(603270)
+        assert view.height == 603270
+        assert bytes(view.blk) == raws[2]
+        # the coinbases of the sample chain are all at height 603268
+        view = idx.get(603268)
+        b = client.get_block_calldata(*client.get_calldata_input_from_view(view))
+        assert b["blockHash_str"] == blks[0]["hash"]
+        assert b["blockHeight"] == 603268
+        del view
+        assert [ v.hash for v in idx.range(603271,603273) ] == [blks[3]["hash"],blks[4]["hash"]]
+        with pytest.raises(IndexError):
+            idx.get(603273)
+
+    with open(paths[1],"ab") as f:
+        f.write(b"\x01\x02\x03\x04" + b"\x00"*8)
+    with pytest.raises(client.BtcHdrException):
+        client.BtcBlkIndex.create(str(tmp_path / "blk2.idx"),paths,start_height=0)
+
+def test_blk_archive(tmp_path):
+    blks = [ dict(b,height=603268 + i) for i,b in enumerate(calldata_sample_chain(4)) ]
+    client.store_input_blocks(str(tmp_path) + "/",blks[:3])
+    with open(str(tmp_path / "single"),"w") as f:
+        json.dump(blks[3],f)
+
+    archive = client.BtcBlkArchive.import_json_blocks([str(tmp_path / "603268--603270"),str(tmp_path / "single")],str(tmp_path / "archive"))
+    archive.close()
+    with client.BtcBlkArchive(str(tmp_path / "archive")) as archive:
+        assert len(archive) == 4
+        assert archive.heights == [603268,603269,603270,603271]
+        assert 603271 in archive and 603272 not in archive
+        view = archive.get(603269)
+        assert view.height == 603269
+        assert bytes(view.blk) == bytes.fromhex(blks[1]["rawblock"])
+        # the archived txids are returned instead of being hashed
+        assert view.get_txids() == client.BtcBlkView(bytes(view.blk)).get_txids()
+        assert view.get_txid(0) == blks[1]["tx"][0]["hash"]
+        del view
+        view = archive.get_by_hash(blks[2]["hash"])
+        assert view.height == 603270
+        del view
+        assert archive.get_hash(603271) == blks[3]["hash"]
+        assert [ v.hash for v in archive.range(603270,603272) ] == [blks[2]["hash"],blks[3]["hash"]]
+        assert [ v.height for v in archive ] == archive.heights
+        # the coinbases of the sample chain are all at height 603268
+        assert archive.get_calldata(603268) == client.get_input_block_calldata(blks,0)
+        with pytest.raises(IndexError):
+            archive.get(603272)
+        with pytest.raises(KeyError):
+            archive.get_by_hash(client.CB_TXHASH)
+
+    # overlapping dumps store each block once, another block at a taken height is rejected
+    client.store_input_blocks(str(tmp_path) + "/",blks[2:])
+    with client.BtcBlkArchive.import_json_blocks([str(tmp_path / "603268--603270"),str(tmp_path / "603270--603271")],str(tmp_path / "archive3")) as archive:
+        assert len(archive) == 4
+        assert archive.heights == [603268,603269,603270,603271]
+        assert [ v.hash for v in archive ] == [ b["hash"] for b in blks ]
+    raw = [ bytes.fromhex(b["rawblock"]) for b in blks ]
+    with pytest.raises(AssertionError):
+        client.BtcBlkArchive.create(str(tmp_path / "archive4"),[(5,raw[0]),(5,raw[1])])
+
+    # blocks without rawblock can not be archived
+    with pytest.raises(AssertionError):
+        client.BtcBlkArchive.import_json_blocks('../testdata/btc_blocks_json_samples/300000',str(tmp_path / "archive2"))
+
+def test_blk_repo(tmp_path,monkeypatch):
+    blks = [ dict(b,height=603268 + i) for i,b in enumerate(calldata_sample_chain(6)) ]
+    # overlapping dumps, a single block and a file which is no block dump
+    dumps = tmp_path / "dumps"
+    dumps.mkdir()
+    client.store_input_blocks(str(dumps) + "/",blks[0:3])
+    client.store_input_blocks(str(dumps) + "/",blks[2:5])
+    with open(str(dumps / "single"),"w") as f:
+        json.dump(blks[5],f)
+    with open(str(dumps / "notes.txt"),"w") as f:
+        f.write("no blocks")
+    index = str(tmp_path / "repo.idx")
+
+    repo = client.BtcBlkRepo(str(dumps),index_path=index)
+    assert os.path.exists(index)
+    assert len(repo) == 6 and repo.heights == list(range(603268,603274))
+    assert 603273 in repo and 603274 not in repo
+    # a range spanning several dumps
+    assert repo.range(603269,603274) == blks[1:6]
+    assert repo.get(603270) == blks[2]
+    assert repo.by_hash(blks[4]["hash"]) == blks[4]
+    assert repo.by_hash(client.hexstr_to_dbytes(blks[4]["hash"])) == blks[4]
+    assert client.get_input_blocks_calldata(repo.range(603268,603270),processes=1,level="trusted")[1]["blockHash_str"] == blks[1]["hash"]
+    with pytest.raises(IndexError):
+        repo.range(603272,603275)
+    with pytest.raises(KeyError):
+        repo.by_hash(client.CB_TXHASH)
+
+    # the persisted index is used without parsing the dumps again
+    def index_file(self,name):
+        raise AssertionError("{} indexed again".format(name))
+    with monkeypatch.context() as m:
+        m.setattr(client.BtcBlkRepo,"_index_file",index_file)
+        repo = client.BtcBlkRepo(str(dumps),index_path=index)
+        assert repo.get(603268) == blks[0]
+        assert repo.heights == list(range(603268,603274))
+
+    # changed dumps are indexed again
+    os.remove(str(dumps / "single"))
+    client.store_input_blocks(str(dumps) + "/",blks[5:6])
+    repo = client.BtcBlkRepo(str(dumps),index_path=index,cache_files=1)
+    assert repo.files == ["603268--603270","603270--603272","603273--603273","notes.txt"]
+    assert repo.range(603268,603274) == blks
+
+    # by default the index is kept outside of the dump directory
+    monkeypatch.setattr(client,"REPO_INDEX_DIR",str(tmp_path / "cache"))
+    repo = client.BtcBlkRepo(str(dumps))
+    assert os.path.dirname(repo.index_path) == str(tmp_path / "cache")
+    assert os.path.exists(repo.index_path)
+    assert sorted(os.listdir(str(dumps))) == ["603268--603270","603270--603272","603273--603273","notes.txt"]
+
+    # an index which can not be written is kept in memory
+    repo = client.BtcBlkRepo(str(dumps),index_path=str(dumps / "notes.txt" / "repo.idx"))
+    assert repo.range(603268,603274) == blks
+
+def test_fetch_input_blocks(tmp_path):
+    import blk_server
+    blks = [ dict(b,height=603268 + i) for i,b in enumerate(calldata_sample_chain(6)) ]
+    client.store_input_blocks(str(tmp_path) + "/",blks)
+    repo = client.BtcBlkRepo(str(tmp_path),index_path=str(tmp_path / ".repo.idx"))
+
+    # every path fails once with 503 and is retried
+    with blk_server.BlkServer(repo,fail=1) as server:
+        source = server.source(backoff=0.01)
+        assert client.fetch_input_blocks(603268,3,[],source=source,workers=2) == blks[:3]
+        assert set(server.requests.values()) == {2}
+
+    # resumed from the progress file, only the missing heights are fetched
+    progress = str(tmp_path / "progress.jsonl")
+    with blk_server.BlkServer(repo) as server:
+        source = server.source(backoff=0.01)
+        assert client.fetch_input_blocks(603268,2,[],source=source,progress=progress) == blks[:2]
+        with open(progress,"a") as f:
+            f.write('{"height": 6032') # interrupted while writing
+        assert client.fetch_input_blocks(603268,6,[],source=source,progress=progress) == blks
+        assert server.requests["/block-height/603268"] == 1
+        assert server.requests["/block-height/603273"] == 1
+        assert client.fetch_input_blocks(603268,6,[],source=source,progress=progress) == blks
+        assert server.requests["/block-height/603273"] == 1
+
+        # missing blocks and exhausted retries are raised
+        with pytest.raises(client.requests.HTTPError):
+            client.fetch_input_blocks(603274,1,[],source=source)
+        server.fail = 10
+        with pytest.raises(client.requests.HTTPError):
+            client.fetch_input_blocks(603272,1,[],source=server.source(retries=1,backoff=0.01))
+        with pytest.raises(AssertionError):
+            server.source(retries=-1)
+
+    # the heights fetched besides a failing one are kept in the progress file
+    progress = str(tmp_path / "progress2.jsonl")
+    with blk_server.BlkServer(repo) as server:
+        source = server.source(retries=0)
+        fetch = source.fetch
+        def fetch_failing(height):
+            # the first heights fail, before the others are fetched
+            if height in (603270,603271):
+                client.requests.get(server.url + "/missing").raise_for_status()
+            return fetch(height)
+        source.fetch = fetch_failing
+        with pytest.raises(client.requests.HTTPError) as e:
+            client.fetch_input_blocks(603270,4,[],source=source,workers=1,progress=progress)
+        assert e.value.request.url.endswith("/missing")
+        with open(progress) as f:
+            assert [ json.loads(line)["height"] for line in f ] == [603272,603273]
+        source.fetch = fetch
+        assert client.fetch_input_blocks(603270,4,[],source=source,progress=progress) == blks[2:]
+        assert server.requests["/block-height/603272"] == 1
+
+def test_tx_serialization():
+    with open('../testdata/btc_blocks_json_samples/603268.raw') as json_file:
+        blk_raw = bytes.fromhex(json.load(json_file)["rawblock"])
+    view = client.BtcBlkView(blk_raw)
+    cbtx = view.get_tx(0)
+
+    # unchanged parsed txs return the parsed serialization
+    assert cbtx.is_unchanged()
+    assert cbtx.get_tx("bytes") is cbtx.txb
+    assert cbtx.tx_out[0].is_unchanged()
+    assert cbtx.txb.endswith(b"".join([ txout.get_txout("bytes") for txout in cbtx.tx_out ]) + cbtx.nLockTime_raw)
+
+    # coinbase with many outputs, built from fields and parsed again
+    txout = cbtx.tx_out[0]
+    outs = [ client.BtcTxOut(value=i,script_len=txout.script_len,script_pk=txout.script_pk) for i in range(0,1000) ]
+    tx = client.BtcTx(nVersion=cbtx.nVersion,
+                      tx_in_cnt=1,
+                      tx_in=cbtx.tx_in,
+                      tx_out_cnt=len(outs),
+                      tx_out=outs,
+                      nLockTime=cbtx.nLockTime)
+    assert not tx.is_unchanged()
+    parsed = client.BtcTx(rawbytes=tx.txb)
+    assert parsed.is_unchanged()
+    assert parsed.txhash == tx.txhash
+    assert parsed.tx_out[999].value == 999
+    cb = parsed.parse_coinbase()
+    assert cb == tx.parse_coinbase()
+    assert cb["coinbasetx_prefix"] + cb["coinbase_full"] + cb["coinbasetx_suffix"] == tx.txb
+
+    # replaced fields are serialized again
+    parsed.tx_out[1].script_pk = b"\x51"
+    parsed.tx_out[1].script_len_raw = client.int_to_vint(1)
+    assert not parsed.is_unchanged()
+    txb = parsed.get_tx("bytes")
+    assert txb != parsed.txb
+    assert client.BtcTx(rawbytes=txb).tx_out[1].script_pk == b"\x51"
+    cb = parsed.parse_coinbase()
+    assert cb["coinbasetx_prefix"] + cb["coinbase_full"] + cb["coinbasetx_suffix"] == txb
+    parsed.tx_out.append(outs[0])
+    assert len(parsed.get_tx("bytes")) == len(txb) + len(outs[0].get_txout("bytes"))
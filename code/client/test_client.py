@@ -2,6 +2,7 @@ import web3
 import util
 import client
 import pytest
+import json
 
 def test_deploy():
     EMRC = client.EMRC()
@@ -586,6 +587,16 @@ def test_payout(emrc):
     assert balance_account_after - balance_account_before + tx_receipt["gasUsed"]*tx_info["gasPrice"] == ( 10**18 + 10**18 ) * 3
     print("BALANCE ",balance_contract_after)
 
+def test_state(emrc):
+    state = emrc.state()
+    assert state.blockNumber == emrc.w3.eth.blockNumber
+    assert state.currentState == emrc.instance.functions.get_currentState().call()
+    assert state.startHeight == emrc.instance.functions._startHeight().call()
+    assert state.startHash == emrc.instance.functions._startHash().call()
+    assert state.remaining_init_tblocks == emrc.instance.functions._remaining_init_tblocks().call()
+    assert emrc.check(state.currentState,state.startHeight,state.kV,state.kB,state.startHash,
+                      state.remaining_init_cblocks,state.remaining_init_tblocks)
+
 # --- useing exclusively the client ---
 
 def test_init():
@@ -607,3 +618,193 @@ def test_init2():
     emrc = EMRC.deploy("/smartcode/contracts/EMR.sol")
     assert EMRC.init(300000,0,6,hash_1_bytes)
 
+
+# --- offline, the batch requests against a JSON-RPC stand-in ---
+
+def test_batch_request():
+    import http.server
+    import threading
+    class RpcHandler(http.server.BaseHTTPRequestHandler):
+        """ answers eth_chainId, fails everything else, in reverse order """
+        def do_POST(self):
+            batch = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self.server.batches.append(batch)
+            self.server.headers.append(self.headers.get("X-Test"))
+            answers = [ {"jsonrpc": "2.0","id": c["id"],"result": hex(c["id"])} if c["method"] == "eth_chainId"
+                        else {"jsonrpc": "2.0","id": c["id"],"error": {"code": -32601,"message": "not found"}}
+                        for c in reversed(batch) ]
+            body = json.dumps(answers).encode()
+            self.send_response(200)
+            self.send_header("Content-Length",str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self,*args):
+            pass
+    server = http.server.ThreadingHTTPServer(("127.0.0.1",0),RpcHandler)
+    server.batches = []
+    server.headers = []
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    try:
+        # posted with the request_kwargs of the provider
+        w3 = web3.Web3(web3.HTTPProvider("http://127.0.0.1:{}".format(server.server_address[1]),
+                                         request_kwargs={"timeout": 5,"headers": {"Content-Type": "application/json","X-Test": "1"}}))
+        assert util.batch_request([("eth_chainId",[])]*3,w3_instance=w3) == ["0x0","0x1","0x2"]
+        assert util.batch_request([],w3_instance=w3) == []
+        assert len(server.batches) == 1
+        assert server.headers == ["1"]
+        # results are passed through the formatter of their call
+        assert util.batch_request([("eth_chainId",[],util.hex_to_int),("eth_chainId",[],util.hex_to_bytes)],w3_instance=w3) == [0,b"\x01"]
+        with pytest.raises(ValueError):
+            util.batch_request([("eth_chainId",[]),("eth_foo",[])],w3_instance=w3)
+        assert util.block_param(42) == "0x2a"
+        assert util.block_param("latest") == "latest"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# --- offline, the pipelined submission against a fake node ---
+
+class FakeNode:
+    """ stands in for w3 and the contract instance of an EMRC.
+    Transactions are keyed by their first argument, the block header, and are mined
+    unless their header is in reject (raised when sent), revert or timeout. """
+    def __init__(self,nonce=0,reject=(),revert=(),timeout=()):
+        self.eth = self
+        self.functions = self
+        self.events = self
+        self.accounts = ["0x" + "aa"*20]
+        self.nonce = nonce
+        self.reject = set(reject)
+        self.revert = set(revert)
+        self.timeout = set(timeout)
+        self.sent = []
+        self.receipts = dict()
+        self.nonce_reads = 0
+
+    def getTransactionCount(self,account,block_identifier):
+        self.nonce_reads += 1
+        return self.nonce
+
+    def waitForTransactionReceipt(self,tx_hash,timeout=None):
+        if self.receipts[tx_hash] is None:
+            raise web3.exceptions.TimeExhausted("not mined")
+        return self.receipts[tx_hash]
+
+    def __getattr__(self,name):
+        # contract functions and events
+        return lambda *args: FakeFunction(self,name,args)
+
+class FakeFunction:
+    def __init__(self,node,name,args):
+        self.node = node
+        self.name = name
+        self.args = args
+
+    def transact(self,tx):
+        node = self.node
+        header = self.args[0]
+        node.sent.append((header,tx["nonce"]))
+        if header in node.reject:
+            raise ValueError("rejected by gas estimation")
+        assert tx["nonce"] == node.nonce
+        node.nonce += 1
+        tx_hash = "0x{:064x}".format(len(node.sent))
+        if header in node.timeout:
+            node.receipts[tx_hash] = None
+        else:
+            node.receipts[tx_hash] = {"status": 0 if header in node.revert else 1,
+                                      "gasUsed": 1000 + len(node.sent),
+                                      "header": header}
+        return tx_hash
+
+    def call(self):
+        return 0 # _remaining_init_cblocks
+
+    def processReceipt(self,receipt):
+        # New_rblock of the submitted header
+        rblockHash = client.endSwap(client.dSHA256(receipt["header"],raw=True))
+        return [ type("Event",(),{"args": type("Args",(),{"_rblockHash": rblockHash})}) ]
+
+def fake_emrc(**kwargs):
+    emrc = client.EMRC()
+    emrc.w3 = emrc.instance = FakeNode(**kwargs)
+    return emrc
+
+def fake_blocks(n):
+    return [ {"blockHeader_bytes_big": bytes([i])*80,
+              "tblockHeader_bytes_big": bytes([i])*80,
+              "blockHeight": 100 + i,
+              "cb_pfx": b"",
+              "cb": b"",
+              "cb_sfx": b"",
+              "mp_hashes_bytes_big": b""} for i in range(0,n) ]
+
+def test_pipeline_nonces():
+    blocks = fake_blocks(5)
+    emrc = fake_emrc(nonce=7,reject={blocks[2]["blockHeader_bytes_big"]})
+    result = emrc.submit_cblocks(blocks,10,emrc.w3.accounts[0])
+
+    # consecutive nonces, read again after the rejected send
+    assert [ nonce for header,nonce in emrc.w3.sent ] == [7,8,9,9,10]
+    assert emrc.w3.nonce_reads == 2
+    assert emrc.nonces[emrc.w3.accounts[0]] == 11
+    assert [ tx_hash is None for tx_hash in result["tx_hashes"] ] == [False,False,True,False,False]
+    assert result["receipts"][2] is None
+    assert result["failed"] == [{"index": 2,"blockHeight": 102,"tx_hash": None,"error": "rejected by gas estimation"}]
+
+    # the next pipeline reads the nonce from the node again
+    emrc.submit_cblocks(fake_blocks(1),10,emrc.w3.accounts[0])
+    assert emrc.w3.nonce_reads == 3
+    assert emrc.w3.sent[-1][1] == 11
+
+def test_pipeline_failures():
+    blocks = fake_blocks(6)
+    emrc = fake_emrc(revert={blocks[1]["blockHeader_bytes_big"],blocks[4]["blockHeader_bytes_big"]},
+                     timeout={blocks[3]["blockHeader_bytes_big"]})
+    result = emrc.submit_tblocks(blocks,10,1)
+    assert [ (f["index"],f["blockHeight"],f["error"]) for f in result["failed"] ] == [(1,101,"reverted"),(3,103,"not mined"),(4,104,"reverted")]
+    assert [ f["tx_hash"] for f in result["failed"] ] == [ result["tx_hashes"][i] for i in (1,3,4) ]
+    assert result["receipts"][3] is None
+    assert [ r["header"] for r in result["receipts"] if r is not None ] == [ blocks[i]["blockHeader_bytes_big"] for i in (0,1,2,4,5) ]
+
+    # reverted transactions count towards the gas, only succeeded ones are counted
+    gas = sum([ r["gasUsed"] for r in result["receipts"] if r is not None ])
+    assert gas == 1001 + 1002 + 1003 + 1005 + 1006
+    assert (emrc.gas_total,emrc.gas_attack,emrc.gas_submit_tblock,emrc.gas_number_tblocks) == (gas,gas,gas,3)
+    assert emrc.gas_init == 0
+
+    emrc = fake_emrc(revert={blocks[0]["blockHeader_bytes_big"]})
+    result = emrc.submit_rblocks(blocks[:3])
+    assert [ f["index"] for f in result["failed"] ] == [0]
+    assert (emrc.gas_total,emrc.gas_attack,emrc.gas_submit_rblock,emrc.gas_number_rblocks) == (1001+1002+1003,)*3 + (2,)
+    emrc.gas_total = 0
+    emrc.submit_cblocks(blocks[1:3],10,emrc.w3.accounts[0])
+    assert (emrc.gas_total,emrc.gas_init,emrc.gas_submit_cblock,emrc.gas_number_cblocks) == (1004+1005,)*3 + (2,)
+
+def test_validity_checks():
+    with open('../testdata/btc_blocks_json_samples/603268.raw') as json_file:
+        blk_raw = bytes.fromhex(json.load(json_file)["rawblock"])
+    b = client.get_block_calldata(*client.get_calldata_input_from_view(client.BtcBlkView(blk_raw,height=603268)))
+    hdr = b["blockHeader_bytes_big"]
+    pfx = b["cb_pfx"][:6] + b"\x01" + b["cb_pfx"][7:] # not the null outpoint
+    assert client.EMRC.cblock_invalid(hdr) is None
+    assert client.EMRC.cblock_invalid(hdr[:-1]) == "invalid header length"
+    assert client.EMRC.cblock_invalid(hdr[:-1] + b"\xff") == "invalid header"
+    assert client.EMRC.tblock_invalid(b["tblockHeader_bytes_big"],b["cb_pfx"],b["mp_hashes_bytes_big"]) is None
+    assert client.EMRC.tblock_invalid(hdr,b["cb_pfx"],b["mp_hashes_bytes_big"]) == "header fields not zeroed"
+    assert client.EMRC.tblock_invalid(b["tblockHeader_bytes_big"],b["cb_pfx"],b["mp_hashes_bytes_big"][:-1]) == "invalid Merkle path length"
+    assert client.EMRC.tblock_invalid(b["tblockHeader_bytes_big"],pfx,b["mp_hashes_bytes_big"]) == "invalid coinbase prefix"
+    assert client.EMRC.rblock_invalid(hdr,b["cb"],b["cb_pfx"],b["cb_sfx"],b["mp_hashes_bytes_big"]) is None
+    assert client.EMRC.rblock_invalid(hdr,b["cb"],pfx,b["cb_sfx"],b["mp_hashes_bytes_big"]) == "invalid coinbase prefix"
+    assert client.EMRC.rblock_invalid(hdr,bytes([b["cb"][0] ^ 1]) + b["cb"][1:],b["cb_pfx"],b["cb_sfx"],b["mp_hashes_bytes_big"]) == "invalid coinbase path"
+
+    # the pipelined submission uses the same checks, nothing invalid is sent
+    emrc = fake_emrc()
+    result = emrc.submit_tblocks([b,dict(b,tblockHeader_bytes_big=hdr)],10,1,validityChecks=True)
+    assert [ (f["index"],f["error"]) for f in result["failed"] ] == [(1,"header fields not zeroed")]
+    assert len(emrc.w3.sent) == 1
+    result = emrc.submit_cblocks([dict(b,blockHeader_bytes_big=hdr[:-1]),b],10,emrc.w3.accounts[0],validityChecks=True)
+    assert [ (f["index"],f["error"]) for f in result["failed"] ] == [(0,"invalid header length")]
+    result = emrc.submit_rblocks([dict(b,cb_pfx=pfx),b],validityChecks=True)
+    assert [ (f["index"],f["error"]) for f in result["failed"] ] == [(0,"invalid coinbase prefix")]
+    assert len(emrc.w3.sent) == 3
@@ -4,13 +4,15 @@ import client
 import pytest
 import os
 
-def test_gas_fail():
+def test_gas_fail(tmp_path):
     """ Execute example attack for certain block range ... """
+    # BLOCKRANGE=<start>--<end>, inclusive, may span several dumps in the directory
     blockrange = os.environ.get('BLOCKRANGE')
     if blockrange is None:
-        blks = client.load_input_blocks("../testdata/btc_blocks_json_samples/617000--617022")
-    else:
-        blks = client.load_input_blocks("../testdata/btc_blocks_json_samples/" + str(blockrange))
+        blockrange = "617000--617022"
+    start,end = [ int(h) for h in blockrange.split("--") ]
+    repo = client.BtcBlkRepo("../testdata/btc_blocks_json_samples",index_path=str(tmp_path / "blkrepo.idx"))
+    blks = repo.range(start,end + 1)
 
     gwei = os.environ.get('GWEI')
     if gwei is None:
@@ -24,9 +26,7 @@ def test_gas_fail():
     else:
         exr = float(exr)
 
-    b = list()
-    for i in range(0,len(blks)):
-        b.append(client.get_input_block_calldata(blks,i))
+    b = client.get_input_blocks_calldata(blks)
 
     assert len(b) == len(blks)
 
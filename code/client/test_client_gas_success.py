@@ -4,13 +4,15 @@ import client
 import pytest
 import os
 
-def test_gas_success():
+def test_gas_success(tmp_path):
     """ Execute example attack for certain block range ... """
+    # BLOCKRANGE=<start>--<end>, inclusive, may span several dumps in the directory
     blockrange = os.environ.get('BLOCKRANGE')
     if blockrange is None:
-        blks = client.load_input_blocks("../testdata/btc_blocks_json_samples/617000--617022")
-    else:
-        blks = client.load_input_blocks("../testdata/btc_blocks_json_samples/" + str(blockrange))
+        blockrange = "617000--617022"
+    start,end = [ int(h) for h in blockrange.split("--") ]
+    repo = client.BtcBlkRepo("../testdata/btc_blocks_json_samples",index_path=str(tmp_path / "blkrepo.idx"))
+    blks = repo.range(start,end + 1)
 
     gwei = os.environ.get('GWEI')
     if gwei is None:
@@ -25,9 +27,11 @@ def test_gas_success():
         exr = float(exr)
 
 
-    b = list()
-    for i in range(0,len(blks)):
-        b.append(client.get_input_block_calldata(blks,i))
+    # e.g., CALLDATA_CACHE=/tmp/calldata to prepare the calldata only on the first run
+    cache_path = os.environ.get('CALLDATA_CACHE')
+    cache = client.CalldataCache(cache_path) if cache_path is not None else None
+
+    b = client.get_input_blocks_calldata(blks,cache=cache)
 
     assert len(b) == len(blks)
 
@@ -49,30 +53,39 @@ def test_gas_success():
     bribee = EMRC.w3.eth.accounts[1]
     mainchainminer = EMRC.w3.eth.accounts[2]
 
-    for i in range(1,kV+1):
-        assert EMRC.submit_cblock(b[i]["blockHeader_bytes_big"],
-                                  b[i]["blockHeight"],
-                                  BLOCK_REWARD,
-                                  mainchainminer)
-
-    for i in range(1,kV+2):
-        assert EMRC.submit_tblock(b[i]["tblockHeader_bytes_big"],
-                                  b[i]["cb_pfx"],
-                                  b[i]["blockHeight"],
-                                  b[i]["cb_sfx"],
-                                  b[i]["mp_hashes_bytes_big"],
-                                  BLOCK_REWARD,
-                                  BLOCK_BRIBE)
-    assert EMRC.instance.functions._currentState().call() == 2
-
-    for i in range(1,kV+2+kB):
-        assert EMRC.submit_rblock(b[i]["blockHeader_bytes_big"],
-                                  b[i]["cb"],
-                                  b[i]["cb_pfx"],
-                                  b[i]["cb_sfx"],
-                                  b[i]["mp_hashes_bytes_big"],
-                                  bribee)
-    assert EMRC.instance.functions._currentState().call() == 3
+    # PIPELINE=1 sends every phase back to back and collects the receipts afterwards
+    if os.environ.get('PIPELINE'):
+        assert EMRC.submit_cblocks(b[1:kV+1],BLOCK_REWARD,mainchainminer)["failed"] == []
+        assert EMRC.check(1,remaining_init_cblocks=0)
+        assert EMRC.submit_tblocks(b[1:kV+2],BLOCK_REWARD,BLOCK_BRIBE)["failed"] == []
+        assert EMRC.instance.functions._currentState().call() == 2
+        assert EMRC.submit_rblocks(b[1:kV+2+kB],bribee)["failed"] == []
+        assert EMRC.instance.functions._currentState().call() == 3
+    else:
+        for i in range(1,kV+1):
+            assert EMRC.submit_cblock(b[i]["blockHeader_bytes_big"],
+                                      b[i]["blockHeight"],
+                                      BLOCK_REWARD,
+                                      mainchainminer)
+
+        for i in range(1,kV+2):
+            assert EMRC.submit_tblock(b[i]["tblockHeader_bytes_big"],
+                                      b[i]["cb_pfx"],
+                                      b[i]["blockHeight"],
+                                      b[i]["cb_sfx"],
+                                      b[i]["mp_hashes_bytes_big"],
+                                      BLOCK_REWARD,
+                                      BLOCK_BRIBE)
+        assert EMRC.instance.functions._currentState().call() == 2
+
+        for i in range(1,kV+2+kB):
+            assert EMRC.submit_rblock(b[i]["blockHeader_bytes_big"],
+                                      b[i]["cb"],
+                                      b[i]["cb_pfx"],
+                                      b[i]["cb_sfx"],
+                                      b[i]["mp_hashes_bytes_big"],
+                                      bribee)
+        assert EMRC.instance.functions._currentState().call() == 3
 
 
     reward = EMRC.payout(bribee)
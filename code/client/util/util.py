@@ -8,6 +8,8 @@ import hashlib
 import os
 import subprocess
 import json
+import requests
+import eth_utils
 from sha3 import keccak_256
 
 w3 = None
@@ -280,6 +282,69 @@ def mine_blocks_until(predicate):
 def getBalance(address):
     return w3.fromWei(w3.eth.getBalance(address),'ether')
 
+def block_param(block_identifier):
+    """ JSON-RPC block parameter of a block number or tag e.g., "latest" """
+    if isinstance(block_identifier, int):
+        return hex(block_identifier)
+    return block_identifier
+
+def hex_to_int(result):
+    """ formatter of JSON-RPC quantities e.g., of eth_getBalance, for batch_request """
+    return eth_utils.to_int(hexstr=result)
+
+def hex_to_bytes(result):
+    """ formatter of JSON-RPC data e.g., of eth_call, for batch_request """
+    return eth_utils.to_bytes(hexstr=result)
+
+BATCH_TIMEOUT = 10 # seconds, if the provider sets no timeout, as web3
+
+def batch_request(calls, w3_instance=None):
+    """ sends the (method, params) or (method, params, formatter) calls as a single
+        JSON-RPC batch request to the HTTP node of w3 and returns their results in the
+        order of the calls, each passed through its formatter if given.
+        The request is posted to the provider's endpoint_uri with its request_kwargs
+        (e.g., timeout and headers). The w3 middlewares and result formatters do not
+        apply to batches, so results are raw unless a formatter is given.
+        Raises ValueError if any call returns an error.
+    """
+    if w3_instance is None:
+        w3_instance = w3
+    provider = w3_instance.provider
+    assert isinstance(provider, web3.HTTPProvider), "Batch requests need an HTTPProvider"
+    if len(calls) == 0:
+        return []
+    payload = [ {"jsonrpc": "2.0", "id": i, "method": call[0], "params": call[1]}
+                for i,call in enumerate(calls) ]
+    kwargs = provider.get_request_kwargs()
+    kwargs.setdefault("timeout", BATCH_TIMEOUT)
+    r = requests.post(provider.endpoint_uri, data=json.dumps(payload), **kwargs)
+    r.raise_for_status()
+    responses = r.json()
+    if not isinstance(responses, list):
+        # nodes answer a batch they reject as a whole with a single error
+        raise ValueError("Batch request failed: {}".format(responses.get("error", responses)))
+    responses = { resp["id"]: resp for resp in responses }
+    results = []
+    for i,call in enumerate(calls):
+        method = call[0]
+        if i not in responses:
+            raise ValueError("No response to {} in batch request".format(method))
+        if "error" in responses[i]:
+            raise ValueError("{} failed: {}".format(method, responses[i]["error"]))
+        result = responses[i]["result"]
+        if len(call) > 2:
+            result = call[2](result)
+        results.append(result)
+    return results
+
+def batch_call(calls, block_identifier="latest", w3_instance=None):
+    """ executes the (to, data) eth_calls as one batch request against the state of
+        the same block and returns the returned data as bytes
+    """
+    block = block_param(block_identifier)
+    return batch_request([ ("eth_call", [{"to": to, "data": data}, block], hex_to_bytes) for to,data in calls ],
+                         w3_instance=w3_instance)
+
 # -----------
 
 def flatten(list_of_lists):